@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_user_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersettings',
+            name='template_layout',
+            field=models.TextField(blank=True, null=True, verbose_name='Template layout'),
+        ),
+    ]
@@ -45,6 +45,7 @@ class UserSettings(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated')
     template_content = models.BinaryField(null=True, blank=True, verbose_name='Template content')
+    template_layout = models.TextField(null=True, blank=True, verbose_name='Template layout')
 
     class Meta:
         db_table = 'users_settings'
@@ -11,6 +11,7 @@ from rest_framework.exceptions import ValidationError
 from accounts.models import User, UserSettings
 from accounts.exceptions import UserVerificationLinkInvalid
 from accounts.tokens import expiring_token_generation, email_expiring_token_generation
+from microservices_tasks.template_layout import TemplateLayout, TemplateLayoutError
 
 
 logger = logging.getLogger('accounts.serializer')
@@ -59,29 +60,38 @@ class AccountSerializer(ModelSerializer):
             else:
                 byte_content = template_content_file.file.getvalue()
 
-            self.__check_pptx(byte_content)
+            layout = self.__check_pptx(byte_content)
 
             settings.template_content = byte_content
+            settings.template_layout = layout.to_json()
 
             if 'template_name' not in settings_data or not validated_data.get('template_name'):
                 settings_data['template_name'] = template_content_file.name
 
         else:
             settings.template_content = None
+            settings.template_layout = None
 
         settings.template_name = settings_data.get('template_name')
         settings.save()
 
         return instance
 
-    def __check_pptx(self, byte_content: bytes):
+    def __check_pptx(self, byte_content: bytes) -> TemplateLayout:
+        """ Analyse the template, the layout index is stored with it """
         try:
             ppt_content = io.BytesIO(byte_content)
-            Presentation(ppt_content)
+            presentation = Presentation(ppt_content)
         except Exception as e:
             logger.error('Invalid file type, error: %s', e, exc_info=True)
             raise ValidationError("Invalid file type.")
 
+        try:
+            return TemplateLayout.analyze(presentation)
+        except TemplateLayoutError as e:
+            logger.error('Incompatible template: %s', e)
+            raise ValidationError(str(e))
+
 
 class PasswordResetConfirmSerializer(ModelSerializer):
     """Password reset confirm serializer"""
@@ -0,0 +1,86 @@
+"""
+Compare the dict based sheet encoding with the compact table encoding
+
+Usage: python -m benchmarks.xlsx_encoding --rows 10000 --columns 50 --max-tokens 12000
+"""
+
+import io
+import json
+import time
+import random
+import argparse
+import datetime
+import tracemalloc
+
+from openpyxl import Workbook
+
+from xlsx_worker import get_workbook_sheet_data, get_workbook_sheet_text
+
+SHEET_NAME = 'Data'
+
+
+def make_workbook(rows: int, columns: int, seed: int = 0) -> bytes:
+    """ Create synthetic workbook with header, mixed values and blank regions """
+
+    rnd = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET_NAME)
+
+    sheet.append([f'Column {i}' for i in range(1, columns + 1)])
+
+    start_date = datetime.date(2024, 1, 1)
+    blank_from, blank_to = columns // 2, columns // 2 + columns // 5
+
+    for row in range(2, rows + 1):
+        if row % 25 == 0:
+            sheet.append([])
+            continue
+
+        values = []
+        for column in range(columns):
+            if blank_from <= column < blank_to and row % 2:
+                values.append(None)
+            elif column % 5 == 0:
+                values.append(f'Item {rnd.randint(1, 500)}')
+            elif column % 5 == 1:
+                values.append(start_date + datetime.timedelta(days=rnd.randint(0, 365)))
+            elif column % 5 == 2:
+                values.append(rnd.randint(0, 100000))
+            else:
+                values.append(round(rnd.uniform(0, 1000), 2))
+        sheet.append(values)
+
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def measure(name: str, func) -> None:
+    tracemalloc.start()
+    started = time.process_time()
+    result = func()
+    elapsed = time.process_time() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{name:<16} cpu {elapsed:8.2f} s   peak memory {peak / 2 ** 20:8.1f} MiB   '
+          f'output {len(result.encode()) / 2 ** 10:10.1f} KiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--columns', type=int, default=50)
+    parser.add_argument('--max-tokens', type=int, default=12000)
+    args = parser.parse_args()
+
+    content = make_workbook(args.rows, args.columns)
+    print(f'Workbook {args.rows}x{args.columns}, {len(content) / 2 ** 20:.1f} MiB')
+
+    measure('dict', lambda: json.dumps(get_workbook_sheet_data(content, SHEET_NAME), default=str))
+    measure('table', lambda: get_workbook_sheet_text(content, SHEET_NAME))
+    measure('table+budget', lambda: get_workbook_sheet_text(content, SHEET_NAME, max_tokens=args.max_tokens))
+
+
+if __name__ == '__main__':
+    main()
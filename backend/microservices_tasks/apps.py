@@ -11,7 +11,6 @@ class MicroservicesTasksConfig(AppConfig):
         """Here we run our tasks for getting screenshots and creating PPT files on background"""
 
         if 'gunicorn.py' in sys.argv:
-            from microservices_tasks.utils import ppt_worker, screenshot_worker
+            from microservices_tasks.utils import start_result_consumers
 
-            screenshot_worker()
-            ppt_worker()
+            start_result_consumers()
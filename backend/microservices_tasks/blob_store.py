@@ -0,0 +1,239 @@
+"""
+Content-addressed blob store
+
+Blobs are addressed by the sha256 digest of their content, so the same template,
+workbook or screenshot is stored once however many tasks refer to it. Task tables
+keep only digests, services read and write blobs directly.
+
+Rows created before the blob store keep the content inline, `read` falls back to it.
+
+Every service must reach the same store. The screenshots maker usually runs on another host
+than backend and composer, so a filesystem store needs the location shared over the network
+(e.g. an SMB share), otherwise the redis backend keeps the blobs in a Redis reachable by all.
+Services check at startup that they read the probe blobs stored by the others (check_shared).
+
+Blobs are never deleted by the services, the backend sweeps the blobs which no row refers to
+(sweep_blobs command). A blob stored again is touched, so it is not swept before its row is saved.
+
+The same module is used by backend, composer and screenshotsmaker, keep the copies in sync.
+"""
+
+import io
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+CHUNK_SIZE = 1024 * 1024
+
+# hash service -> digest of its probe blob, swept never
+PROBES_KEY = 'srv:blob-store:probes'
+
+
+class BlobNotFoundError(Exception):
+    pass
+
+
+class BlobStoreNotShared(Exception):
+
+    def __init__(self, service: str, digest: str):
+        super().__init__(f"Blob {digest} stored by {service} is not readable, "
+                         f"BLOB_STORE_BACKEND and BLOB_STORE_LOCATION must point to the store of all services")
+
+
+class BlobStore(ABC):
+
+    @abstractmethod
+    def put_stream(self, stream: BinaryIO) -> str:
+        """ Store content of the stream, return its digest """
+
+    @abstractmethod
+    def open(self, digest: str) -> BinaryIO:
+        """ Open blob for reading """
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete(self, digest: str) -> bool:
+        """ Remove blob, return False if there was none """
+
+    @abstractmethod
+    def iter_blobs(self) -> Iterator[tuple[str, float]]:
+        """ Digests of all blobs with the time they were last stored """
+
+    def sweep(self, referenced: set[str], *, older_than: float, dry_run: bool = False) -> list[str]:
+        """ Delete blobs not referenced and stored before the older_than timestamp, return their digests """
+        swept = []
+        for digest, stored_at in self.iter_blobs():
+            if digest in referenced or stored_at >= older_than:
+                continue
+            if dry_run or self.delete(digest):
+                swept.append(digest)
+        return swept
+
+    def put(self, content: bytes) -> str:
+        return self.put_stream(io.BytesIO(content))
+
+    def put_file(self, path: str | Path) -> str:
+        with open(path, 'rb') as stream:
+            return self.put_stream(stream)
+
+    def get(self, digest: str) -> bytes:
+        with self.open(digest) as stream:
+            return stream.read()
+
+    def copy_to(self, digest: str, path: str | Path) -> None:
+        """ Stream blob to the file """
+        with self.open(digest) as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    def read(self, digest: str | None, legacy_content: bytes | None = None) -> bytes | None:
+        """ Get blob content, or the inline content of a row created before the blob store """
+        if digest:
+            return self.get(digest)
+        return bytes(legacy_content) if legacy_content is not None else None
+
+
+class FileSystemBlobStore(BlobStore):
+    """ Blobs are files <root>/<aa>/<bb>/<digest>, the root can be a shared volume """
+
+    def __init__(self, root: str | Path):
+        self._root = Path(root)
+        self._tmp = self._root / 'tmp'
+        self._tmp.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f"Invalid blob digest '{digest}'")
+        return self._root / digest[:2] / digest[2:4] / digest
+
+    def put_stream(self, stream: BinaryIO) -> str:
+        digest = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=self._tmp)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while chunk := stream.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            digest = digest.hexdigest()
+            path = self.path(digest)
+            if path.exists():
+                # the blob is referred to again, it must outlive the grace period of the sweep
+                os.utime(path)
+                return digest
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # atomic, concurrent writers of the same blob write the same content
+            os.replace(tmp_name, path)
+            return digest
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    def open(self, digest: str) -> BinaryIO:
+        try:
+            return open(self.path(digest), 'rb')
+        except FileNotFoundError:
+            raise BlobNotFoundError(digest)
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def delete(self, digest: str) -> bool:
+        try:
+            os.remove(self.path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_blobs(self) -> Iterator[tuple[str, float]]:
+        for path in self._root.glob('[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*'):
+            if len(path.name) != 64:
+                continue
+            try:
+                yield path.name, path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+
+    def sweep(self, referenced: set[str], *, older_than: float, dry_run: bool = False) -> list[str]:
+        swept = super().sweep(referenced, older_than=older_than, dry_run=dry_run)
+        if not dry_run:
+            # temporary files of writers which died
+            for path in self._tmp.iterdir():
+                try:
+                    if path.stat().st_mtime < min(older_than, time.time() - 3600):
+                        path.unlink()
+                except FileNotFoundError:
+                    continue
+        return swept
+
+
+class RedisBlobStore(BlobStore):
+    """ Blobs are values blob:<digest>, the time they were stored is kept in a sorted set for the sweep """
+
+    KEY_PREFIX = 'blob:'
+    STORED_KEY = 'blobs:stored'
+
+    def __init__(self, redis_conn):
+        """ :param redis_conn: connection returning bytes """
+        self._redis = redis_conn
+
+    def put_stream(self, stream: BinaryIO) -> str:
+        content = stream.read()
+        digest = hashlib.sha256(content).hexdigest()
+        pipe = self._redis.pipeline()
+        pipe.set(self.KEY_PREFIX + digest, content, nx=True)
+        pipe.zadd(self.STORED_KEY, {digest: time.time()})
+        pipe.execute()
+        return digest
+
+    def open(self, digest: str) -> BinaryIO:
+        content = self._redis.get(self.KEY_PREFIX + digest)
+        if content is None:
+            raise BlobNotFoundError(digest)
+        return io.BytesIO(content)
+
+    def exists(self, digest: str) -> bool:
+        return bool(self._redis.exists(self.KEY_PREFIX + digest))
+
+    def delete(self, digest: str) -> bool:
+        pipe = self._redis.pipeline()
+        pipe.delete(self.KEY_PREFIX + digest)
+        pipe.zrem(self.STORED_KEY, digest)
+        deleted, _ = pipe.execute()
+        return bool(deleted)
+
+    def iter_blobs(self) -> Iterator[tuple[str, float]]:
+        for digest, stored_at in self._redis.zscan_iter(self.STORED_KEY, count=1000):
+            yield _decode(digest), stored_at
+
+
+def create_blob_store(backend: str, location: str) -> BlobStore:
+    """ :param location: root directory of the filesystem backend, URL of the Redis of the redis backend """
+    if backend == 'filesystem':
+        return FileSystemBlobStore(location)
+    if backend == 'redis':
+        import redis
+        return RedisBlobStore(redis.Redis.from_url(location))
+    raise ValueError(f"Unknown blob store backend '{backend}'")
+
+
+def check_shared(store: BlobStore, redis_conn, service: str) -> None:
+    """
+    Store the probe blob of the service and read the probes of the other services, call it at startup
+    :raise BlobStoreNotShared: if a probe is not readable, the services don't use the same store
+    """
+    redis_conn.hset(PROBES_KEY, service, store.put(f'Blob store probe of {service}'.encode()))
+    for other, digest in redis_conn.hgetall(PROBES_KEY).items():
+        if not store.exists(_decode(digest)):
+            raise BlobStoreNotShared(_decode(other), _decode(digest))
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
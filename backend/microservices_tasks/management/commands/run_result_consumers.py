@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from microservices_tasks.utils import start_result_consumers
+
+
+class Command(BaseCommand):
+    help = 'Collect results of screenshot and PPT tasks from microservices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumers', type=int, default=None,
+                            help='Number of consumers per queue, MICROSERVICES_RESULT_CONSUMERS by default')
+
+    def handle(self, *args, **options):
+        threads = start_result_consumers(options['consumers'])
+
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+from django_redis import get_redis_connection
+
+from microservices_tasks.blob_store import PROBES_KEY
+from microservices_tasks.utils import get_blob_store
+
+# Screenshots of composed slides cached by the composer, json values with *_digest fields
+SLIDE_SCREENSHOTS_PATTERN = 'srv:screenshot:slide:*'
+
+
+class Command(BaseCommand):
+    help = 'Delete blobs which no *_digest column, cached slide screenshot or service probe refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=None,
+                            help='Keep blobs stored within this many hours, BLOB_STORE_SWEEP_GRACE_HOURS by default')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the blobs which would be deleted')
+
+    def handle(self, *args, **options):
+        grace_hours = options['grace_hours']
+        if grace_hours is None:
+            grace_hours = settings.BLOB_STORE_SWEEP_GRACE_HOURS
+        # blobs stored before the references are collected, rows saved meanwhile refer to newer ones
+        older_than = time.time() - grace_hours * 3600
+
+        referenced = _get_column_references() | _get_cache_references()
+        swept = get_blob_store().sweep(referenced, older_than=older_than, dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            for digest in swept:
+                self.stdout.write(digest)
+        self.stdout.write(f'{len(swept)} blobs {"to delete" if options["dry_run"] else "deleted"}, '
+                          f'{len(referenced)} referenced')
+
+
+def _get_column_references() -> set[str]:
+    referenced = set()
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.CharField) and field.name.endswith('_digest'):
+                referenced.update(model.objects.exclude(**{f'{field.name}__isnull': True}).exclude(
+                    **{field.name: ''}).values_list(field.name, flat=True).distinct().iterator())
+    return referenced
+
+
+def _get_cache_references() -> set[str]:
+    redis_conn = get_redis_connection('microservices')
+    referenced = set()
+    keys = list(redis_conn.scan_iter(match=SLIDE_SCREENSHOTS_PATTERN, count=1000))
+    for start in range(0, len(keys), 1000):
+        for value in redis_conn.mget(keys[start:start + 1000]):
+            if not value:
+                continue
+            referenced.update(digest for name, digest in json.loads(value).items()
+                              if name.endswith('_digest') and digest)
+    # probe blobs of the services
+    referenced.update(digest.decode() for digest in redis_conn.hvals(PROBES_KEY))
+    return referenced
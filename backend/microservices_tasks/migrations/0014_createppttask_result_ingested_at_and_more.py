@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microservices_tasks', '0013_duplicatepptslidestask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='createppttask',
+            name='result_ingested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='createscreenshottask',
+            name='result_ingested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microservices_tasks', '0014_createppttask_result_ingested_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='createscreenshottask',
+            name='content_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createscreenshottaskscreenshot',
+            name='content_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttask',
+            name='ppt_template_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttask',
+            name='created_ppt_content_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttask',
+            name='screenshot_first_slide_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttaskslide',
+            name='spreadsheet_screenshot_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttaskslide',
+            name='screenshot_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='duplicatepptslidestask',
+            name='ppt_in_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='duplicatepptslidestask',
+            name='ppt_out_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='createscreenshottaskscreenshot',
+            name='content',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='duplicatepptslidestask',
+            name='ppt_in',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microservices_tasks', '0015_createscreenshottask_content_digest_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScreenshotResult',
+            fields=[
+                ('id', models.BigAutoField(db_index=True, primary_key=True, serialize=False)),
+                ('content_digest', models.CharField(max_length=64)),
+                ('renderer_version', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('screenshot_task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='microservices_tasks.createscreenshottask')),
+            ],
+            options={
+                'db_table': 'screenshot_results',
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('content_digest', 'renderer_version'), name='screenshot_results_digest_version_uniq')],
+            },
+        ),
+    ]
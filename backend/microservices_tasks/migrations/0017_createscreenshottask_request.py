@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microservices_tasks', '0016_screenshotresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='createscreenshottask',
+            name='request',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microservices_tasks', '0017_createscreenshottask_request'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='createscreenshottaskscreenshot',
+            name='preview_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createscreenshottaskscreenshot',
+            name='thumbnail_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttask',
+            name='screenshot_first_slide_preview_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttask',
+            name='screenshot_first_slide_thumbnail_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttaskslide',
+            name='screenshot_preview_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='createppttaskslide',
+            name='screenshot_thumbnail_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
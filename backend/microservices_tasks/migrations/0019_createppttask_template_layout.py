@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microservices_tasks', '0018_screenshot_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='createppttask',
+            name='template_layout',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -18,6 +18,10 @@ class CreateScreenshotTask(models.Model):
     status = models.CharField(choices=STATUSES, default='PENDING')
     status_message = models.TextField(null=True, blank=True)
     content = models.BinaryField(null=True, blank=True)
+    content_digest = models.CharField(max_length=64, null=True, blank=True)
+    # what to render, see screenshot_request, null renders everything
+    request = models.TextField(null=True, blank=True)
+    result_ingested_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -35,13 +39,35 @@ class CreateScreenshotTaskScreenshot(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     screenshot_task = models.ForeignKey(CreateScreenshotTask, on_delete=models.CASCADE,
                                         related_name='screenshots')
-    content = models.BinaryField()
+    content = models.BinaryField(null=True, blank=True)
+    content_digest = models.CharField(max_length=64, null=True, blank=True)
+    preview_digest = models.CharField(max_length=64, null=True, blank=True)
+    thumbnail_digest = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         db_table = 'create_screenshot_tasks_screenshots'
         ordering = ['id']
 
 
+class ScreenshotResult(models.Model):
+    """Index of rendered screenshots by normalised document digest and renderer version"""
+
+    id = models.BigAutoField(primary_key=True, db_index=True)
+    content_digest = models.CharField(max_length=64)
+    renderer_version = models.CharField(max_length=64)
+    screenshot_task = models.ForeignKey(CreateScreenshotTask, on_delete=models.CASCADE,
+                                        related_name='results')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'screenshot_results'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['content_digest', 'renderer_version'],
+                                    name='screenshot_results_digest_version_uniq'),
+        ]
+
+
 class CreatePPTTask(models.Model):
     """Model for creating tasks for creating PPT files"""
 
@@ -55,11 +81,18 @@ class CreatePPTTask(models.Model):
     generated_text = models.TextField(null=True, blank=True)
     status = models.CharField(max_length=255, default='PENDING')
     status_message = models.TextField(null=True, blank=True)
+    result_ingested_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     ppt_template = models.BinaryField(null=True, blank=True)
     created_ppt_content = models.BinaryField(null=True, blank=True)
     screenshot_first_slide = models.BinaryField(null=True, blank=True)
+    ppt_template_digest = models.CharField(max_length=64, null=True, blank=True)
+    created_ppt_content_digest = models.CharField(max_length=64, null=True, blank=True)
+    screenshot_first_slide_digest = models.CharField(max_length=64, null=True, blank=True)
+    screenshot_first_slide_preview_digest = models.CharField(max_length=64, null=True, blank=True)
+    screenshot_first_slide_thumbnail_digest = models.CharField(max_length=64, null=True, blank=True)
+    template_layout = models.TextField(null=True, blank=True)
 
     class Meta:
         db_table = 'create_ppt_tasks'
@@ -80,6 +113,10 @@ class CreatePPTTaskSlide(models.Model):
                                  related_name='ppt_task_slides')
     spreadsheet_screenshot = models.BinaryField(null=True, blank=True)
     screenshot = models.BinaryField(null=True, blank=True)
+    spreadsheet_screenshot_digest = models.CharField(max_length=64, null=True, blank=True)
+    screenshot_digest = models.CharField(max_length=64, null=True, blank=True)
+    screenshot_preview_digest = models.CharField(max_length=64, null=True, blank=True)
+    screenshot_thumbnail_digest = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         db_table = 'create_ppt_tasks_slides'
@@ -92,8 +129,10 @@ class DuplicatePPTSlidesTask(models.Model):
     id = models.BigAutoField(primary_key=True, db_index=True)
     client_uid = models.TextField()
     extra_data = models.TextField(null=True, blank=True)
-    ppt_in = models.BinaryField()
+    ppt_in = models.BinaryField(null=True, blank=True)
     ppt_out = models.BinaryField(null=True, blank=True)
+    ppt_in_digest = models.CharField(max_length=64, null=True, blank=True)
+    ppt_out_digest = models.CharField(max_length=64, null=True, blank=True)
     target_count = models.IntegerField()
     status = models.CharField(max_length=255, default='PENDING')
     status_message = models.TextField(null=True, blank=True)
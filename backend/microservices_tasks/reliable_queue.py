@@ -0,0 +1,241 @@
+"""
+Reliable queue on top of a plain Redis list
+
+Producers keep pushing task ids to the list. Consumers move every message to the
+processing list, wrap it into an envelope with a unique id and lease it for the visibility
+timeout. The lease is extended by heartbeats while the message is handled, and the message
+is removed by ack. Messages with expired lease (crashed or killed consumer, failed handler)
+are delivered again in their envelope, after max attempts they are moved to the dead-letter
+list. The same payload pushed twice is two messages, with own leases and attempts.
+
+Keys:
+    <name>              pending messages, payloads and envelopes "envelope:<id>:<payload>" delivered again
+    <name>:processing   envelopes of messages being handled
+    <name>:leases       zset, envelope -> lease deadline
+    <name>:attempts     hash, envelope id -> delivery count
+    <name>:sequence     envelope ids counter
+    <name>:dead         dead-letter list of payloads
+
+The same module is used by backend, composer and screenshotsmaker, keep the copies in sync.
+"""
+
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from redis import Redis
+
+logger = logging.getLogger(__name__)
+
+ENVELOPE_PREFIX = "envelope:"
+
+# Envelope of the value moved to processing, a new one for a pushed payload.
+# KEYS: processing, leases, attempts, sequence; ARGV: value, deadline.
+# Returns {id, payload, attempts}, nothing if the value was leased by the orphans sweep meanwhile.
+_LEASE_SCRIPT = """
+local id, payload = string.match(ARGV[1], '^envelope:(%d+):(.*)$')
+local envelope = ARGV[1]
+if not id then
+    if redis.call('LREM', KEYS[1], -1, ARGV[1]) == 0 then
+        return nil
+    end
+    id = tostring(redis.call('INCR', KEYS[4]))
+    payload = ARGV[1]
+    envelope = 'envelope:' .. id .. ':' .. payload
+    redis.call('RPUSH', KEYS[1], envelope)
+elseif redis.call('ZSCORE', KEYS[2], envelope) then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[2], envelope)
+local attempts = redis.call('HINCRBY', KEYS[3], id, 1)
+return {id, payload, attempts}
+"""
+
+# KEYS: pending, processing, leases, attempts, dead; ARGV: now, max attempts, limit.
+# Returns dead-lettered payloads.
+_REQUEUE_EXPIRED_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+local dead = {}
+for _, envelope in ipairs(expired) do
+    local id, payload = string.match(envelope, '^envelope:(%d+):(.*)$')
+    redis.call('ZREM', KEYS[3], envelope)
+    redis.call('LREM', KEYS[2], 1, envelope)
+    local attempts = tonumber(redis.call('HGET', KEYS[4], id) or '0')
+    if attempts >= tonumber(ARGV[2]) then
+        redis.call('HDEL', KEYS[4], id)
+        redis.call('RPUSH', KEYS[5], payload)
+        table.insert(dead, payload)
+    else
+        redis.call('RPUSH', KEYS[1], envelope)
+    end
+end
+return dead
+"""
+
+# KEYS: processing, leases, sequence; ARGV: deadline.
+# Leases messages which were moved to processing by a consumer crashed before leasing them,
+# payloads are wrapped into envelopes. Their attempts are not counted, they weren't handled.
+_LEASE_ORPHANS_SCRIPT = """
+for _, value in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+    if string.match(value, '^envelope:%d+:') then
+        redis.call('ZADD', KEYS[2], 'NX', ARGV[1], value)
+    else
+        local envelope = 'envelope:' .. redis.call('INCR', KEYS[3]) .. ':' .. value
+        redis.call('LREM', KEYS[1], 1, value)
+        redis.call('RPUSH', KEYS[1], envelope)
+        redis.call('ZADD', KEYS[2], ARGV[1], envelope)
+    end
+end
+"""
+
+
+@dataclass
+class Message:
+    payload: str
+    attempts: int
+    id: str
+
+    @property
+    def envelope(self) -> str:
+        return f"{ENVELOPE_PREFIX}{self.id}:{self.payload}"
+
+
+class ReliableQueue:
+
+    def __init__(self, redis_conn: Redis, name: str, *,
+                 visibility_timeout: int = 60,
+                 retry_delay: int = 10,
+                 max_attempts: int = 5,
+                 on_dead_letter: Callable[[str], None] | None = None):
+        self._redis = redis_conn
+        self.name = name
+        self.processing_key = f"{name}:processing"
+        self.leases_key = f"{name}:leases"
+        self.attempts_key = f"{name}:attempts"
+        self.sequence_key = f"{name}:sequence"
+        self.dead_key = f"{name}:dead"
+        self._visibility_timeout = visibility_timeout
+        self._retry_delay = retry_delay
+        self._max_attempts = max_attempts
+        self._on_dead_letter = on_dead_letter
+        self._lease = redis_conn.register_script(_LEASE_SCRIPT)
+        self._requeue_expired = redis_conn.register_script(_REQUEUE_EXPIRED_SCRIPT)
+        self._lease_orphans = redis_conn.register_script(_LEASE_ORPHANS_SCRIPT)
+        self._next_sweep = 0.0
+
+    def push(self, payload: str | int):
+        self._redis.rpush(self.name, str(payload))
+
+    def receive(self, timeout: int = 5) -> Message | None:
+        """ Wait for the next message and lease it """
+
+        self._sweep_if_due()
+
+        value = self._redis.blmove(self.name, self.processing_key, timeout, "LEFT", "RIGHT")
+        if value is None:
+            return None
+
+        leased = self._lease(keys=[self.processing_key, self.leases_key, self.attempts_key, self.sequence_key],
+                             args=[_decode(value), time.time() + self._visibility_timeout])
+        if not leased:
+            # leased as orphan by the sweep, it is delivered again once the lease expires
+            return None
+        message_id, payload, attempts = leased
+        return Message(payload=_decode(payload), attempts=int(attempts), id=_decode(message_id))
+
+    def ack(self, message: Message):
+        """ Message is handled, forget it """
+
+        pipe = self._redis.pipeline()
+        pipe.lrem(self.processing_key, 1, message.envelope)
+        pipe.zrem(self.leases_key, message.envelope)
+        pipe.hdel(self.attempts_key, message.id)
+        pipe.execute()
+
+    def nack(self, message: Message):
+        """ Message handling failed, deliver it again after the retry delay """
+
+        self._redis.zadd(self.leases_key, {message.envelope: time.time() + self._retry_delay}, xx=True)
+
+    def extend(self, message: Message):
+        """ Heartbeat, message is still being handled """
+
+        self._redis.zadd(self.leases_key, {message.envelope: time.time() + self._visibility_timeout}, xx=True)
+
+    def requeue_expired(self) -> list[str]:
+        """ Deliver again messages with expired lease, move exhausted ones to the dead-letter list """
+
+        self._lease_orphans(keys=[self.processing_key, self.leases_key, self.sequence_key],
+                            args=[time.time() + self._visibility_timeout])
+        dead = self._requeue_expired(
+            keys=[self.name, self.processing_key, self.leases_key, self.attempts_key, self.dead_key],
+            args=[time.time(), self._max_attempts, 100])
+        dead = [_decode(payload) for payload in dead]
+
+        for payload in dead:
+            logger.error(f"Message '{payload}' of {self.name} is moved to dead-letter queue "
+                         f"after {self._max_attempts} attempts")
+            if self._on_dead_letter:
+                try:
+                    self._on_dead_letter(payload)
+                except Exception as e:
+                    logger.exception(f"Dead-letter handler of {self.name} failed for '{payload}': {e}")
+        return dead
+
+    def process(self, handler: Callable[[Message], None], timeout: int = 5) -> bool:
+        """ Receive and handle one message, keeping its lease alive
+
+            :return: True if a message was received, False on timeout
+        """
+
+        message = self.receive(timeout)
+        if message is None:
+            return False
+
+        heartbeat = _Heartbeat(self, message, interval=max(self._visibility_timeout / 3, 1))
+        heartbeat.start()
+        try:
+            handler(message)
+        except Exception as e:
+            logger.exception(f"Failed to handle '{message.payload}' of {self.name}, "
+                             f"attempt {message.attempts} of {self._max_attempts}: {e}")
+            heartbeat.stop()
+            self.nack(message)
+        else:
+            heartbeat.stop()
+            self.ack(message)
+        return True
+
+    def _sweep_if_due(self):
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + min(self._retry_delay, self._visibility_timeout) / 2
+        self.requeue_expired()
+
+
+class _Heartbeat(threading.Thread):
+
+    def __init__(self, queue: ReliableQueue, message: Message, interval: float):
+        super().__init__(daemon=True)
+        self._queue = queue
+        self._message = message
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._queue.extend(self._message)
+            except Exception as e:
+                logger.warning(f"Failed to extend lease of '{self._message.payload}': {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
@@ -0,0 +1,146 @@
+"""
+Screenshot request protocol
+
+A screenshot task may describe what to render in its request column (json):
+
+    {
+        "version": 2,
+        "targets": ["Summary", 3],  sheet or slide names and 0-based indexes, null renders all of them
+        "range": "A1:Z200",         cell range of worksheets, "used" for the used range, null for the default
+        "width": 1280,              target pixel size, null keeps the rendered size, the aspect
+        "height": null,             ratio is always kept, with both set the image fits into the box
+        "format": "png"             png, jpeg or webp
+    }
+
+Tasks without a request (version 1) render every sheet or slide with the renderer defaults.
+Screenshots keep the position of their sheet or slide in the document, so partial results
+are mapped back the same way as full ones. The request is a part of the key of rendered
+and in-flight results, see request_digest.
+
+The same module is used by backend, composer and screenshotsmaker, keep the copies in sync.
+"""
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+
+VERSION = 2
+
+FORMATS = ("png", "jpeg", "webp")
+USED_RANGE = "used"
+
+_RANGE_RE = re.compile(r"^\$?[A-Z]{1,3}\$?[0-9]+(:\$?[A-Z]{1,3}\$?[0-9]+)?$")
+
+
+class ScreenshotRequestError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ScreenshotRequest:
+    version: int = 1
+    targets: tuple[str | int, ...] | None = None
+    cell_range: str | None = None
+    width: int | None = None
+    height: int | None = None
+    format: str = "png"
+
+    @property
+    def is_default(self) -> bool:
+        """ Everything is rendered as a legacy request would do """
+        return (self.targets is None and self.cell_range is None and self.width is None and self.height is None
+                and self.format == "png")
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "version": VERSION,
+            "targets": list(self.targets) if self.targets is not None else None,
+            "range": self.cell_range,
+            "width": self.width,
+            "height": self.height,
+            "format": self.format,
+        }, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, value: str | None) -> "ScreenshotRequest":
+        """ Parse request of a task, legacy tasks have none; raise ScreenshotRequestError if it is invalid """
+        if not value:
+            return cls()
+        try:
+            data = json.loads(value)
+        except ValueError as e:
+            raise ScreenshotRequestError(f"Malformed screenshot request: {e}")
+        if not isinstance(data, dict):
+            raise ScreenshotRequestError("Screenshot request must be an object")
+
+        version = data.get("version", 1)
+        if version not in (1, VERSION):
+            raise ScreenshotRequestError(f"Unsupported screenshot request version: {version}")
+        if version == 1:
+            return cls()
+
+        targets = data.get("targets")
+        if targets is not None:
+            if not isinstance(targets, list) or not all(
+                    isinstance(t, str) or isinstance(t, int) and not isinstance(t, bool) and t >= 0 for t in targets):
+                raise ScreenshotRequestError("Targets must be a list of names and indexes")
+            targets = tuple(targets)
+
+        cell_range = data.get("range")
+        if cell_range is not None:
+            if not isinstance(cell_range, str) or cell_range != USED_RANGE and not _RANGE_RE.match(cell_range.upper()):
+                raise ScreenshotRequestError(f"Invalid cell range: {cell_range}")
+            if cell_range != USED_RANGE:
+                cell_range = cell_range.upper()
+
+        for name in ("width", "height"):
+            size = data.get(name)
+            if size is not None and (not isinstance(size, int) or isinstance(size, bool) or size <= 0):
+                raise ScreenshotRequestError(f"Invalid {name}: {size}")
+
+        image_format = (data.get("format") or "png").lower()
+        if image_format not in FORMATS:
+            raise ScreenshotRequestError(f"Unsupported format: {image_format}")
+
+        return cls(version=version, targets=targets, cell_range=cell_range, width=data.get("width"),
+                   height=data.get("height"), format=image_format)
+
+    def positions(self, names: list[str]) -> list[int]:
+        """
+        Resolve targets against names of the sheets or slides of the document
+        :return: sorted positions to render, raise ScreenshotRequestError for unknown targets
+        """
+        if self.targets is None:
+            return list(range(len(names)))
+
+        positions = set()
+        for target in self.targets:
+            if isinstance(target, int):
+                if target >= len(names):
+                    raise ScreenshotRequestError(f"No sheet or slide at index {target}")
+                positions.add(target)
+            elif target in names:
+                positions.add(names.index(target))
+            else:
+                raise ScreenshotRequestError(f"No sheet or slide named '{target}'")
+        return sorted(positions)
+
+    def target_size(self, width: float, height: float) -> tuple[int, int]:
+        """ :return: size of an image rendered at width x height scaled as requested """
+        if self.width is None and self.height is None:
+            return round(width), round(height)
+        scales = []
+        if self.width is not None:
+            scales.append(self.width / width)
+        if self.height is not None:
+            scales.append(self.height / height)
+        scale = min(scales)
+        return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def request_digest(content_digest: str, request: ScreenshotRequest) -> str:
+    """ Key of the results of the request for the document, legacy requests keep the document digest """
+    if request.is_default:
+        return content_digest
+    return hashlib.sha256(f"{content_digest}:{request.to_json()}".encode()).hexdigest()
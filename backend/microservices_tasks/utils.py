@@ -2,237 +2,391 @@ import io
 import json
 import os.path
 import time
-import hashlib
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+from typing import Callable
 
-import redis
-import redis_lock
 from django.conf import settings
-from django.db import transaction
+from django.db import transaction, close_old_connections
+from django.utils import timezone
 from django.core.files.base import ContentFile
 from django_redis import get_redis_connection
-from django.core.files.storage import default_storage
 
-from microservices_tasks.models import CreateScreenshotTask, CreatePPTTask
+from microservices_tasks.blob_store import BlobStore, check_shared, create_blob_store
+from microservices_tasks.models import CreateScreenshotTask, CreateScreenshotTaskScreenshot, CreatePPTTask, \
+    ScreenshotResult
+from microservices_tasks.reliable_queue import ReliableQueue, Message
+from microservices_tasks.screenshot_request import ScreenshotRequest, VERSION, request_digest
+from microservices_tasks.screenshot_results import InFlightScreenshots, normalized_digest
 from ppt_projects.models import InputWorkbook, InputSpreadsheet, Project, SlideInstructions
+from xlsx_worker import get_workbook_sheet_fingerprints
 
 
 logger = logging.getLogger(__name__)
 
+_blob_store: BlobStore | None = None
 
-def create_screenshot_task(workbook_instance: InputWorkbook) -> None:
-    """Function for creating screenshot task"""
+
+def get_blob_store() -> BlobStore:
+    """Get blob store shared with microservices"""
+
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = create_blob_store(settings.BLOB_STORE_BACKEND, settings.BLOB_STORE_LOCATION)
+    return _blob_store
+
+
+def get_screenshot_request(workbook_instance: InputWorkbook,
+                           sheet_names: list[str] | None = None) -> ScreenshotRequest | None:
+    """
+    Request sheets displayed on slides, every sheet while no slide uses the workbook yet
+    sheet_names: render only these sheets, e.g. the changed ones, None for all of them
+    return: None if no sheet is displayed
+    """
+
+    slides = SlideInstructions.objects.filter(input_spreadsheet__input_workbook=workbook_instance)
+    if not slides.exists():
+        if sheet_names is None:
+            return ScreenshotRequest(version=VERSION)
+        names = set(sheet_names)
+    else:
+        names = set(slides.filter(display_on_slide=True).values_list('input_spreadsheet__name', flat=True))
+        if sheet_names is not None:
+            names &= set(sheet_names)
+
+    if not names:
+        return None
+    return ScreenshotRequest(version=VERSION, targets=tuple(sorted(names)))
+
+
+def create_screenshot_task(workbook_instance: InputWorkbook, sheet_names: list[str] | None = None) -> None:
+    """Function for creating screenshot task, rendered or in-flight results of the same request are reused"""
+
+    request = get_screenshot_request(workbook_instance, sheet_names)
+    if request is None:
+        logger.info('Workbook %s has no sheets to render', workbook_instance.id)
+        return
 
     red = get_redis_connection('microservices')
+    in_flight = InFlightScreenshots(red)
+
+    content = bytes(workbook_instance.content)
+    content_digest = request_digest(normalized_digest(content), request)
+    renderer_version = in_flight.get_renderer_version()
+    # fingerprints of the rendered sheets by position, screenshots of sheets changed since are not saved
+    fingerprints = list(get_workbook_sheet_fingerprints(content).values()) or None
+    extra_data = json.dumps({"input_workbook_id": workbook_instance.id, "fingerprints": fingerprints})
+    request_data = None if request.is_default else request.to_json()
+
+    result = None
+    if renderer_version:
+        result = ScreenshotResult.objects.filter(
+            content_digest=content_digest, renderer_version=renderer_version).first()
+
+    if result:
+        with transaction.atomic():
+            task = CreateScreenshotTask.objects.create(
+                name=workbook_instance.name,
+                extra_data=extra_data,
+                content_hash=content_digest,
+                request=request_data,
+                status='COMPLETED',
+                status_message=f'OK. Copied from {result.screenshot_task_id}',
+            )
+            CreateScreenshotTaskScreenshot.objects.bulk_create([
+                CreateScreenshotTaskScreenshot(
+                    screenshot_task=task,
+                    position=screenshot.position,
+                    content=screenshot.content,
+                    content_digest=screenshot.content_digest,
+                    preview_digest=screenshot.preview_digest,
+                    thumbnail_digest=screenshot.thumbnail_digest,
+                )
+                for screenshot in CreateScreenshotTaskScreenshot.objects.filter(
+                    screenshot_task_id=result.screenshot_task_id)
+            ])
+
+        logger.info('Screenshots of workbook %s are copied from task %s', workbook_instance.id,
+                    result.screenshot_task_id)
+        red.rpush(settings.MICROSERVICES_SCREENSHOT_TASK_RESULT_QUEUE, task.id)
+        return
 
     task = CreateScreenshotTask.objects.create(
         name=workbook_instance.name,
-        extra_data=json.dumps({"input_workbook_id": workbook_instance.id}),
-        content_hash=hashlib.sha1(workbook_instance.content).hexdigest(),
-        content=workbook_instance.content
+        extra_data=extra_data,
+        content_hash=content_digest,
+        content_digest=get_blob_store().put(content),
+        request=request_data,
     )
 
-    red.lpush(settings.MICROSERVICES_CREATE_SCREENSHOT_TASK_QUEUE, task.id)
+    if renderer_version:
+        leader_id = in_flight.join(content_digest, renderer_version, task.id)
+        if leader_id is not None:
+            logger.info('Screenshot task %s waits for in-flight task %s', task.id, leader_id)
+            return
 
+    red.rpush(settings.MICROSERVICES_CREATE_SCREENSHOT_TASK_QUEUE, task.id)
 
-def screenshot_worker() -> None:
-    """function for collecting the result from screenshot task"""
 
-    redis_conn: redis.Redis = get_redis_connection('microservices')
+def request_missing_screenshots(workbook_instance: InputWorkbook) -> None:
+    """Request screenshots of the sheets displayed on slides, unless a recent task is rendering them already"""
 
-    lock_time = redis_conn.ttl('lock:screenshot-worker')
+    request = get_screenshot_request(workbook_instance)
+    if request is None:
+        return
 
-    logger.info("lock_time: %s", lock_time)
+    # the in-flight results expire in an hour, older tasks are considered lost
+    pending = CreateScreenshotTask.objects.filter(
+        extra_data__regex=r'^\{"input_workbook_id": %d[,}]' % workbook_instance.id,
+        result_ingested_at__isnull=True,
+        created_at__gte=timezone.now() - timedelta(hours=1),
+    ).exclude(status='FAILED').values_list('request', flat=True)
 
-    if lock_time > 0:
-        time.sleep(lock_time + 1)
-    else:
-        time.sleep(2)
+    for pending_request in pending:
+        targets = ScreenshotRequest.from_json(pending_request).targets
+        if targets is None or request.targets is not None and set(request.targets) <= set(targets):
+            logger.info('Screenshots of workbook %s are being rendered', workbook_instance.id)
+            return
 
-    lock = redis_lock.Lock(redis_conn, "screenshot-worker", expire=30, auto_renewal=True)
+    create_screenshot_task(workbook_instance)
 
-    if lock.acquire(blocking=False):
-        try:
-            logger.info("Start screenshot worker")
-            _screenshot_worker(redis_conn)
-            lock.release()
-        finally:
-            lock.release()
-    else:
-        logger.info("Screenshot worker locked")
 
+def start_result_consumers(count: int | None = None) -> list[threading.Thread]:
+    """
+    Start threads collecting results of screenshot and PPT tasks
 
-def ppt_worker() -> None:
-    """function for collecting the result from PPT task"""
+    Consumers don't share any lock, so they can be started in as many processes as needed
+    """
 
-    redis_conn = get_redis_connection('microservices')
-    lock = redis_lock.Lock(redis_conn, "ppt-worker", expire=30, auto_renewal=True)
+    count = count or settings.MICROSERVICES_RESULT_CONSUMERS
 
-    lock_time = redis_conn.ttl('lock:ppt-worker')
+    # results refer to blobs of the other services, fail before consuming any of them
+    check_shared(get_blob_store(), get_redis_connection('microservices'), 'backend')
 
-    logger.info("lock_time: %s", lock_time)
+    consumers = (
+        (settings.MICROSERVICES_SCREENSHOT_TASK_RESULT_QUEUE, handle_screenshot_result),
+        (settings.MICROSERVICES_PPT_TASK_RESULT_QUEUE, handle_ppt_result),
+    )
 
-    if lock_time > 0:
-        time.sleep(lock_time + 1)
-    else:
-        time.sleep(2)
+    threads = []
 
-    if lock.acquire(blocking=False):
-        try:
-            logger.info("Start ppt worker")
-            _ppt_worker(redis_conn)
-            lock.release()
-        finally:
-            lock.release()
-    else:
-        logger.debug("PPT worker locked")
+    for index in range(count):
+        for queue, handler in consumers:
+            thread = threading.Thread(target=consume_results, args=(queue, handler), daemon=True,
+                                      name=f'{queue}-consumer-{index}')
+            thread.start()
+            threads.append(thread)
+
+    logger.info('Started %s result consumers', len(threads))
 
+    return threads
+
+
+def consume_results(queue: str, handler: Callable[[int], None]) -> None:
+    """
+    Collect task results from the queue
+
+    Failed results are delivered again, after MICROSERVICES_TASK_MAX_ATTEMPTS they are dead-lettered
+    """
+
+    reliable_queue = ReliableQueue(
+        get_redis_connection('microservices'), queue,
+        visibility_timeout=settings.MICROSERVICES_QUEUE_VISIBILITY_TIMEOUT,
+        retry_delay=settings.MICROSERVICES_QUEUE_RETRY_DELAY,
+        max_attempts=settings.MICROSERVICES_TASK_MAX_ATTEMPTS,
+    )
 
-def _screenshot_worker(redis_conn: redis.Redis = None) -> None:
-    red = redis_conn if redis_conn else get_redis_connection('microservices')
+    def _handle(message: Message) -> None:
+        close_old_connections()
+        handler(int(message.payload))
 
     while True:
         try:
-            queue, payload = red.blpop(settings.MICROSERVICES_SCREENSHOT_TASK_RESULT_QUEUE)
-            task_id = int(payload)
+            reliable_queue.process(_handle, timeout=10)
+        except Exception as e:
+            logger.error('Error in %s consumer', queue, exc_info=e)
+            time.sleep(5)
 
-            logger.info('Got screenshot task result with id %s', task_id)
 
-            task = CreateScreenshotTask.objects.prefetch_related('screenshots').get(id=task_id)
+def handle_screenshot_result(task_id: int) -> None:
+    """Save screenshots of the completed task to the workbook sheets"""
 
-            if not task:
-                logger.info('Screenshot task with id %s not found', task_id)
-                continue
+    logger.info('Got screenshot task result with id %s', task_id)
 
-            if task.status == 'FAILED':
-                extra_data = json.loads(task.extra_data)
+    blob_store = get_blob_store()
 
-                attempt = extra_data.get('attempt', 0)
+    with transaction.atomic():
+        task = CreateScreenshotTask.objects.select_for_update().defer('content').filter(id=task_id).first()
 
-                if attempt < 5:
-                    task.status = 'PENDING'
-                    extra_data.update({'attempt': attempt + 1})
-                    task.extra_data = json.dumps(extra_data)
-                    task.save()
-                    logger.info(task.extra_data)
-                    red.rpush(settings.MICROSERVICES_CREATE_SCREENSHOT_TASK_QUEUE, task.id)
-                    continue
+        if not task:
+            logger.info('Screenshot task with id %s not found', task_id)
+            return
 
-            if task.status == 'COMPLETED':
+        if task.result_ingested_at:
+            logger.info('Screenshot task with id %s is already ingested', task_id)
+            return
 
-                extra_data = json.loads(task.extra_data)
+        extra_data = json.loads(task.extra_data)
 
-                _id = extra_data['input_workbook_id']
+        if task.status == 'FAILED':
+            # screenshots maker has already retried the task
+            logger.error('Screenshot task with id %s failed: %s', task_id, task.status_message)
+            task.result_ingested_at = timezone.now()
+            task.save(update_fields=['result_ingested_at'])
+            return
 
-                workbook = InputWorkbook.objects.prefetch_related('input_spreadsheets').get(id=_id)
+        if task.status != 'COMPLETED':
+            logger.info('Screenshot task with id %s is not completed yet', task_id)
+            return
 
-                bulk_list = []
+        _id = extra_data['input_workbook_id']
 
-                for sheet in task.screenshots.all():
-                    item = workbook.input_spreadsheets.get(position=sheet.position + 1)
-                    item.screenshot = sheet.content
-                    bulk_list.append(item)
+        fingerprints = extra_data.get('fingerprints')
 
-                InputSpreadsheet.objects.bulk_update(bulk_list, ['screenshot'])
+        spreadsheets = {
+            spreadsheet.position: spreadsheet
+            for spreadsheet in InputSpreadsheet.objects.filter(input_workbook__id=_id).only(
+                'id', 'position', 'fingerprint')
+        }
 
-                logger.info('Update screenshots for workbook with id %s', _id)
-        except Exception as e:
-            logger.error('Error in screenshot worker', exc_info=e)
-            time.sleep(5)
+        bulk_list = []
 
+        # screenshots of the sheets which were not requested are kept,
+        # those of the changed sheets are dropped when the workbook is uploaded
+        for sheet in task.screenshots.all():
+            item = spreadsheets.pop(sheet.position + 1, None)
+            if item is None:
+                continue
+            if fingerprints is not None and (sheet.position >= len(fingerprints) or
+                                             fingerprints[sheet.position] != item.fingerprint):
+                # the workbook was uploaded again while the task was rendered, its own task renders the sheet
+                logger.info('Screenshot of sheet %s of task %s is outdated', sheet.position, task_id)
+                continue
+            item.screenshot = blob_store.read(sheet.content_digest, sheet.content)
+            bulk_list.append(item)
 
-def _ppt_worker(redis_conn: redis.Redis = None) -> None:
-    red = redis_conn if redis_conn else get_redis_connection('microservices')
+        InputSpreadsheet.objects.bulk_update(bulk_list, ['screenshot'])
 
-    while True:
-        try:
-            queue, payload = red.blpop(settings.MICROSERVICES_PPT_TASK_RESULT_QUEUE)
-            task_id = int(payload)
+        task.result_ingested_at = timezone.now()
+        task.save(update_fields=['result_ingested_at'])
 
-            logger.info('Got ppt task result with id %s', task_id)
+    logger.info('Update screenshots for workbook with id %s', _id)
 
-            task = CreatePPTTask.objects.prefetch_related('ppt_task_slides').get(id=task_id)
 
-            if not task:
-                logger.info('PPT task with id %s not found', task_id)
-                continue
+def handle_ppt_result(task_id: int) -> None:
+    """Save generated PPT and slides screenshots to the project"""
 
-            if task.status == 'FAILED':
+    logger.info('Got ppt task result with id %s', task_id)
 
-                extra_data = json.loads(task.extra_data)
+    blob_store = get_blob_store()
 
-                attempt = extra_data.get('attempt', 0)
+    with transaction.atomic():
+        task = CreatePPTTask.objects.select_for_update().defer('ppt_template').filter(id=task_id).first()
 
-                if attempt < 5:
-                    logger.info('PPT task with id %s failed, recreating', task_id)
-                    task.status = 'PENDING'
-                    extra_data.update({'attempt': attempt + 1})
-                    task.extra_data = json.dumps(extra_data)
-                    task.save()
-                    red.rpush(settings.MICROSERVICES_CREATE_SCREENSHOT_TASK_QUEUE, task.id)
-                    continue
+        if not task:
+            logger.info('PPT task with id %s not found', task_id)
+            return
 
-                else:
-                    project = Project.objects.prefetch_related('slide_instructions').get(id=_id)
-                    project.is_generating = False
-                    project.save()
-                    return
+        if task.result_ingested_at:
+            logger.info('PPT task with id %s is already ingested', task_id)
+            return
 
-            if task.status == 'COMPLETED':
+        extra_data = json.loads(task.extra_data)
 
-                extra_data = json.loads(task.extra_data)
+        _id = extra_data['project_id']
 
-                _id = extra_data['project_id']
+        if task.status == 'FAILED':
+            # composer has already retried the task
+            logger.error('PPT task with id %s failed: %s', task_id, task.status_message)
+            Project.objects.filter(id=_id).update(is_generating=False)
+            task.result_ingested_at = timezone.now()
+            task.save(update_fields=['result_ingested_at'])
+            return
 
-                with transaction.atomic():
+        if task.status != 'COMPLETED':
+            logger.info('PPT task with id %s is not completed yet', task_id)
+            return
 
-                    project = Project.objects.prefetch_related('slide_instructions').get(id=_id)
+        project = Project.objects.prefetch_related('slide_instructions').get(id=_id)
 
-                    project.ppt_content = task.created_ppt_content
+        project.ppt_content = blob_store.read(task.created_ppt_content_digest, task.created_ppt_content)
 
-                    file_name = datetime.now().strftime('%Y%m%d%H%M%S') + '-position-0.png'
-                    file = io.BytesIO(task.screenshot_first_slide)
+        screenshot_first_slide = blob_store.read(task.screenshot_first_slide_digest, task.screenshot_first_slide)
 
-                    logger.info(f'Screenshot data size: {len(task.screenshot_first_slide)} bytes')
+        file_name = datetime.now().strftime('%Y%m%d%H%M%S') + '-position-0.png'
+        file = io.BytesIO(screenshot_first_slide)
 
-                    old_file_path = None
-                    old_screenshot_path = None
-                    if project.screenshot_first_slide:
-                        old_file_path = project.screenshot_first_slide.path
+        logger.info(f'Screenshot data size: {len(screenshot_first_slide)} bytes')
 
-                    project.screenshot_first_slide.save(file_name, ContentFile(file.getvalue()), save=True)
+        old_file_path = None
+        old_screenshot_path = None
+        if project.screenshot_first_slide:
+            old_file_path = project.screenshot_first_slide.path
 
-                    if old_file_path and os.path.isfile(old_file_path):
-                        os.remove(old_file_path)
+        project.screenshot_first_slide.save(file_name, ContentFile(file.getvalue()), save=True)
 
-                    bulk_list = []
+        if old_file_path and os.path.isfile(old_file_path):
+            os.remove(old_file_path)
 
-                    for slide in task.ppt_task_slides.all():
+        _replace_screenshot_variant(project.screenshot_first_slide_preview,
+                                    blob_store.read(task.screenshot_first_slide_preview_digest), 0)
+        _replace_screenshot_variant(project.screenshot_first_slide_thumbnail,
+                                    blob_store.read(task.screenshot_first_slide_thumbnail_digest), 0)
 
-                        item = project.slide_instructions.get(position=slide.position)
-                        file_name = datetime.now().strftime(
-                            '%Y%m%d%H%M%S') + f'-position-{slide.position}.png'
-                        file = io.BytesIO(slide.screenshot)
+        bulk_list = []
 
-                        if item.screenshot:
-                            old_screenshot_path = item.screenshot.path
+        for slide in task.ppt_task_slides.all():
 
-                        item.screenshot.save(file_name, ContentFile(file.getvalue()))
-                        bulk_list.append(item)
+            item = project.slide_instructions.get(position=slide.position)
+            file_name = datetime.now().strftime(
+                '%Y%m%d%H%M%S') + f'-position-{slide.position}.png'
+            file = io.BytesIO(blob_store.read(slide.screenshot_digest, slide.screenshot))
 
-                        if old_screenshot_path and os.path.isfile(old_screenshot_path):
-                            os.remove(old_screenshot_path)
-                            old_screenshot_path = None
+            if item.screenshot:
+                old_screenshot_path = item.screenshot.path
 
-                    SlideInstructions.objects.bulk_update(bulk_list, ['screenshot'])
-                    project.is_generating = False
-                    project.save()
+            item.screenshot.save(file_name, ContentFile(file.getvalue()))
+            bulk_list.append(item)
 
-                    logger.info('First page screenshot is located at %s', project.screenshot_first_slide.path)
-                    logger.info(os.path.isfile(project.screenshot_first_slide.path))
+            if old_screenshot_path and os.path.isfile(old_screenshot_path):
+                os.remove(old_screenshot_path)
+                old_screenshot_path = None
 
-                logger.info('Update screenshots and ppt for project with id %s', _id)
-        except Exception as e:
-            logger.error('Error in ppt worker', exc_info=e)
-            time.sleep(5)
+            _replace_screenshot_variant(item.screenshot_preview,
+                                        blob_store.read(slide.screenshot_preview_digest), slide.position)
+            _replace_screenshot_variant(item.screenshot_thumbnail,
+                                        blob_store.read(slide.screenshot_thumbnail_digest), slide.position)
+
+        SlideInstructions.objects.bulk_update(bulk_list, ['screenshot', 'screenshot_preview', 'screenshot_thumbnail'])
+        project.is_generating = False
+        project.save()
+
+        task.result_ingested_at = timezone.now()
+        task.save(update_fields=['result_ingested_at'])
+
+        logger.info('First page screenshot is located at %s', project.screenshot_first_slide.path)
+
+    logger.info('Update screenshots and ppt for project with id %s', _id)
+
+
+def _replace_screenshot_variant(field, content: bytes | None, position: int) -> None:
+    """Save preview or thumbnail of the slide screenshot, the previous file is removed"""
+
+    if content is None:
+        return
+
+    old_path = field.path if field else None
+    file_name = datetime.now().strftime('%Y%m%d%H%M%S') + f'-position-{position}.{_image_extension(content)}'
+    field.save(file_name, ContentFile(content), save=False)
+
+    if old_path and os.path.isfile(old_path):
+        os.remove(old_path)
+
+
+def _image_extension(content: bytes) -> str:
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'webp'
+    if content[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    return 'png'
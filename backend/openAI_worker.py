@@ -1,38 +1,182 @@
+import json
+import time
+import hashlib
 import logging
-from openai import OpenAI, RateLimitError
-from openai.types.chat.chat_completion import ChatCompletion
-from retry import retry
+from typing import Callable
 
-from server.settings import OPENAI_API_KEY, OPENAI_MODEL
+from openai_gateway import get_gateway, iter_completions
 
 logger = logging.getLogger(__name__)
 
+# KEYS: index, sizes, stats; ARGV: digest, size, now.
+# The old size is read and replaced in one step, concurrent sets of a digest count its size once.
+_SET_SCRIPT = """
+local old_size = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+return redis.call('HINCRBY', KEYS[3], 'bytes', tonumber(ARGV[2]) - old_size)
+"""
+
+# KEYS: index, sizes, stats; ARGV: max bytes, last used time of expired entries.
+# Removes the expired entries, then the least recently used ones till the answers fit, :return: removed digests
+_EVICT_SCRIPT = """
+local removed = {}
+local function remove(digest, counter)
+    local size = redis.call('HGET', KEYS[2], digest)
+    redis.call('ZREM', KEYS[1], digest)
+    if size then
+        redis.call('HDEL', KEYS[2], digest)
+        redis.call('HINCRBY', KEYS[3], 'bytes', -tonumber(size))
+    end
+    redis.call('HINCRBY', KEYS[3], counter, 1)
+    table.insert(removed, digest)
+end
+for _, digest in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])) do
+    remove(digest, 'expired')
+end
+while tonumber(redis.call('HGET', KEYS[3], 'bytes') or '0') > tonumber(ARGV[1]) do
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0)
+    if #oldest == 0 then
+        -- no entries, so no bytes either
+        redis.call('HSET', KEYS[3], 'bytes', 0)
+        break
+    end
+    remove(oldest[1], 'evictions')
+end
+return removed
+"""
+
+
+class OpenAIResponseCache:
+    """
+    Content-addressed cache of GPT answers in the `default` cache
+
+    Entries are keyed by a hash of (model, messages). Besides the TTL, the total size of
+    cached answers is limited, least recently used entries are evicted first.
+    """
+
+    KEY_PREFIX = 'openai:answer:'
+    INDEX_KEY = 'openai:answers:index'
+    SIZES_KEY = 'openai:answers:sizes'
+    STATS_KEY = 'openai:answers:stats'
+
+    def __init__(self, ttl: int | None = None, max_bytes: int | None = None, *, cache=None, redis_conn=None):
+        """ :param cache: Django cache of the answers, `default` cache and its Redis connection by default """
+
+        # Django is imported here, so the cache can be used without Django settings (tests)
+        if ttl is None or max_bytes is None:
+            from server.settings import OPENAI_CACHE_TTL, OPENAI_CACHE_MAX_BYTES
+            ttl = OPENAI_CACHE_TTL if ttl is None else ttl
+            max_bytes = OPENAI_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        if cache is None:
+            from django.core.cache import caches
+            cache = caches['default']
+        if redis_conn is None:
+            from django_redis import get_redis_connection
+            redis_conn = get_redis_connection('default')
+
+        self._cache = cache
+        self._redis = redis_conn
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._set_size = redis_conn.register_script(_SET_SCRIPT)
+        self._evict_entries = redis_conn.register_script(_EVICT_SCRIPT)
+
+    @staticmethod
+    def make_digest(model: str, messages: list[dict]) -> str:
+        payload = json.dumps([model, messages], ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, digest: str) -> str | None:
+        answer = self._cache.get(self.KEY_PREFIX + digest)
+
+        if answer is None:
+            self._redis.hincrby(self.STATS_KEY, 'misses', 1)
+            return None
+
+        # sliding expiration, so index score + ttl is the expiration time
+        self._cache.touch(self.KEY_PREFIX + digest, self._ttl)
+
+        pipe = self._redis.pipeline()
+        pipe.zadd(self.INDEX_KEY, {digest: time.time()})
+        pipe.hincrby(self.STATS_KEY, 'hits', 1)
+        pipe.execute()
+
+        return answer
+
+    def set(self, digest: str, answer: str) -> None:
+        self._cache.set(self.KEY_PREFIX + digest, answer, timeout=self._ttl)
+
+        self._set_size(keys=[self.INDEX_KEY, self.SIZES_KEY, self.STATS_KEY],
+                       args=[digest, len(answer.encode()), time.time()])
+
+        self._evict()
+
+    def stats(self) -> dict:
+        stats = {key.decode(): int(value) for key, value in self._redis.hgetall(self.STATS_KEY).items()}
+        stats['entries'] = self._redis.zcard(self.INDEX_KEY)
+        return stats
+
+    def _evict(self) -> None:
+        removed = self._evict_entries(keys=[self.INDEX_KEY, self.SIZES_KEY, self.STATS_KEY],
+                                      args=[self._max_bytes, time.time() - self._ttl])
+        if removed:
+            self._cache.delete_many([self.KEY_PREFIX + digest.decode() for digest in removed])
+
 
 class OpenAIWorker:
     """ Class for working with OpenAI API"""
 
     def __init__(self):
-        self._client = OpenAI(api_key=OPENAI_API_KEY)
-        self._model = OPENAI_MODEL
-
-    @retry(RateLimitError, tries=10, delay=10, jitter=10)
-    def _get_completion(self, model: str, messages: list[dict]) -> ChatCompletion:
-        completion = self._client.chat.completions.create(model=model, messages=messages)
+        self._gateway = get_gateway()
+        self._model = self._gateway.model
+        self._cache = OpenAIResponseCache()
 
-        return completion
+    def get_answer_from_gpt(self, user_message: str, sys_message: str, bypass_cache: bool = False) -> str:
+        return self.get_answers_from_gpt([(user_message, sys_message)], bypass_cache=bypass_cache)[0]
 
-    def get_answer_from_gpt(self, user_message: str, sys_message: str) -> str:
-        logger.info(f"Asks GPT: {user_message}")
+    def get_answers_from_gpt(self, prompts: list[tuple[str, str]], bypass_cache: bool = False,
+                             on_answer: Callable[[int, str], None] | None = None) -> list[str]:
+        """
+        Get answers for (user message, system message) prompts, not cached ones are requested concurrently
+        on_answer is called for every answer, cached ones first, the requested ones as soon as each is received
+        """
 
-        messages = [
-            {"role": "system", "content": sys_message},
-            {"role": "user", "content": user_message},
+        messages_list = [
+            [
+                {"role": "system", "content": sys_message},
+                {"role": "user", "content": user_message},
+            ]
+            for user_message, sys_message in prompts
         ]
+        digests = [self._cache.make_digest(self._model, messages) for messages in messages_list]
+        answers = [None] * len(prompts)
 
-        completion = self._get_completion(self._model, messages)
+        for index, messages in enumerate(messages_list):
+            logger.info(f"Asks GPT: {messages[1]['content']}")
 
-        answer = completion.choices[0].message.content
+            if bypass_cache:
+                continue
 
-        logger.info(f"Got answer: {answer}")
+            answer = self._cache.get(digests[index])
+            if answer is not None:
+                logger.info(f"Got cached answer {digests[index]}: {answer}")
+                answers[index] = answer
+                if on_answer:
+                    on_answer(index, answer)
 
-        return answer
+        missing = [index for index, answer in enumerate(answers) if answer is None]
+
+        if missing:
+            # answers received before a failure are cached, the retried task gets them from the cache
+            completions = iter_completions(self._gateway, [messages_list[index] for index in missing])
+            for position, answer in completions:
+                index = missing[position]
+                answers[index] = answer
+                if answer is not None:
+                    self._cache.set(digests[index], answer)
+                logger.info(f"Got answer: {answer}")
+                if on_answer:
+                    on_answer(index, answer)
+
+        return answers
@@ -0,0 +1,237 @@
+import json
+import time
+import queue
+import random
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Iterator
+
+import redis.asyncio as aioredis
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+
+# KEYS: requests counter, tokens counter; ARGV: requests limit, tokens limit, tokens requested.
+# Request is allowed to exceed tokens limit only in an empty window, otherwise it never fits.
+_ACQUIRE_SCRIPT = """
+local requests = tonumber(redis.call('GET', KEYS[1]) or '0')
+local tokens = tonumber(redis.call('GET', KEYS[2]) or '0')
+if requests + 1 > tonumber(ARGV[1]) then
+    return 0
+end
+if tokens > 0 and tokens + tonumber(ARGV[3]) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('INCRBY', KEYS[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], 120)
+return 1
+"""
+
+
+class RateBudget:
+    """
+    Requests and tokens per minute budget shared by all workers
+
+    Budget is counted in Redis in fixed one minute windows, so every worker process
+    sees the same usage.
+    """
+
+    KEY_PREFIX = 'openai:rate:'
+
+    def __init__(self, redis_conn: aioredis.Redis, requests_per_minute: int, tokens_per_minute: int):
+        self._redis = redis_conn
+        self._requests_per_minute = requests_per_minute
+        self._tokens_per_minute = tokens_per_minute
+        self._acquire = self._redis.register_script(_ACQUIRE_SCRIPT)
+
+    async def acquire(self, tokens: int) -> str:
+        """ Wait until request fits into the budget, return key of the tokens counter used """
+
+        while True:
+            window = int(time.time() // 60)
+            requests_key = f'{self.KEY_PREFIX}{window}:requests'
+            tokens_key = f'{self.KEY_PREFIX}{window}:tokens'
+
+            allowed = await self._acquire(
+                keys=[requests_key, tokens_key],
+                args=[self._requests_per_minute, self._tokens_per_minute, tokens]
+            )
+            if allowed:
+                return tokens_key
+
+            delay = 60 - time.time() % 60 + random.uniform(0, 1)
+            logger.info('OpenAI rate budget is exhausted, waiting %.1f s', delay)
+            await asyncio.sleep(delay)
+
+    async def adjust(self, tokens_key: str, tokens: int) -> None:
+        """ Correct estimated tokens usage with the real one """
+
+        if tokens:
+            await self._redis.incrby(tokens_key, tokens)
+
+
+class OpenAIGateway:
+    """
+    Async OpenAI gateway
+
+    Keeps one client with its connection pool per process, requests of all workers
+    are limited by the shared RateBudget.
+    """
+
+    def __init__(self, *, api_key: str, model: str, redis_url: str, base_url: str | None = None,
+                 requests_per_minute: int, tokens_per_minute: int,
+                 max_concurrency: int, max_retries: int, completion_tokens_estimate: int):
+        self.model = model
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries)
+        self._redis = aioredis.Redis.from_url(redis_url)
+        self._budget = RateBudget(self._redis, requests_per_minute, tokens_per_minute)
+        self._max_concurrency = max_concurrency
+        self._completion_tokens_estimate = completion_tokens_estimate
+
+    async def complete(self, messages: list[dict]) -> str:
+        estimated_tokens = len(json.dumps(messages)) // CHARS_PER_TOKEN + self._completion_tokens_estimate
+
+        tokens_key = await self._budget.acquire(estimated_tokens)
+
+        completion = await self._client.chat.completions.create(model=self.model, messages=messages)
+
+        if completion.usage:
+            await self._budget.adjust(tokens_key, completion.usage.total_tokens - estimated_tokens)
+
+        return completion.choices[0].message.content
+
+    async def complete_many(self, messages_list: list[list[dict]],
+                            on_answer: Callable[[int, str], None] | None = None) -> list[str]:
+        """
+        Issue all requests concurrently, on_answer is called as soon as each answer is ready
+        If a request fails, the others are cancelled before the error is raised
+        """
+
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def _complete(index: int, messages: list[dict]) -> str:
+            async with semaphore:
+                answer = await self.complete(messages)
+            if on_answer:
+                on_answer(index, answer)
+            return answer
+
+        tasks = [asyncio.ensure_future(_complete(i, m)) for i, m in enumerate(messages_list)]
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def aclose(self) -> None:
+        await self._client.close()
+        await self._redis.aclose()
+
+
+_gateway: OpenAIGateway | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_gateway() -> OpenAIGateway:
+    """ Get gateway of the current process """
+
+    # settings are imported here, so the gateway can be used without Django settings (tests)
+    from server.settings import (
+        CACHES,
+        OPENAI_API_KEY,
+        OPENAI_MODEL,
+        OPENAI_BASE_URL,
+        OPENAI_MAX_RETRIES,
+        OPENAI_MAX_CONCURRENCY,
+        OPENAI_REQUESTS_PER_MINUTE,
+        OPENAI_TOKENS_PER_MINUTE,
+        OPENAI_COMPLETION_TOKENS_ESTIMATE,
+    )
+
+    global _gateway
+    if _gateway is None:
+        _gateway = OpenAIGateway(
+            api_key=OPENAI_API_KEY,
+            model=OPENAI_MODEL,
+            base_url=OPENAI_BASE_URL,
+            redis_url=CACHES['default']['LOCATION'],
+            requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+            max_concurrency=OPENAI_MAX_CONCURRENCY,
+            max_retries=OPENAI_MAX_RETRIES,
+            completion_tokens_estimate=OPENAI_COMPLETION_TOKENS_ESTIMATE,
+        )
+    return _gateway
+
+
+def run(coroutine: Awaitable):
+    """
+    Run coroutine from sync code
+
+    The event loop is kept between calls, because the gateway connection pool is bound to it.
+    Tasks left by the coroutine are cancelled, so nothing of this call runs during the next one.
+    """
+
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    try:
+        return _loop.run_until_complete(coroutine)
+    finally:
+        pending = asyncio.all_tasks(_loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            _loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+
+_DONE = object()
+
+
+def iter_completions(gateway: OpenAIGateway, messages_list: list[list[dict]]) -> Iterator[tuple[int, str]]:
+    """
+    Yield (index, answer) of the requests from the calling thread as soon as each one is answered
+
+    The requests run in the event loop in a helper thread, so the caller may use the ORM for an answer
+    while the others are still requested. The error of a failed request is raised after the answers
+    received before it. If the caller stops iterating, the requests in flight are cancelled.
+    """
+
+    answers = queue.Queue()
+    errors = []
+    stop = threading.Event()
+    main_task = []
+
+    async def _complete_many():
+        main_task.append(asyncio.current_task())
+        if not stop.is_set():
+            await gateway.complete_many(messages_list, on_answer=lambda index, answer: answers.put((index, answer)))
+
+    def _run():
+        try:
+            run(_complete_many())
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            answers.put(_DONE)
+
+    thread = threading.Thread(target=_run, name='openai-gateway', daemon=True)
+    thread.start()
+    try:
+        while (item := answers.get()) is not _DONE:
+            yield item
+    finally:
+        stop.set()
+        if main_task:
+            _loop.call_soon_threadsafe(main_task[0].cancel)
+        thread.join()
+    if errors:
+        raise errors[0]
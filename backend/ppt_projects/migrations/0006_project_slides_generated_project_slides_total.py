@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppt_projects', '0005_alter_project_screenshot_first_slide'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='slides_generated',
+            field=models.IntegerField(default=0, verbose_name='Slides generated'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='slides_total',
+            field=models.IntegerField(default=0, verbose_name='Slides total'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppt_projects', '0006_project_slides_generated_project_slides_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputworkbook',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='Content hash'),
+        ),
+        migrations.AddField(
+            model_name='inputspreadsheet',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='Content hash'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppt_projects', '0007_inputworkbook_content_hash_inputspreadsheet_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='screenshot_first_slide_preview',
+            field=models.FileField(blank=True, null=True, upload_to='slides/preview', verbose_name='Screenshot preview'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='screenshot_first_slide_thumbnail',
+            field=models.FileField(blank=True, null=True, upload_to='slides/thumbnail', verbose_name='Screenshot thumbnail'),
+        ),
+        migrations.AddField(
+            model_name='slideinstructions',
+            name='screenshot_preview',
+            field=models.FileField(blank=True, null=True, upload_to='slides/preview', verbose_name='Screenshot preview'),
+        ),
+        migrations.AddField(
+            model_name='slideinstructions',
+            name='screenshot_thumbnail',
+            field=models.FileField(blank=True, null=True, upload_to='slides/thumbnail', verbose_name='Screenshot thumbnail'),
+        ),
+    ]
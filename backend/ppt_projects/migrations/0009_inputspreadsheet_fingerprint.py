@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppt_projects', '0008_screenshot_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputspreadsheet',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='Fingerprint'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppt_projects', '0009_inputspreadsheet_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='template_layout',
+            field=models.TextField(blank=True, null=True, verbose_name='Template layout'),
+        ),
+    ]
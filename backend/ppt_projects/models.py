@@ -13,12 +13,19 @@ class Project(models.Model):
     footer = models.CharField(max_length=255, null=True, blank=True, verbose_name='Footer')
     template_name = models.CharField(max_length=100, null=True, blank=True, verbose_name='Template name')
     is_generating = models.BooleanField(default=False, verbose_name='Is generating?')
+    slides_generated = models.IntegerField(default=0, verbose_name='Slides generated')
+    slides_total = models.IntegerField(default=0, verbose_name='Slides total')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='projects')
     template_content = models.BinaryField(null=True, blank=True, verbose_name='Template content')
+    template_layout = models.TextField(null=True, blank=True, verbose_name='Template layout')
     ppt_content = models.BinaryField(null=True, blank=True, verbose_name='PPT content')
     screenshot_first_slide = models.FileField(upload_to='slides/screenshot', null=True, blank=True, verbose_name='Screenshot')
+    screenshot_first_slide_preview = models.FileField(upload_to='slides/preview', null=True, blank=True,
+                                                      verbose_name='Screenshot preview')
+    screenshot_first_slide_thumbnail = models.FileField(upload_to='slides/thumbnail', null=True, blank=True,
+                                                        verbose_name='Screenshot thumbnail')
 
     class Meta:
         db_table = 'projects'
@@ -45,6 +52,10 @@ class SlideInstructions(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='slide_instructions')
     input_spreadsheet = models.ForeignKey('InputSpreadsheet', on_delete=models.SET_NULL, null=True, blank=True)
     screenshot = models.FileField(upload_to='slides/screenshot', null=True, blank=True, verbose_name='Screenshot')
+    screenshot_preview = models.FileField(upload_to='slides/preview', null=True, blank=True,
+                                          verbose_name='Screenshot preview')
+    screenshot_thumbnail = models.FileField(upload_to='slides/thumbnail', null=True, blank=True,
+                                            verbose_name='Screenshot thumbnail')
 
     class Meta:
         db_table = 'slide_instructions'
@@ -63,6 +74,7 @@ class InputWorkbook(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated')
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='input_workbooks')
     content = models.BinaryField(verbose_name='Content')
+    content_hash = models.CharField(max_length=40, null=True, blank=True, verbose_name='Content hash')
 
     class Meta:
         db_table = 'input_workbooks'
@@ -83,6 +95,9 @@ class InputSpreadsheet(models.Model):
     input_workbook = models.ForeignKey(InputWorkbook, on_delete=models.CASCADE, related_name='input_spreadsheets')
     screenshot = models.BinaryField(null=True, blank=True, verbose_name='Screenshot')
     content = models.BinaryField(null=True, blank=True, verbose_name='Content')
+    content_hash = models.CharField(max_length=40, null=True, blank=True, verbose_name='Content hash')
+    # the screenshot is rendered again only when the fingerprint of the sheet changes
+    fingerprint = models.CharField(max_length=40, null=True, blank=True, verbose_name='Fingerprint')
 
     class Meta:
         db_table = 'input_spreadsheets'
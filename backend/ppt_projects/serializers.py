@@ -1,4 +1,5 @@
 import io
+import hashlib
 import logging
 import tempfile
 
@@ -9,8 +10,10 @@ from pptx import Presentation
 
 from ppt_projects.models import Project, SlideInstructions, InputWorkbook, InputSpreadsheet
 from accounts.models import UserSettings
+from microservices_tasks.template_layout import TemplateLayout, TemplateLayoutError
 from microservices_tasks.utils import create_screenshot_task
-from xlsx_worker import get_workbook_sheet_names
+from ppt_projects.tasks import extract_workbook_sheets_task
+from xlsx_worker import get_workbook_sheet_names, get_workbook_sheet_fingerprints
 
 logger = logging.getLogger('ppt_projects.serializer')
 
@@ -72,6 +75,32 @@ class InputWorkbookSerializer(serializers.ModelSerializer):
 
         return bulk_items
 
+    @staticmethod
+    def __update_sheet_fingerprints(instance, fingerprints: dict[str, str]) -> list[str] | None:
+        """
+        Store new fingerprints of the sheets, screenshots of the changed sheets are dropped
+        return: names of the sheets to render, None if all of them
+        """
+
+        spreadsheets = list(InputSpreadsheet.objects.filter(input_workbook=instance).only('id', 'name', 'fingerprint'))
+        missing = set(InputSpreadsheet.objects.filter(
+            input_workbook=instance, screenshot__isnull=True).values_list('name', flat=True))
+
+        changed = []
+        for spreadsheet in spreadsheets:
+            fingerprint = fingerprints.get(spreadsheet.name)
+            if fingerprint is None or fingerprint != spreadsheet.fingerprint:
+                spreadsheet.fingerprint = fingerprint
+                spreadsheet.screenshot = None
+                changed.append(spreadsheet)
+
+        InputSpreadsheet.objects.bulk_update(changed, ['fingerprint', 'screenshot'])
+
+        names = missing | {spreadsheet.name for spreadsheet in changed}
+        if len(names) == len(spreadsheets):
+            return None
+        return sorted(names)
+
     def update(self, instance, validated_data):
 
         content = validated_data.pop('content')
@@ -86,18 +115,31 @@ class InputWorkbookSerializer(serializers.ModelSerializer):
                 byte_content = content.file.getvalue()
 
             tables = self.__check_xlsx_for_the_same_tables(instance, byte_content)
+            fingerprints = get_workbook_sheet_fingerprints(byte_content)
+
+            content_hash = hashlib.sha1(byte_content).hexdigest()
+            content_changed = content_hash != instance.content_hash
 
             with transaction.atomic():
 
                 InputSpreadsheet.objects.bulk_create(tables)
 
                 instance.content = byte_content
+                instance.content_hash = content_hash
 
                 instance.name = content.name or instance.name
 
                 instance.save()
 
-            create_screenshot_task(instance)
+                sheet_names = self.__update_sheet_fingerprints(instance, fingerprints)
+
+            if content_changed:
+                extract_workbook_sheets_task.delay(instance.id)
+
+            if sheet_names is None or sheet_names:
+                create_screenshot_task(instance, sheet_names)
+            else:
+                logger.info('Sheets of workbook %s are not changed', instance.id)
 
             instance.spreadsheets = InputSpreadsheet.objects.filter(input_workbook=instance)
 
@@ -121,8 +163,10 @@ class CreateInputWorkbookSerializer(serializers.ModelSerializer):
     @staticmethod
     def __generate_bulk_input_spreadsheets_items(content, workbook_instance):
         bulk_items = []
+        fingerprints = get_workbook_sheet_fingerprints(content)
         for index, name in enumerate(get_workbook_sheet_names(content), 1):
-            item = InputSpreadsheet(name=name, position=index, input_workbook=workbook_instance)
+            item = InputSpreadsheet(name=name, position=index, input_workbook=workbook_instance,
+                                    fingerprint=fingerprints.get(name))
             bulk_items.append(item)
 
         return bulk_items
@@ -146,13 +190,16 @@ class CreateInputWorkbookSerializer(serializers.ModelSerializer):
                     byte_content = content.file.getvalue()
 
                 instance = InputWorkbook.objects.create(
-                    project=project, content=byte_content, **validated_data)
+                    project=project, content=byte_content,
+                    content_hash=hashlib.sha1(byte_content).hexdigest(), **validated_data)
 
                 bulk_sheet_items = self.__generate_bulk_input_spreadsheets_items(
                     byte_content, workbook_instance=instance)
 
                 InputSpreadsheet.objects.bulk_create(bulk_sheet_items)
 
+            extract_workbook_sheets_task.delay(instance.id)
+
             create_screenshot_task(instance)
 
             instance.spreadsheets = InputSpreadsheet.objects.filter(input_workbook=instance)
@@ -238,9 +285,11 @@ class ProjectSerializer(serializers.ModelSerializer):
         model = Project
         fields = [
             'id', 'title', 'description', 'subtitle', 'workbook', 'slides',
-            'footer', 'template_name', 'template_content', 'created_at', 'updated_at'
+            'footer', 'template_name', 'template_content', 'is_generating',
+            'slides_generated', 'slides_total', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'is_generating', 'slides_generated', 'slides_total',
+                            'created_at', 'updated_at']
 
     def get_workbook(self, obj):
         workbooks = InputWorkbook.objects.all()
@@ -262,6 +311,7 @@ class ProjectSerializer(serializers.ModelSerializer):
             project.template_name = user_settings.template_name
         if not project.template_content:
             project.template_content = user_settings.template_content
+            project.template_layout = user_settings.template_layout
 
         project.save()
 
@@ -281,20 +331,28 @@ class ProjectSerializer(serializers.ModelSerializer):
             else:
                 byte_content = template_content_file.file.getvalue()
 
-            self.__check_pptx(byte_content)
+            layout = self.__check_pptx(byte_content)
 
             instance.template_content = byte_content
+            instance.template_layout = layout.to_json()
 
         return super().update(instance, validated_data)
 
-    def __check_pptx(self, byte_content: bytes):
+    def __check_pptx(self, byte_content: bytes) -> TemplateLayout:
+        """ Analyse the template, the layout index is stored with it """
         try:
             ppt_content = io.BytesIO(byte_content)
-            Presentation(ppt_content)
+            presentation = Presentation(ppt_content)
         except Exception as e:
             logger.error('Invalid file type, error: %s', e, exc_info=True)
             raise serializers.ValidationError("Invalid file type.")
 
+        try:
+            return TemplateLayout.analyze(presentation)
+        except TemplateLayoutError as e:
+            logger.error('Incompatible template: %s', e)
+            raise serializers.ValidationError(str(e))
+
 
 class SlideInstructionScreenshotSerializer(serializers.ModelSerializer):
     """ Slide instruction serializer for generated PPT screenshots """
@@ -303,17 +361,22 @@ class SlideInstructionScreenshotSerializer(serializers.ModelSerializer):
     updated_at = serializers.DateTimeField(read_only=True)
 
     screenshot = serializers.SerializerMethodField()
+    preview = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = SlideInstructions
-        fields = ['screenshot', 'created_at', 'updated_at']
+        fields = ['screenshot', 'preview', 'thumbnail', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
     def get_screenshot(self, obj):
-        request = self.context.get('request')
-        if obj.screenshot and hasattr(obj.screenshot, 'url'):
-            return request.build_absolute_uri(obj.screenshot.url)
-        return None
+        return _file_url(self.context.get('request'), obj.screenshot)
+
+    def get_preview(self, obj):
+        return _file_url(self.context.get('request'), obj.screenshot_preview)
+
+    def get_thumbnail(self, obj):
+        return _file_url(self.context.get('request'), obj.screenshot_thumbnail)
 
 
 class GeneratedProjectSerializer(serializers.ModelSerializer):
@@ -347,8 +410,11 @@ class GeneratedProjectSerializer(serializers.ModelSerializer):
         data_list = SlideInstructionScreenshotSerializer(
             slide_instructions, many=True, context=self.context).data
 
+        request = self.context.get('request')
         first_slide_screenshot = {
-            'screenshot': self.get_screenshot_first_slide(obj)
+            'screenshot': self.get_screenshot_first_slide(obj),
+            'preview': _file_url(request, obj.screenshot_first_slide_preview),
+            'thumbnail': _file_url(request, obj.screenshot_first_slide_thumbnail),
         }
         data_list.insert(0, first_slide_screenshot)
 
@@ -359,3 +425,9 @@ class GeneratedProjectSerializer(serializers.ModelSerializer):
         if obj.screenshot_first_slide and hasattr(obj.screenshot_first_slide, 'url'):
             return request.build_absolute_uri(obj.screenshot_first_slide.url)
         return None
+
+
+def _file_url(request, file):
+    if file and hasattr(file, 'url'):
+        return request.build_absolute_uri(file.url)
+    return None
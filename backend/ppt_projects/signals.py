@@ -10,15 +10,16 @@ from ppt_projects.models import SlideInstructions, Project
 def delete_file_on_delete(sender, instance, **kwargs):
     """Remove file from local storage when SlideInstruction instance is deleted"""
 
-    if instance.screenshot:
-        if os.path.isfile(instance.screenshot.path):
-            os.remove(instance.screenshot.path)
+    for screenshot in (instance.screenshot, instance.screenshot_preview, instance.screenshot_thumbnail):
+        if screenshot and os.path.isfile(screenshot.path):
+            os.remove(screenshot.path)
 
 
 @receiver(post_delete, sender=Project)
 def delete_file_on_delete(sender, instance, **kwargs):
     """ Remove file from local storage when Project instance is deleted"""
 
-    if instance.screenshot_first_slide:
-        if os.path.isfile(instance.screenshot_first_slide.path):
-            os.remove(instance.screenshot_first_slide.path)
+    for screenshot in (instance.screenshot_first_slide, instance.screenshot_first_slide_preview,
+                       instance.screenshot_first_slide_thumbnail):
+        if screenshot and os.path.isfile(screenshot.path):
+            os.remove(screenshot.path)
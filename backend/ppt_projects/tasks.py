@@ -1,51 +1,52 @@
 import json
-import time
+import hashlib
 import logging
 
-from celery.result import AsyncResult
+from celery import chord
 from django_redis import get_redis_connection
 from django.conf import settings
 from django.db import transaction
+from django.db.models import F
 
 from accounts.models import UserSettings
-from ppt_projects.models import SlideInstructions, InputSpreadsheet, Project
+from ppt_projects.models import SlideInstructions, InputSpreadsheet, InputWorkbook, Project
 from microservices_tasks.models import CreatePPTTask, CreatePPTTaskSlide
+from microservices_tasks.utils import get_blob_store
 from server.celery import app
-from xlsx_worker import get_workbook_sheet_data
+from xlsx_worker import get_workbook_sheet_text, get_workbook_sheets_text
 from openAI_worker import OpenAIWorker
 
 logger = logging.getLogger('accounts.task')
 
 
-def wait_tasks(tasks_ids: list[str]):
-    """Utils for wait celery tasks"""
+def get_spreadsheet_content(spreadsheet: InputSpreadsheet) -> str:
+    """
+    Get prepared sheet payload, stored at upload time
+    Falls back to parsing the workbook when the stored payload is missing or outdated
+    """
 
-    tasks = [AsyncResult(task_id) for task_id in tasks_ids or []]
+    if spreadsheet.content is not None and \
+            spreadsheet.content_hash == spreadsheet.input_workbook.content_hash:
+        return bytes(spreadsheet.content).decode()
 
-    while tasks:
-        for task in tasks:
-            if task.ready():
-                tasks.remove(task)
-        time.sleep(0.5)
+    logger.info('Prepared content for spreadsheet %s is outdated', spreadsheet.id)
 
+    workbook_content = bytes(InputWorkbook.objects.values_list('content', flat=True).get(
+        id=spreadsheet.input_workbook_id))
 
-@app.task
-def create_slide_text_content_task(
-        user_id: int,
-        spreadsheet_id: int,
-        slide_id: int,
-        slide_title: str,
-        specific_instructions: str
-) -> None:
-    """ Create slide text content task using OpenAI"""
+    content = get_workbook_sheet_text(
+        workbook_content, spreadsheet.name, max_tokens=settings.OPENAI_SHEET_DATA_MAX_TOKENS).encode()
 
-    user_settings = UserSettings.objects.get(user__id=user_id)
-    spreadsheet = InputSpreadsheet.objects.filter(
-        id=spreadsheet_id).select_related('input_workbook').first()
+    spreadsheet.content = content
+    spreadsheet.content_hash = hashlib.sha1(workbook_content).hexdigest()
+    spreadsheet.save(update_fields=['content', 'content_hash'])
 
-    sheet_name = spreadsheet.name
-    sheet_data = get_workbook_sheet_data(spreadsheet.input_workbook.content, sheet_name)
-    sheet_data = json.dumps(sheet_data)
+    return content.decode()
+
+
+def _build_slide_prompts(user_settings: UserSettings, sheet_data: str,
+                         slide_title: str, specific_instructions: str) -> tuple[str, str]:
+    """ Build user and system messages for slide text content """
 
     sys_message_prompt = "You are a model that generates text content for ppt slides."
 
@@ -57,14 +58,64 @@ def create_slide_text_content_task(
 
     user_message_prompt = f"Generate text content for PowerPoint slide with title: {slide_title};" \
                           f" and  specific instructions: {specific_instructions}." \
-                          f"\nXlsx data is represented as json: {sheet_data}." \
+                          f"\nXlsx data is represented as table:\n{sheet_data}" \
                           "\nReturn only text for slide content, without title, content, "\
                           "comments, symbols, etc."
 
+    return user_message_prompt, sys_message_prompt
+
+
+@app.task
+def extract_workbook_sheets_task(workbook_id: int) -> None:
+    """ Parse uploaded workbook once and store prepared payload for every sheet"""
+
+    workbook = InputWorkbook.objects.get(id=workbook_id)
+    workbook_content = bytes(workbook.content)
+    content_hash = hashlib.sha1(workbook_content).hexdigest()
+
+    sheets_data = get_workbook_sheets_text(
+        workbook_content, max_tokens=settings.OPENAI_SHEET_DATA_MAX_TOKENS)
+
+    bulk_list = []
+
+    for spreadsheet in InputSpreadsheet.objects.filter(input_workbook=workbook).defer('screenshot'):
+        if spreadsheet.name not in sheets_data:
+            continue
+        spreadsheet.content = sheets_data[spreadsheet.name].encode()
+        spreadsheet.content_hash = content_hash
+        bulk_list.append(spreadsheet)
+
+    InputSpreadsheet.objects.bulk_update(bulk_list, ['content', 'content_hash'])
+
+    logger.info('Sheets content extracted for workbook %s', workbook_id)
+
+
+@app.task
+def create_slide_text_content_task(
+        user_id: int,
+        spreadsheet_id: int,
+        slide_id: int,
+        slide_title: str,
+        specific_instructions: str,
+        project_id: int | None = None,
+        bypass_cache: bool = False
+) -> int:
+    """ Create slide text content task using OpenAI"""
+
+    user_settings = UserSettings.objects.get(user__id=user_id)
+    spreadsheet = InputSpreadsheet.objects.filter(
+        id=spreadsheet_id).select_related('input_workbook').defer(
+        'screenshot', 'input_workbook__content').first()
+
+    sheet_data = get_spreadsheet_content(spreadsheet)
+
+    user_message_prompt, sys_message_prompt = _build_slide_prompts(
+        user_settings, sheet_data, slide_title, specific_instructions)
+
     openai_worker = OpenAIWorker()
 
     answer = openai_worker.get_answer_from_gpt(
-        user_message=user_message_prompt, sys_message=sys_message_prompt
+        user_message=user_message_prompt, sys_message=sys_message_prompt, bypass_cache=bypass_cache
     )
 
     slide = SlideInstructions.objects.get(id=slide_id)
@@ -72,14 +123,87 @@ def create_slide_text_content_task(
 
     slide.save()
 
+    if project_id is not None:
+        Project.objects.filter(id=project_id).update(slides_generated=F('slides_generated') + 1)
+
     logger.info('Text content created for slide %s', slide_id)
     logger.info('Gpt answer: %s', answer)
 
+    return slide_id
+
 
 @app.task
-def create_ppt_task(project_id: int, user_id: int) -> None:
+def create_slides_text_content_task(project_id: int, user_id: int, bypass_cache: bool = False) -> list[int]:
+    """ Create text content for all project slides using OpenAI, requests are sent concurrently"""
+
+    user_settings = UserSettings.objects.get(user__id=user_id)
+
+    slides = list(SlideInstructions.objects.select_related('input_spreadsheet__input_workbook').defer(
+        'input_spreadsheet__screenshot', 'input_spreadsheet__input_workbook__content').filter(
+        project__id=project_id))
+
+    prompts = [
+        _build_slide_prompts(user_settings, get_spreadsheet_content(slide.input_spreadsheet),
+                             slide.specific_title, slide.specific_instructions)
+        for slide in slides
+    ]
+
+    def on_answer(index: int, answer: str) -> None:
+        SlideInstructions.objects.filter(id=slides[index].id).update(generated_text=answer)
+        Project.objects.filter(id=project_id).update(slides_generated=F('slides_generated') + 1)
+
+        logger.info('Text content created for slide %s', slides[index].id)
+
+    OpenAIWorker().get_answers_from_gpt(prompts, bypass_cache=bypass_cache, on_answer=on_answer)
+
+    return [slide.id for slide in slides]
+
+
+@app.task
+def create_ppt_task(project_id: int, user_id: int, bypass_cache: bool = False) -> None:
+    """ Start GPT tasks for project slides, PPT task is created by the callback"""
+
+    slides = SlideInstructions.objects.select_related('input_spreadsheet').only(
+        'id', 'specific_title', 'specific_instructions', 'input_spreadsheet__id').filter(
+        project__id=project_id).all()
+
+    Project.objects.filter(id=project_id).update(
+        is_generating=True, slides_generated=0, slides_total=len(slides))
+
+    callback = finalize_ppt_task.s(project_id=project_id, user_id=user_id)
+    errback = fail_ppt_task.s(project_id=project_id)
+
+    if settings.OPENAI_BATCH_GENERATION:
+        pipeline = create_slides_text_content_task.s(project_id, user_id, bypass_cache) | callback
+        pipeline.on_error(errback).apply_async()
+
+        logger.info('GPT batch task started for project %s', project_id)
+        return
+
+    header = [
+        create_slide_text_content_task.s(
+            user_id=user_id,
+            spreadsheet_id=slide.input_spreadsheet.id,
+            slide_id=slide.id,
+            slide_title=slide.specific_title,
+            specific_instructions=slide.specific_instructions,
+            project_id=project_id,
+            bypass_cache=bypass_cache
+        )
+        for slide in slides
+    ]
+
+    chord(header)(callback.on_error(errback))
+
+    logger.info('GPT tasks started for project %s', project_id)
+
+
+@app.task
+def finalize_ppt_task(slide_ids: list[int], project_id: int, user_id: int) -> None:
     """ Create PPT task, when all GPT tasks are finished"""
 
+    logger.info('GPT tasks is already finished for slides %s', slide_ids)
+
     red = get_redis_connection("microservices")
 
     project = Project.objects.get(id=project_id)
@@ -89,25 +213,10 @@ def create_ppt_task(project_id: int, user_id: int) -> None:
     slides = SlideInstructions.objects.select_related(
         'input_spreadsheet').filter(project=project).all()
 
-    tasks = []
-    for slide in slides:
-        task = create_slide_text_content_task.apply_async(
-            kwargs={
-                'user_id': user_id,
-                'spreadsheet_id': slide.input_spreadsheet.id,
-                'slide_id': slide.id,
-                'slide_title': slide.specific_title,
-                'specific_instructions': slide.specific_instructions
-            }
-        )
-        tasks.append(task)
-
-    wait_tasks([task.id for task in tasks])
-
-    logger.info('GPT tasks is already finished')
+    blob_store = get_blob_store()
 
-    slides = SlideInstructions.objects.select_related(
-        'input_spreadsheet').filter(project=project).all()
+    template_content = project.template_content or user_settings.template_content
+    template_layout = project.template_layout if project.template_content else user_settings.template_layout
 
     with transaction.atomic():
         footer = project.footer
@@ -116,7 +225,8 @@ def create_ppt_task(project_id: int, user_id: int) -> None:
             title=project.title,
             subtitle=project.subtitle,
             footer=footer or user_settings.project_instructions,
-            ppt_template=project.template_content or user_settings.template_content,
+            ppt_template_digest=blob_store.put(bytes(template_content)) if template_content else None,
+            template_layout=template_layout,
             extra_data=json.dumps({"project_id": project.id}),
         )
 
@@ -130,8 +240,8 @@ def create_ppt_task(project_id: int, user_id: int) -> None:
                 title=slide.specific_title,
                 ppt_task=microservice_task
             )
-            if slide.slide_option != 2:
-                task_slide.spreadsheet_screenshot = slide.input_spreadsheet.screenshot
+            if slide.slide_option != 2 and slide.input_spreadsheet.screenshot:
+                task_slide.spreadsheet_screenshot_digest = blob_store.put(bytes(slide.input_spreadsheet.screenshot))
 
             bulk_slides.append(task_slide)
 
@@ -139,7 +249,13 @@ def create_ppt_task(project_id: int, user_id: int) -> None:
 
     red.rpush(settings.MICROSERVICES_CREATE_PPT_TASK_QUEUE, microservice_task.id)
 
-    project.is_generating = True
-    project.save()
-
     logger.info('PPT task created with client_id %s', microservice_task.id)
+
+
+@app.task
+def fail_ppt_task(request, exc, traceback, project_id: int) -> None:
+    """ Reset project generating state, when one of GPT tasks is failed"""
+
+    logger.error('GPT task %s failed for project %s: %s', request.id, project_id, exc)
+
+    Project.objects.filter(id=project_id).update(is_generating=False)
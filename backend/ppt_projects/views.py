@@ -5,6 +5,8 @@ from rest_framework import status
 from django.http import HttpResponse
 import json
 
+from microservices_tasks.template_layout import TemplateLayout, TemplateLayoutError, analyze_template
+from microservices_tasks.utils import request_missing_screenshots
 from ppt_projects.models import SlideInstructions, InputWorkbook, Project
 from ppt_projects.tasks import create_ppt_task
 from ppt_projects.serializers import (
@@ -169,20 +171,34 @@ class GenerateProjectPPTView(APIView):
                 return Response({'error': 'No template content available'},
                                 status=status.HTTP_400_BAD_REQUEST)
 
+            # templates uploaded before the layout index are analysed once
+            if TemplateLayout.from_json(project.template_layout) is None:
+                try:
+                    project.template_layout = analyze_template(bytes(project.template_content)).to_json()
+                except TemplateLayoutError as e:
+                    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                project.save(update_fields=['template_layout'])
+
             slides = project.slide_instructions.all()
 
             if not slides:
                 return Response({'error': 'Slides are empty'},
                                 status=status.HTTP_400_BAD_REQUEST)
 
-            for slide in slides:
-                if not slide.input_spreadsheet.screenshot and slide.display_on_slide:
-                    return Response(
-                        {'message': 'Preparing .xlsx files. This may take some time.'},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
+            # only the sheets displayed on slides are rendered, a sheet may have been displayed after the upload
+            missing = {slide.input_spreadsheet.input_workbook_id for slide in slides
+                       if not slide.input_spreadsheet.screenshot and slide.display_on_slide}
+            if missing:
+                for workbook in InputWorkbook.objects.filter(id__in=missing):
+                    request_missing_screenshots(workbook)
+                return Response(
+                    {'message': 'Preparing .xlsx files. This may take some time.'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+
+            bypass_cache = str(request.data.get('bypass_cache', '')).lower() in ('1', 'true')
 
-            create_ppt_task.apply_async(args=(pk, request.user.id))
+            create_ppt_task.apply_async(args=(pk, request.user.id, bypass_cache))
 
             return Response({'message': 'PPT generation started'}, status=status.HTTP_200_OK)
 
@@ -28,15 +28,14 @@ app.conf.task_routes = {
     'accounts.tasks.password_reset_task': QUEUE_ROUTES['mail_notification'],
     'feedback.tasks.feedback_task': QUEUE_ROUTES['mail_notification'],
     'ppt_projects.tasks.create_slide_text_content_task': QUEUE_ROUTES['openai'],
+    'ppt_projects.tasks.create_slides_text_content_task': QUEUE_ROUTES['openai'],
+    'ppt_projects.tasks.extract_workbook_sheets_task': QUEUE_ROUTES['ppt_task_creator'],
     'ppt_projects.tasks.create_ppt_task': QUEUE_ROUTES['ppt_task_creator'],
+    'ppt_projects.tasks.finalize_ppt_task': QUEUE_ROUTES['ppt_task_creator'],
+    'ppt_projects.tasks.fail_ppt_task': QUEUE_ROUTES['ppt_task_creator'],
 }
 
 app.conf.update(
-    task_annotations={
-        'bot.tasks.py.openai_task': {
-            'rate_limit': "500/m"
-        },
-    },
     task_queues=app.conf.task_queues,
     task_routes=app.conf.task_routes,
 )
@@ -218,6 +218,16 @@ EMAIL_FROM = config('EMAIL_FROM', default=EMAIL_HOST_USER)
 
 OPENAI_API_KEY = config('OPENAI_API_KEY')
 OPENAI_MODEL = config('OPENAI_MODEL')
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default=None)
+OPENAI_MAX_RETRIES = config('OPENAI_MAX_RETRIES', cast=int, default=5)
+OPENAI_MAX_CONCURRENCY = config('OPENAI_MAX_CONCURRENCY', cast=int, default=10)
+OPENAI_REQUESTS_PER_MINUTE = config('OPENAI_REQUESTS_PER_MINUTE', cast=int, default=500)
+OPENAI_TOKENS_PER_MINUTE = config('OPENAI_TOKENS_PER_MINUTE', cast=int, default=200000)
+OPENAI_COMPLETION_TOKENS_ESTIMATE = config('OPENAI_COMPLETION_TOKENS_ESTIMATE', cast=int, default=1000)
+OPENAI_BATCH_GENERATION = config('OPENAI_BATCH_GENERATION', cast=bool, default=True)
+OPENAI_SHEET_DATA_MAX_TOKENS = config('OPENAI_SHEET_DATA_MAX_TOKENS', cast=int, default=12000)
+OPENAI_CACHE_TTL = config('OPENAI_CACHE_TTL', cast=int, default=7 * 24 * 3600)
+OPENAI_CACHE_MAX_BYTES = config('OPENAI_CACHE_MAX_BYTES', cast=int, default=64 * 1024 * 1024)
 
 MICROSERVICES_CREATE_SCREENSHOT_TASK_QUEUE = config(
     'MICROSERVICES_CREATE_SCREENSHOT_TASK_QUEUE', default='srv:screenshot:request'
@@ -231,6 +241,17 @@ MICROSERVICES_CREATE_PPT_TASK_QUEUE = config(
 MICROSERVICES_PPT_TASK_RESULT_QUEUE = config(
     'MICROSERVICES_PPT_TASK_RESULT_QUEUE', default='srv:ppt:response:backend'
 )
+MICROSERVICES_RESULT_CONSUMERS = config('MICROSERVICES_RESULT_CONSUMERS', cast=int, default=1)
+MICROSERVICES_TASK_MAX_ATTEMPTS = config('MICROSERVICES_TASK_MAX_ATTEMPTS', cast=int, default=5)
+MICROSERVICES_QUEUE_VISIBILITY_TIMEOUT = config('MICROSERVICES_QUEUE_VISIBILITY_TIMEOUT', cast=int, default=60)
+MICROSERVICES_QUEUE_RETRY_DELAY = config('MICROSERVICES_QUEUE_RETRY_DELAY', cast=int, default=10)
+
+# Blobs of microservices tasks, the same store as composer and screenshots maker: a filesystem location shared
+# with them, or redis backend with the Redis URL as the location (e.g. redis://:password@host:6379/1)
+BLOB_STORE_BACKEND = config('BLOB_STORE_BACKEND', default='filesystem')
+BLOB_STORE_LOCATION = config('BLOB_STORE_LOCATION', default=os.path.join(BASE_DIR, 'blobs'))
+# Blobs no row refers to are deleted by the sweep_blobs command once they are older than this
+BLOB_STORE_SWEEP_GRACE_HOURS = config('BLOB_STORE_SWEEP_GRACE_HOURS', cast=int, default=24)
 
 if not DEBUG:
     LOGGING = {
@@ -0,0 +1,112 @@
+"""
+File system and Redis blob stores
+
+Run from the backend directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import os
+import time
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+from microservices_tasks.blob_store import BlobNotFoundError, BlobStoreNotShared, FileSystemBlobStore, \
+    RedisBlobStore, check_shared
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FileSystemBlobStore(tmp_path)
+
+
+def age(store: FileSystemBlobStore, digest: str, seconds: float):
+    stored_at = time.time() - seconds
+    os.utime(store.path(digest), (stored_at, stored_at))
+
+
+def test_blob_is_stored_once_by_content(store):
+    digest = store.put(b'content')
+
+    assert store.put(b'content') == digest
+    assert store.get(digest) == b'content'
+    assert [blob for blob, _ in store.iter_blobs()] == [digest]
+
+
+def test_delete(store):
+    digest = store.put(b'content')
+
+    assert store.delete(digest)
+    assert not store.exists(digest)
+    assert not store.delete(digest)
+    with pytest.raises(BlobNotFoundError):
+        store.get(digest)
+
+
+def test_sweep_deletes_old_blobs_not_referenced(store):
+    referenced, orphan, recent = store.put(b'referenced'), store.put(b'orphan'), store.put(b'recent')
+    age(store, referenced, 7200)
+    age(store, orphan, 7200)
+
+    assert store.sweep({referenced}, older_than=time.time() - 3600, dry_run=True) == [orphan]
+    assert store.exists(orphan)
+
+    assert store.sweep({referenced}, older_than=time.time() - 3600) == [orphan]
+    assert not store.exists(orphan)
+    assert store.exists(referenced) and store.exists(recent)
+
+
+def test_blob_stored_again_is_not_swept(store):
+    digest = store.put(b'content')
+    age(store, digest, 7200)
+
+    # a new row is about to refer to it
+    store.put(b'content')
+
+    assert store.sweep(set(), older_than=time.time() - 3600) == []
+    assert store.exists(digest)
+
+
+def test_redis_store(monkeypatch):
+    store = RedisBlobStore(fakeredis.FakeRedis())
+    monkeypatch.setattr(time, 'time', lambda: 1_000_000.0)
+
+    digest = store.put(b'content')
+    assert store.put(b'content') == digest
+    assert store.get(digest) == b'content'
+    assert store.exists(digest)
+    assert list(store.iter_blobs()) == [(digest, 1_000_000.0)]
+
+    old = store.put(b'old')
+    monkeypatch.setattr(time, 'time', lambda: 1_000_100.0)
+    store.put(b'content')
+    assert store.sweep(set(), older_than=1_000_050.0) == [old]
+
+    assert store.delete(digest)
+    assert not store.delete(digest)
+    with pytest.raises(BlobNotFoundError):
+        store.get(digest)
+    assert list(store.iter_blobs()) == []
+
+
+def test_services_sharing_the_store_pass_the_check(tmp_path):
+    redis_conn = fakeredis.FakeRedis()
+
+    check_shared(FileSystemBlobStore(tmp_path), redis_conn, 'backend')
+    check_shared(FileSystemBlobStore(tmp_path), redis_conn, 'screenshotsmaker')
+    check_shared(FileSystemBlobStore(tmp_path), redis_conn, 'backend')
+
+
+def test_service_with_another_store_fails_the_check(tmp_path):
+    redis_conn = fakeredis.FakeRedis(decode_responses=True)
+    check_shared(FileSystemBlobStore(tmp_path / 'backend'), redis_conn, 'backend')
+
+    with pytest.raises(BlobStoreNotShared, match='stored by backend'):
+        check_shared(FileSystemBlobStore(tmp_path / 'windows-host'), redis_conn, 'screenshotsmaker')
+
+
+def test_copies_of_the_module_are_in_sync():
+    root = Path(__file__).resolve().parents[2]
+    source = (root / 'backend/microservices_tasks/blob_store.py').read_text()
+    for copy in ('composer/app/services/blob_store.py', 'screenshotsmaker/app/services/blob_store.py'):
+        assert (root / copy).read_text() == source, copy
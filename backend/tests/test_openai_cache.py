@@ -0,0 +1,138 @@
+"""
+GPT answers cache against fakeredis
+
+Run from the backend directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import threading
+
+import fakeredis
+import pytest
+
+import openAI_worker
+from openAI_worker import OpenAIResponseCache
+
+
+class DictCache:
+    """ Django cache API used by the answers cache """
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+    def touch(self, key, timeout=None):
+        return key in self.values
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(openAI_worker.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def redis_conn():
+    return fakeredis.FakeRedis()
+
+
+def new_cache(redis_conn, **kwargs) -> OpenAIResponseCache:
+    options = dict(ttl=3600, max_bytes=100)
+    options.update(kwargs)
+    return OpenAIResponseCache(cache=DictCache(), redis_conn=redis_conn, **options)
+
+
+def test_hit_and_miss(redis_conn, clock):
+    cache = new_cache(redis_conn)
+    digest = cache.make_digest('gpt-test', [{'role': 'user', 'content': 'question'}])
+
+    assert cache.get(digest) is None
+    cache.set(digest, 'answer')
+
+    assert cache.get(digest) == 'answer'
+    assert cache.stats() == {'misses': 1, 'hits': 1, 'bytes': 6, 'entries': 1}
+
+
+def test_least_recently_used_answers_are_evicted_above_max_bytes(redis_conn, clock):
+    cache = new_cache(redis_conn, max_bytes=100)
+    for name in 'abc':
+        clock.now += 1
+        cache.set(name, name * 40)
+    # a was evicted by c, c is used again and b is the least recently used
+    clock.now += 1
+    assert cache.get('a') is None
+    cache.get('c')
+
+    clock.now += 1
+    cache.set('d', 'd' * 40)
+
+    assert cache.get('b') is None
+    assert [cache.get(name) for name in 'cd'] == ['c' * 40, 'd' * 40]
+    assert cache.stats() == {'misses': 2, 'hits': 3, 'bytes': 80, 'entries': 2, 'evictions': 2}
+
+
+def test_expired_answers_are_removed(redis_conn, clock):
+    cache = new_cache(redis_conn, ttl=60)
+    cache.set('a', 'answer')
+
+    clock.now += 61
+    cache.set('b', 'other')
+
+    assert cache.stats()['expired'] == 1
+    assert cache.stats()['bytes'] == 5
+
+
+def test_replaced_answer_is_counted_once(redis_conn, clock):
+    cache = new_cache(redis_conn)
+    cache.set('a', 'answer')
+    cache.set('a', 'longer answer')
+
+    assert cache.stats()['bytes'] == 13
+
+
+def test_concurrent_sets_of_a_digest_are_counted_once(redis_conn, clock):
+    caches = [new_cache(redis_conn, max_bytes=1000) for _ in range(8)]
+    barrier = threading.Barrier(len(caches))
+
+    def set_many(cache: OpenAIResponseCache):
+        barrier.wait()
+        for _ in range(50):
+            cache.set('same', 'answer')
+
+    threads = [threading.Thread(target=set_many, args=(cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert caches[0].stats()['bytes'] == 6
+
+
+def test_drifted_size_is_reset_when_no_entry_is_left(redis_conn, clock):
+    cache = new_cache(redis_conn, max_bytes=100)
+    redis_conn.hset(OpenAIResponseCache.STATS_KEY, 'bytes', 1000)
+
+    cache.set('a', 'answer')
+
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 0
+    cache.set('b', 'answer')
+    assert cache.get('b') == 'answer'
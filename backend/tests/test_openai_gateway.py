@@ -0,0 +1,216 @@
+"""
+OpenAI gateway against a local fake OpenAI HTTP server and fakeredis
+
+Run from the backend directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fakeredis
+import openai
+import pytest
+
+import openai_gateway
+from openai_gateway import OpenAIGateway, RateBudget
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """
+    Chat completions endpoint answering with the user message
+
+    User messages starting with "429" are rate limited on the first attempt, "400" fail
+    and the ones with "slow" are answered after a second.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _FakeOpenAIHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAI
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        content = body['messages'][-1]['content']
+        with self.server.lock:
+            attempt = self.server.requests.count(content)
+            self.server.requests.append(content)
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            time.sleep(1 if 'slow' in content else 0.05)
+            if content.startswith('429') and not attempt:
+                self._reply(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                            {'retry-after-ms': '10'})
+            elif content.startswith('400'):
+                self._reply(400, {'error': {'message': 'Bad request', 'type': 'invalid_request_error'}})
+            else:
+                self._reply(200, {
+                    'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': f'answer: {content}'}}],
+                    'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15},
+                })
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _reply(self, status: int, payload: dict, headers: dict | None = None):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_openai():
+    server = FakeOpenAI()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(openai_gateway.aioredis.Redis, 'from_url',
+                        lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server))
+    # the whole test runs in one budget window
+    monkeypatch.setattr(openai_gateway.time, 'time', lambda: 1_000_020.0)
+    return server
+
+
+def new_gateway(fake_openai: FakeOpenAI, **kwargs) -> OpenAIGateway:
+    options = dict(requests_per_minute=1000, tokens_per_minute=1_000_000, max_concurrency=3, max_retries=2,
+                   completion_tokens_estimate=100)
+    options.update(kwargs)
+    return OpenAIGateway(api_key='test', model='gpt-test', redis_url='redis://fake', base_url=fake_openai.base_url,
+                         **options)
+
+
+def prompt(content: str) -> list[dict]:
+    return [{'role': 'system', 'content': 'system'}, {'role': 'user', 'content': content}]
+
+
+def test_complete_many_is_limited_by_max_concurrency(fake_openai, redis_server):
+    gateway = new_gateway(fake_openai, max_concurrency=3)
+    received = []
+
+    answers = openai_gateway.run(gateway.complete_many([prompt(f'question {i}') for i in range(10)],
+                                                       on_answer=lambda index, answer: received.append(index)))
+
+    assert answers == [f'answer: question {i}' for i in range(10)]
+    assert sorted(received) == list(range(10))
+    assert 1 < fake_openai.max_in_flight <= 3
+
+
+def test_rate_limited_request_is_retried(fake_openai, redis_server):
+    gateway = new_gateway(fake_openai)
+
+    answers = openai_gateway.run(gateway.complete_many([prompt('429 question'), prompt('question')]))
+
+    assert answers == ['answer: 429 question', 'answer: question']
+    assert fake_openai.requests.count('429 question') == 2
+
+
+def test_failed_request_cancels_the_others(fake_openai, redis_server):
+    gateway = new_gateway(fake_openai, max_concurrency=3)
+    received = []
+
+    with pytest.raises(openai.BadRequestError):
+        openai_gateway.run(gateway.complete_many([prompt('slow 1'), prompt('400'), prompt('slow 2')],
+                                                 on_answer=lambda index, answer: received.append(index)))
+
+    # nothing of the failed call is left on the loop to run during the next one
+    assert not asyncio.all_tasks(openai_gateway._loop)
+    openai_gateway.run(asyncio.sleep(1.5))
+    assert received == []
+
+
+def test_answers_are_delivered_to_the_calling_thread_as_they_arrive(fake_openai, redis_server):
+    gateway = new_gateway(fake_openai, max_concurrency=3)
+    progress = []
+
+    for index, answer in openai_gateway.iter_completions(gateway, [prompt('slow 1'), prompt('question'),
+                                                                   prompt('slow 2')]):
+        assert threading.current_thread() is threading.main_thread()
+        progress.append((index, fake_openai.in_flight))
+
+    # the quick answer comes while both slow requests are still in flight
+    assert progress[0] == (1, 2)
+    assert sorted(index for index, _ in progress) == [0, 1, 2]
+
+
+def test_iter_completions_raises_after_the_received_answers(fake_openai, redis_server):
+    gateway = new_gateway(fake_openai, max_concurrency=3)
+    received = []
+
+    with pytest.raises(openai.BadRequestError):
+        for index, answer in openai_gateway.iter_completions(gateway, [prompt('question'), prompt('400 slow')]):
+            received.append(answer)
+
+    assert received == ['answer: question']
+
+
+def test_stopped_iteration_cancels_the_requests(fake_openai, redis_server):
+    gateway = new_gateway(fake_openai, max_concurrency=1)
+    started = time.monotonic()
+
+    for index, answer in openai_gateway.iter_completions(gateway, [prompt('question')] +
+                                                         [prompt(f'slow {i}') for i in range(5)]):
+        break
+
+    # the slow requests are not waited for
+    assert time.monotonic() - started < 1
+    time.sleep(0.2)
+    assert fake_openai.requests in (['question'], ['question', 'slow 0'])
+
+
+def test_gateways_share_the_rate_budget(fake_openai, redis_server):
+    first, second = new_gateway(fake_openai, requests_per_minute=3), new_gateway(fake_openai, requests_per_minute=3)
+
+    openai_gateway.run(first.complete_many([prompt('question 1'), prompt('question 2')]))
+    openai_gateway.run(second.complete(prompt('question 3')))
+
+    # the budget of the window is used up by both gateways, the next request waits for the next window
+    with pytest.raises(asyncio.TimeoutError):
+        openai_gateway.run(asyncio.wait_for(second.complete(prompt('question 4')), timeout=0.5))
+    assert 'question 4' not in fake_openai.requests
+
+
+def test_budget_counts_real_tokens_usage(redis_server):
+    async def scenario():
+        redis_conn = fakeredis.FakeAsyncRedis(server=redis_server)
+        budget = RateBudget(redis_conn, requests_per_minute=10, tokens_per_minute=1000)
+
+        tokens_key = await budget.acquire(600)
+        await budget.adjust(tokens_key, 15 - 600)
+        assert int(await redis_conn.get(tokens_key)) == 15
+
+        # estimate which doesn't fit next to the used tokens waits, but fits into an empty window
+        await budget.acquire(900)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(budget.acquire(900), timeout=0.2)
+
+    openai_gateway.run(scenario())
@@ -0,0 +1,175 @@
+"""
+Reliable queue against fakeredis
+
+Run from the backend directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+from microservices_tasks import reliable_queue
+from microservices_tasks.reliable_queue import ReliableQueue
+
+QUEUE = 'srv:test'
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(reliable_queue.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def redis_conn():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def dead_letters():
+    return []
+
+
+@pytest.fixture
+def queue(redis_conn, clock, dead_letters):
+    return ReliableQueue(redis_conn, QUEUE, visibility_timeout=60, retry_delay=10, max_attempts=3,
+                         on_dead_letter=dead_letters.append)
+
+
+def test_ack_forgets_the_message(queue, redis_conn):
+    queue.push(42)
+
+    message = queue.receive(timeout=1)
+    assert (message.payload, message.attempts) == ('42', 1)
+    assert redis_conn.lrange(queue.processing_key, 0, -1) == [message.envelope]
+
+    queue.ack(message)
+
+    assert queue.requeue_expired() == []
+    assert queue.receive(timeout=1) is None
+    for key in (QUEUE, queue.processing_key, queue.leases_key, queue.attempts_key):
+        assert not redis_conn.exists(key)
+
+
+def test_nacked_message_is_delivered_again_after_retry_delay(queue, clock):
+    queue.push(42)
+    message = queue.receive(timeout=1)
+
+    queue.nack(message)
+
+    clock.now += 5
+    queue.requeue_expired()
+    assert queue.receive(timeout=1) is None
+
+    clock.now += 6
+    queue.requeue_expired()
+    redelivered = queue.receive(timeout=1)
+    assert (redelivered.payload, redelivered.id, redelivered.attempts) == ('42', message.id, 2)
+
+
+def test_message_with_expired_lease_is_delivered_again(queue, clock):
+    queue.push(42)
+    message = queue.receive(timeout=1)
+
+    # heartbeats keep the lease
+    clock.now += 50
+    queue.extend(message)
+    clock.now += 50
+    queue.requeue_expired()
+    assert queue.receive(timeout=1) is None
+
+    # consumer died
+    clock.now += 61
+    queue.requeue_expired()
+    redelivered = queue.receive(timeout=1)
+    assert (redelivered.id, redelivered.attempts) == (message.id, 2)
+
+
+def test_message_is_dead_lettered_after_max_attempts(queue, clock, redis_conn, dead_letters):
+    queue.push(42)
+
+    for attempt in range(1, 4):
+        message = queue.receive(timeout=1)
+        assert message.attempts == attempt
+        queue.nack(message)
+        clock.now += 11
+        queue.requeue_expired()
+
+    assert dead_letters == ['42']
+    assert redis_conn.lrange(queue.dead_key, 0, -1) == ['42']
+    assert queue.receive(timeout=1) is None
+    assert not redis_conn.exists(queue.attempts_key)
+
+
+def test_same_payload_pushed_twice_is_leased_separately(queue, clock):
+    queue.push(42)
+    queue.push(42)
+    first, second = queue.receive(timeout=1), queue.receive(timeout=1)
+    assert first.id != second.id
+    assert (first.attempts, second.attempts) == (1, 1)
+
+    # ack of the first copy keeps the lease of the second one, still being handled
+    queue.ack(first)
+    clock.now += 30
+    queue.extend(second)
+    clock.now += 40
+    queue.requeue_expired()
+    assert queue.receive(timeout=1) is None
+
+    queue.ack(second)
+    clock.now += 120
+    assert queue.requeue_expired() == []
+    assert queue.receive(timeout=1) is None
+
+
+def test_message_of_consumer_crashed_before_leasing_is_delivered_again(queue, clock, redis_conn):
+    queue.push(42)
+    # moved to processing, the consumer died before the lease
+    redis_conn.lmove(QUEUE, queue.processing_key, 'LEFT', 'RIGHT')
+
+    queue.requeue_expired()
+    assert queue.receive(timeout=1) is None
+
+    clock.now += 61
+    queue.requeue_expired()
+    message = queue.receive(timeout=1)
+    assert (message.payload, message.attempts) == ('42', 1)
+
+
+def test_process_acks_handled_and_nacks_failed_messages(queue, clock):
+    queue.push(1)
+    queue.push(2)
+
+    handled = []
+
+    def handler(message):
+        handled.append(message.payload)
+        if message.payload == '2':
+            raise ValueError('failed')
+
+    assert queue.process(handler, timeout=1)
+    assert queue.process(handler, timeout=1)
+    assert not queue.process(handler, timeout=1)
+
+    clock.now += 11
+    queue.requeue_expired()
+    assert queue.receive(timeout=1).payload == '2'
+    assert handled == ['1', '2']
+
+
+def test_copies_of_the_module_are_in_sync():
+    root = Path(__file__).resolve().parents[2]
+    source = (root / 'backend/microservices_tasks/reliable_queue.py').read_text()
+    for copy in ('composer/app/services/reliable_queue.py', 'screenshotsmaker/app/services/reliable_queue.py'):
+        assert (root / copy).read_text() == source, copy
@@ -0,0 +1,53 @@
+"""
+Text encoding of workbook sheets
+
+Run from the backend directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+from openpyxl import Workbook
+
+from xlsx_worker import encode_sheet
+
+
+def new_sheet(rows: int):
+    sheet = Workbook().active
+    sheet.title = 'Sales'
+    sheet.append(['Region', None, None, 'Sales'])
+    for row in range(rows):
+        sheet.append([f'Region {row}', None, None, row * 1.5])
+    return sheet
+
+
+def test_rows_are_encoded():
+    lines = list(encode_sheet(new_sheet(2)))
+
+    assert lines[0] == '# sheet "Sales", 3 rows, columns A-D'
+    assert lines[2:] == ['1|Region|~2|Sales', '2|Region 0|~2|0', '3|Region 1|~2|1.5']
+
+
+def test_rows_over_the_budget_are_truncated():
+    sheet = new_sheet(1000)
+    lines = list(encode_sheet(sheet, max_bytes=1000))
+
+    assert sum(len(line.encode()) + 1 for line in lines) <= 1000
+    assert lines[-1].startswith('# truncated: rows ')
+    assert lines[-1].endswith(f' to {sheet.max_row} are omitted to fit 1000 bytes')
+    first_omitted = int(lines[-2].split('|')[0]) + 1
+    assert lines[-1].startswith(f'# truncated: rows {first_omitted} to')
+
+
+def test_truncation_does_not_read_the_rest_of_the_sheet():
+    sheet = new_sheet(1000)
+    rows_read = 0
+    iter_rows = sheet.iter_rows
+
+    def counting_iter_rows(*args, **kwargs):
+        nonlocal rows_read
+        for row in iter_rows(*args, **kwargs):
+            rows_read += 1
+            yield row
+
+    sheet.iter_rows = counting_iter_rows
+    list(encode_sheet(sheet, max_bytes=1000))
+
+    assert rows_read < 100
@@ -0,0 +1,102 @@
+"""
+Fingerprints of workbook sheets
+
+Run from the backend directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import io
+
+from openpyxl import Workbook
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import Font
+
+from xlsx_worker import get_workbook_sheet_fingerprints
+
+
+def new_workbook() -> Workbook:
+    workbook = Workbook()
+    first = workbook.active
+    first.title = 'First'
+    first.append(['Region', 'Sales'])
+    first.append(['East', 10])
+    second = workbook.create_sheet('Second')
+    second.append(['Product', 'Units'])
+    second.append(['Apples', 5])
+    second.append(['Pears', 7])
+    return workbook
+
+
+def fingerprints(workbook: Workbook) -> dict[str, str]:
+    output = io.BytesIO()
+    workbook.save(output)
+    return get_workbook_sheet_fingerprints(output.getvalue())
+
+
+def add_chart(sheet, title: str):
+    chart = BarChart()
+    chart.title = title
+    chart.add_data(Reference(sheet, min_col=2, min_row=1, max_row=3), titles_from_data=True)
+    sheet.add_chart(chart, 'D2')
+
+
+def test_same_content_has_same_fingerprints():
+    before = fingerprints(new_workbook())
+
+    assert list(before) == ['First', 'Second']
+    assert fingerprints(new_workbook()) == before
+    assert before['First'] != before['Second']
+
+
+def test_new_shared_string_changes_only_its_sheet():
+    before = fingerprints(new_workbook())
+
+    workbook = new_workbook()
+    # written first, the new string shifts the shared string indexes of the second sheet
+    workbook['First']['C1'] = 'Notes'
+    after = fingerprints(workbook)
+
+    assert after['First'] != before['First']
+    assert after['Second'] == before['Second']
+
+
+def test_reused_shared_string_changes_only_its_sheet():
+    before = fingerprints(new_workbook())
+
+    workbook = new_workbook()
+    # the string is shared with the second sheet
+    workbook['First']['A3'] = 'Apples'
+    after = fingerprints(workbook)
+
+    assert after['First'] != before['First']
+    assert after['Second'] == before['Second']
+
+
+def test_style_change_changes_every_sheet():
+    before = fingerprints(new_workbook())
+
+    workbook = new_workbook()
+    workbook['First']['B2'].font = Font(b=True)
+    after = fingerprints(workbook)
+
+    assert after['First'] != before['First']
+    assert after['Second'] != before['Second']
+
+
+def test_chart_changes_only_its_sheet():
+    workbook = new_workbook()
+    add_chart(workbook['Second'], 'Units')
+    with_chart = fingerprints(workbook)
+
+    before = fingerprints(new_workbook())
+    assert with_chart['Second'] != before['Second']
+    assert with_chart['First'] == before['First']
+
+    workbook = new_workbook()
+    add_chart(workbook['Second'], 'Units sold')
+    retitled = fingerprints(workbook)
+    assert retitled['Second'] != with_chart['Second']
+    assert retitled['First'] == with_chart['First']
+
+
+def test_invalid_file_has_no_fingerprints():
+    assert get_workbook_sheet_fingerprints(b'not a workbook') == {}
@@ -0,0 +1,94 @@
+"""
+Template layout index
+
+Run from the backend directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import io
+import json
+from pathlib import Path
+
+import pytest
+from pptx import Presentation
+from pptx.util import Inches
+
+from microservices_tasks.template_layout import TemplateLayout, TemplateLayoutError, analyze_template
+
+
+def make_template() -> bytes:
+    presentation = Presentation()
+    title_slide = presentation.slides.add_slide(presentation.slide_layouts[0])
+    title_slide.shapes.title.text = 'Title'
+    presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = 'Slide title'
+    # blank slide, the first text box is the title
+    blank = presentation.slides.add_slide(presentation.slide_layouts[6])
+    blank.shapes.add_textbox(Inches(1), Inches(0.5), Inches(8), Inches(1)).text_frame.text = 'Heading'
+
+    output = io.BytesIO()
+    presentation.save(output)
+    return output.getvalue()
+
+
+def test_analyze_template():
+    layout = analyze_template(make_template())
+
+    assert (layout.slide_width, layout.slide_height, layout.slide_count) == (9144000, 6858000, 3)
+    first, second, blank = layout.slides
+    assert first.title is not None and first.subtitle is not None
+    assert second.title is not None and second.subtitle is None
+    assert blank.title is None
+    assert (blank.textbox.left, blank.textbox.top, blank.textbox.bottom) == (914400, 457200, 1371600)
+    # added slides are copies of the last one
+    assert layout.slide(10) is blank
+
+
+def test_index_round_trip():
+    layout = analyze_template(make_template())
+
+    assert TemplateLayout.from_json(layout.to_json()) == layout
+
+
+@pytest.mark.parametrize('content', [b'', b'not a presentation'])
+def test_invalid_template_is_rejected(content):
+    with pytest.raises(TemplateLayoutError):
+        analyze_template(content)
+
+
+def test_template_without_slides_is_rejected():
+    output = io.BytesIO()
+    Presentation().save(output)
+
+    with pytest.raises(TemplateLayoutError):
+        analyze_template(output.getvalue())
+
+
+def layout_data() -> dict:
+    return json.loads(analyze_template(make_template()).to_json())
+
+
+def without(data: dict, name: str) -> dict:
+    data.pop(name)
+    return data
+
+
+@pytest.mark.parametrize('value', [
+    None,
+    '',
+    '{"version": 1, "slide_width"',
+    '[]',
+    '"layout"',
+    json.dumps({**layout_data(), 'version': 0}),
+    json.dumps(without(layout_data(), 'slide_height')),
+    json.dumps({**layout_data(), 'slides': []}),
+    json.dumps({**layout_data(), 'slides': [{'title': {'id': 2}}]}),
+    json.dumps({**layout_data(), 'slides': [{'unknown': None}]}),
+    json.dumps({**layout_data(), 'slide_width': 'wide'}),
+])
+def test_missing_outdated_or_malformed_index_is_analysed_again(value):
+    assert TemplateLayout.from_json(value) is None
+
+
+def test_copies_of_the_module_are_in_sync():
+    root = Path(__file__).resolve().parents[2]
+    source = (root / 'backend/microservices_tasks/template_layout.py').read_text()
+    assert (root / 'composer/app/services/template_layout.py').read_text() == source
@@ -1,8 +1,31 @@
 import io
+import re
+import hashlib
+import zipfile
+import datetime
+import posixpath
+from typing import Iterator
+from xml.etree import ElementTree
 
 from openpyxl import load_workbook
 from openpyxl.utils.cell import get_column_letter
 
+CELL_DELIMITER = '|'
+EMPTY_CELLS_MARK = '~'
+BYTES_PER_TOKEN = 4
+
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# Workbook parts which change the look of every sheet
+_SHARED_PART_TYPES = ('/styles', '/theme')
+
+_SHARED_STRING_RE = re.compile(rb'<(?:\w+:)?si(?:\s*/>|[\s>].*?</(?:\w+:)?si>)', re.DOTALL)
+_SHARED_STRING_CELL_RE = re.compile(rb'<(?:\w+:)?c\b[^>]*?\bt="s"[^>]*>\s*<(?:\w+:)?v>(\d+)<')
+
+# Space kept free for the truncation line, so the whole text fits the budget
+_SUMMARY_RESERVE = 160
+
 
 def get_workbook_sheet_names(file_bytes: bytes) -> list[str]:
     """ Get workbook sheet names """
@@ -15,6 +38,22 @@ def get_workbook_sheet_names(file_bytes: bytes) -> list[str]:
     return sheet_names
 
 
+def get_workbook_sheet_fingerprints(file_bytes: bytes) -> dict[str, str]:
+    """
+    Get fingerprints of the workbook sheets, a sheet looks the same while its fingerprint is the same
+
+    The fingerprint covers the sheet XML with the parts it refers to (drawings, charts, images),
+    the shared strings used by the sheet and the styles and theme of the workbook.
+    The workbook is read as a zip, no cells are parsed. Returns an empty dict for invalid files.
+    """
+
+    try:
+        with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
+            return _get_sheet_fingerprints(archive)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+        return {}
+
+
 def get_workbook_sheet_data(file_bytes: bytes, sheet_name: str) -> dict:
     """ Get workbook sheet data """
 
@@ -33,3 +72,186 @@ def get_workbook_sheet_data(file_bytes: bytes, sheet_name: str) -> dict:
             result.update({f"{get_column_letter(cell_index)}{index}": cell.value})
 
     return result
+
+
+def get_workbook_sheet_text(file_bytes: bytes, sheet_name: str, *,
+                            max_bytes: int | None = None, max_tokens: int | None = None) -> str:
+    """ Get workbook sheet data encoded as compact table """
+
+    file_stream = io.BytesIO(file_bytes)
+    workbook = load_workbook(file_stream, read_only=True, data_only=True)
+
+    return '\n'.join(encode_sheet(workbook[sheet_name], max_bytes=max_bytes, max_tokens=max_tokens))
+
+
+def get_workbook_sheets_text(file_bytes: bytes, *,
+                             max_bytes: int | None = None, max_tokens: int | None = None) -> dict[str, str]:
+    """ Get data of all workbook sheets encoded as compact tables, loading the workbook only once """
+
+    file_stream = io.BytesIO(file_bytes)
+    workbook = load_workbook(file_stream, read_only=True, data_only=True)
+
+    return {
+        sheet_name: '\n'.join(encode_sheet(workbook[sheet_name], max_bytes=max_bytes, max_tokens=max_tokens))
+        for sheet_name in workbook.sheetnames
+    }
+
+
+def encode_sheet(sheet, *, max_bytes: int | None = None, max_tokens: int | None = None) -> Iterator[str]:
+    """
+    Encode sheet as header lines followed by one delimited line per non-empty row
+
+    Row line is "<row number>|<A>|<B>|...", missing row numbers are empty rows,
+    "~N" stands for N empty cells and trailing empty cells are dropped.
+    Rows that don't fit into the budget are replaced with a single truncation line.
+    """
+
+    budget = _get_budget(max_bytes, max_tokens)
+    used = 0
+
+    for line in _encode_header(sheet):
+        used += len(line.encode()) + 1
+        yield line
+
+    for row_index, values in _iter_non_empty_rows(sheet):
+        line = f'{row_index}{CELL_DELIMITER}{_encode_row(values)}'
+        size = len(line.encode()) + 1
+
+        if budget is not None and used + size > budget - _SUMMARY_RESERVE:
+            # the dimensions are used instead of reading the rest of the sheet
+            last_row_index = max(sheet.max_row or row_index, row_index)
+            yield f'# truncated: rows {row_index} to {last_row_index} are omitted to fit {budget} bytes'
+            return
+
+        used += size
+        yield line
+
+
+def _get_budget(max_bytes: int | None, max_tokens: int | None) -> int | None:
+    budgets = []
+    if max_bytes:
+        budgets.append(max_bytes)
+    if max_tokens:
+        budgets.append(max_tokens * BYTES_PER_TOKEN)
+    return min(budgets) if budgets else None
+
+
+def _encode_header(sheet) -> list[str]:
+    title = f'# sheet "{sheet.title}"'
+    # dimensions are unknown when the workbook was saved without them
+    if sheet.max_row and sheet.max_column and sheet.max_row > 1:
+        title += f', {sheet.max_row} rows, columns A-{get_column_letter(sheet.max_column)}'
+
+    return [
+        title,
+        f'# row{CELL_DELIMITER}A{CELL_DELIMITER}B{CELL_DELIMITER}...; '
+        f'"{EMPTY_CELLS_MARK}N" is N empty cells, missing rows are empty',
+    ]
+
+
+def _iter_non_empty_rows(sheet) -> Iterator[tuple[int, tuple]]:
+    for row_index, values in enumerate(sheet.iter_rows(values_only=True), 1):
+        for value in values:
+            if value is not None and value != '':
+                yield row_index, values
+                break
+
+
+def _encode_row(values: tuple) -> str:
+    parts = []
+    empty = 0
+
+    for value in values:
+        if value is None or value == '':
+            empty += 1
+            continue
+        if empty == 1:
+            parts.append('')
+        elif empty:
+            parts.append(f'{EMPTY_CELLS_MARK}{empty}')
+        empty = 0
+        parts.append(_encode_value(value))
+
+    return CELL_DELIMITER.join(parts)
+
+
+def _encode_value(value) -> str:
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ') if value.time() != datetime.time() else value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+
+    text = str(value).strip()
+    text = text.replace('\\', '\\\\').replace(CELL_DELIMITER, f'\\{CELL_DELIMITER}')
+    text = ' '.join(text.splitlines())
+    if text.startswith(EMPTY_CELLS_MARK):
+        text = f'\\{text}'
+
+    return text
+
+
+def _get_sheet_fingerprints(archive: zipfile.ZipFile) -> dict[str, str]:
+    workbook_rels = _read_rels(archive, 'xl/workbook.xml')
+
+    shared = hashlib.sha1()
+    shared_strings = []
+    for rel_type, target in sorted(workbook_rels.values()):
+        if rel_type.endswith(_SHARED_PART_TYPES):
+            shared.update(target.encode() + b'\0' + archive.read(target))
+        elif rel_type.endswith('/sharedStrings'):
+            shared_strings = _SHARED_STRING_RE.findall(archive.read(target))
+
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    fingerprints = {}
+    for sheet in workbook.iter(f'{_MAIN_NS}sheet'):
+        _, target = workbook_rels[sheet.get(f'{_REL_NS}id')]
+        digest = shared.copy()
+        for part in _iter_related_parts(archive, target):
+            content = archive.read(part)
+            digest.update(part.encode() + b'\0' + content)
+            # strings are hashed by value, adding a string to another sheet changes no indexes here
+            for index in _SHARED_STRING_CELL_RE.findall(content):
+                index = int(index)
+                digest.update(shared_strings[index] if index < len(shared_strings) else b'')
+        fingerprints[sheet.get('name')] = digest.hexdigest()
+
+    return fingerprints
+
+
+def _iter_related_parts(archive: zipfile.ZipFile, part: str) -> Iterator[str]:
+    """ Part followed by all parts it refers to, directly or through other parts """
+
+    seen = set()
+    pending = [part]
+    while pending:
+        part = pending.pop()
+        if part in seen or part not in archive.NameToInfo:
+            continue
+        seen.add(part)
+        yield part
+        pending.extend(sorted(target for _, target in _read_rels(archive, part).values()))
+
+
+def _read_rels(archive: zipfile.ZipFile, part: str) -> dict[str, tuple[str, str]]:
+    """ Relationships of the part: id -> (type, target part), external targets are skipped """
+
+    directory, name = posixpath.split(part)
+    rels_part = posixpath.join(directory, '_rels', f'{name}.rels')
+    if rels_part not in archive.NameToInfo:
+        return {}
+
+    rels = {}
+    for rel in ElementTree.fromstring(archive.read(rels_part)).iter(f'{_PACKAGE_REL_NS}Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(directory, target))
+        rels[rel.get('Id')] = (rel.get('Type'), target)
+    return rels
@@ -1,8 +1,16 @@
+import threading
+from typing import Callable
+
 import redis
 from redis import Redis
 
 from app.config import settings
 from app.services.presentation_composer import PresentationComposer
+from app.services.blob_store import BlobStore, create_blob_store
+from app.services.reliable_queue import ReliableQueue
+from app.services.slide_cache import SlideScreenshotsCache
+from app.services.template_cache import TemplateCache
+from app.services.xml_composer import XmlPresentationComposer
 
 
 def new_redis_client() -> Redis:
@@ -17,6 +25,46 @@ def new_redis_client() -> Redis:
     )
 
 
+def new_reliable_queue(redis_conn: Redis, name: str,
+                       on_dead_letter: Callable[[str], None] | None = None) -> ReliableQueue:
+    """ Create a new instance of ReliableQueue """
+    return ReliableQueue(
+        redis_conn, name,
+        visibility_timeout=settings.QUEUE_VISIBILITY_TIMEOUT,
+        retry_delay=settings.QUEUE_RETRY_DELAY,
+        max_attempts=settings.QUEUE_MAX_ATTEMPTS,
+        on_dead_letter=on_dead_letter,
+    )
+
+
 def new_presentation_composer() -> PresentationComposer:
     """Create a new instance of PresentationComposer"""
-    return PresentationComposer()
+    composer_class = XmlPresentationComposer if settings.COMPOSER_ENGINE == "xml" else PresentationComposer
+    return composer_class(template_cache=get_template_cache(), image_dpi=settings.COMPOSER_IMAGE_DPI)
+
+
+_template_cache: TemplateCache | None = None
+_template_cache_lock = threading.Lock()
+
+
+def get_template_cache() -> TemplateCache | None:
+    """ Parsed templates cache shared by the process, None if the cache is disabled """
+    global _template_cache
+    if not settings.TEMPLATE_CACHE_SIZE_MB:
+        return None
+    with _template_cache_lock:
+        if _template_cache is None:
+            _template_cache = TemplateCache(max_size=settings.TEMPLATE_CACHE_SIZE_MB * 1024 * 1024)
+        return _template_cache
+
+
+def new_blob_store() -> BlobStore:
+    """ Create a new instance of BlobStore """
+    return create_blob_store(settings.BLOB_STORE_BACKEND, settings.BLOB_STORE_LOCATION)
+
+
+def new_slide_screenshots_cache(redis_conn: Redis) -> SlideScreenshotsCache | None:
+    """ Create a new instance of SlideScreenshotsCache, None if the cache is disabled """
+    if not settings.SCREENSHOT_SLIDE_CACHE_TTL:
+        return None
+    return SlideScreenshotsCache(redis_conn, ttl=settings.SCREENSHOT_SLIDE_CACHE_TTL)
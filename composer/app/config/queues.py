@@ -2,8 +2,5 @@
 QUEUE_PPT_REQUEST = "srv:ppt:request"
 QUEUE_PPT_RESPONSE = "srv:ppt:response:%s"
 
-QUEUE_PPT_DUP_REQUEST = "srv:ppt-dup:request"
-QUEUE_PPT_DUP_RESPONSE = "srv:ppt-dup:response:%s"
-
 QUEUE_SCREENSHOT_REQUEST = "srv:screenshot:request"
 QUEUE_SCREENSHOT_RESPONSE = "srv:screenshot:response:%s"
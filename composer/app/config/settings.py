@@ -53,6 +53,33 @@ REDIS_PORT = config("REDIS_PORT", cast=int, default=6379)
 REDIS_DB = config("REDIS_DB", cast=int, default=0)
 REDIS_PASSWORD = config("REDIS_PASSWORD", default=None)
 
+# Reliable queues settings
+QUEUE_VISIBILITY_TIMEOUT = config("QUEUE_VISIBILITY_TIMEOUT", cast=int, default=60)
+QUEUE_RETRY_DELAY = config("QUEUE_RETRY_DELAY", cast=int, default=10)
+QUEUE_MAX_ATTEMPTS = config("QUEUE_MAX_ATTEMPTS", cast=int, default=5)
+
+# Blob store settings, the same store as backend and screenshots maker: a filesystem location shared with them,
+# or redis backend with the Redis URL as the location (e.g. redis://:password@host:6379/1)
+BLOB_STORE_BACKEND = config("BLOB_STORE_BACKEND", default="filesystem")
+BLOB_STORE_LOCATION = config("BLOB_STORE_LOCATION", default="data/blobs")
+
+# Screenshots of the composed slides, width in pixels, empty keeps the size rendered by the screenshots maker
+SCREENSHOT_SLIDE_WIDTH = config("SCREENSHOT_SLIDE_WIDTH", default=None, cast=lambda v: int(v) if v else None)
+# Screenshots of unchanged slides are reused for this many seconds, 0 renders every slide again
+SCREENSHOT_SLIDE_CACHE_TTL = config("SCREENSHOT_SLIDE_CACHE_TTL", cast=int, default=30 * 24 * 3600)
+
+# Parsed templates kept in memory, megabytes of unpacked templates, 0 parses the template for every presentation
+TEMPLATE_CACHE_SIZE_MB = config("TEMPLATE_CACHE_SIZE_MB", cast=int, default=256)
+# Screenshots are resampled to the size they are placed at on the slides, pixels per inch, 0 embeds them as they are
+COMPOSER_IMAGE_DPI = config("COMPOSER_IMAGE_DPI", cast=int, default=150)
+# Composition engine: xml builds the added slides and shapes from XML templates, pptx through the python-pptx objects
+COMPOSER_ENGINE = config("COMPOSER_ENGINE", default="xml")
+
+# Processes composing presentations, 0 composes in the PPT worker threads
+COMPOSER_PROCESSES = config("COMPOSER_PROCESSES", cast=int, default=os.cpu_count() or 1)
+# PPT requests processed at once, further requests wait in the queue
+COMPOSER_MAX_IN_FLIGHT = config("COMPOSER_MAX_IN_FLIGHT", cast=int, default=os.cpu_count() or 1)
+
 # Database settings
 DATABASE_DRIVER = config("DATABASE_DRIVER", default="postgresql")
 DATABASE_HOST = config("DATABASE_HOST", default="localhost")
@@ -0,0 +1,120 @@
+"""
+Presentation composition in worker processes
+
+Composition is CPU bound python-pptx work, which holds the GIL, so presentations are
+composed in a pool of spawned processes. Jobs and results carry blob digests: the template,
+the sheet screenshots and the composed presentation go through the shared blob store and
+are never pickled between the processes. Every worker process keeps own parsed templates cache.
+
+The executor doesn't bound the jobs: the PPT worker threads, COMPOSER_MAX_IN_FLIGHT of them,
+compose one presentation each at a time, the pool queues what its processes can't take yet.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from app.config import settings
+from app.config.factories import new_blob_store, new_presentation_composer
+from app.services.blob_store import BlobStore
+from app.services.presentation_composer import SlideData
+from app.services.template_layout import TemplateLayout
+
+logger = logging.getLogger("app:composition-executor")
+
+
+@dataclass(frozen=True)
+class SlideJob:
+    title: str
+    content: str
+    image_digest: str | None
+    option: int
+
+
+@dataclass(frozen=True)
+class ComposeJob:
+    template_digest: str
+    title: str
+    subtitle: str | None
+    footer: str | None
+    slides: tuple[SlideJob, ...]
+    layout: str | None = None
+
+
+class CompositionExecutor:
+
+    def __init__(self, *, processes: int):
+        """
+        :param processes: worker processes, 0 composes in the calling thread
+        """
+        super().__init__()
+        self._processes = processes
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+
+    def compose(self, job: ComposeJob) -> str:
+        """ :return: digest of the composed presentation, errors of the composition are raised """
+        if not self._processes:
+            return compose_job(job)
+
+        pool = self._get_pool()
+        try:
+            return pool.submit(compose_job, job).result()
+        except BrokenProcessPool:
+            # a worker process has died, the pool is started again for the next jobs
+            self._discard_pool(pool)
+            raise
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._processes,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"Started composition pool of {self._processes} processes")
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+_blob_store: BlobStore | None = None
+
+
+def compose_job(job: ComposeJob) -> str:
+    """ Compose the presentation of the job, runs in a worker process """
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = new_blob_store()
+
+    slides = [SlideData(title=slide.title, content=slide.content, option=slide.option,
+                        image=_blob_store.read(slide.image_digest))
+              for slide in job.slides]
+    presentation = new_presentation_composer().compose(
+        _blob_store.get(job.template_digest), job.title, job.subtitle, job.footer, slides,
+        template_digest=job.template_digest, layout=TemplateLayout.from_json(job.layout))
+    return _blob_store.put(presentation)
+
+
+_executor: CompositionExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_composition_executor() -> CompositionExecutor:
+    """ Get composition executor shared by the PPT workers of this process """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = CompositionExecutor(processes=settings.COMPOSER_PROCESSES)
+        return _executor
@@ -0,0 +1,92 @@
+"""
+Images embedded into the composed presentations
+
+Screenshots are rendered for large screens and a slide shows them a few inches wide, so every
+image is resampled to the size it is placed at, for the configured DPI, before it is embedded.
+An image placed on several slides is resampled once, to its largest placed size, and embedded
+once: python-pptx shares the parts of identical images.
+"""
+
+import hashlib
+import io
+import math
+import struct
+from dataclasses import dataclass
+
+from PIL import Image
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_EMU_PER_INCH = 914400
+
+
+@dataclass
+class _Source:
+    image: bytes
+    width: int
+    height: int
+    # pixels of the largest placement
+    target_width: int = 0
+    target_height: int = 0
+    prepared: bytes | None = None
+
+
+def image_size(image: bytes) -> tuple[int, int]:
+    """ :return: width and height in pixels, read from the PNG header without decoding the image """
+    if image[:8] == _PNG_SIGNATURE and image[12:16] == b"IHDR":
+        return struct.unpack(">II", image[16:24])
+    with Image.open(io.BytesIO(image)) as img:
+        return img.size
+
+
+class ImagePreparer:
+    """ Images of a presentation, add the placements first, then get the prepared images """
+
+    def __init__(self, *, dpi: int = 150):
+        """
+        :param dpi: pixels per inch of the placed images, 0 embeds the images as they are
+        """
+        super().__init__()
+        self._dpi = dpi
+        self._sources: dict[bytes, _Source] = {}
+
+    def size(self, image: bytes) -> tuple[int, int]:
+        return self._source(image).width, self._source(image).height
+
+    def place(self, image: bytes, width: int, height: int):
+        """ Register a placement of the image, width and height in EMU """
+        source = self._source(image)
+        source.target_width = max(source.target_width, math.ceil(width * self._dpi / _EMU_PER_INCH))
+        source.target_height = max(source.target_height, math.ceil(height * self._dpi / _EMU_PER_INCH))
+
+    def prepared(self, image: bytes) -> bytes:
+        """ :return: the image resampled to its largest placement, the same bytes for every placement """
+        source = self._source(image)
+        if source.prepared is None:
+            source.prepared = self._resample(source)
+        return source.prepared
+
+    def _source(self, image: bytes) -> _Source:
+        key = hashlib.sha1(image).digest()
+        if key not in self._sources:
+            self._sources[key] = _Source(image, *image_size(image))
+        return self._sources[key]
+
+    def _resample(self, source: _Source) -> bytes:
+        # images are only scaled down, keeping their ratio
+        scale = max(source.target_width / source.width, source.target_height / source.height)
+        if not self._dpi or scale >= 1:
+            return source.image
+
+        with Image.open(io.BytesIO(source.image)) as img:
+            image_format = img.format if img.format in ("PNG", "JPEG") else "PNG"
+            if img.mode in ("1", "P"):
+                # palette images would be resized with the nearest neighbour
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            resampled = img.resize((max(round(source.width * scale), 1), max(round(source.height * scale), 1)),
+                                   Image.LANCZOS)
+        output = io.BytesIO()
+        if image_format == "JPEG":
+            resampled.save(output, format="JPEG", quality=90)
+        else:
+            resampled.save(output, format="PNG")
+        return output.getvalue()
@@ -3,12 +3,14 @@ import logging
 import magic
 from redis import Redis
 
-from app.config import queues
+from app.config import queues, settings
 from app.config.database import new_session
-from app.config.factories import new_redis_client
+from app.config.factories import new_redis_client, new_blob_store
 from app.models.models import TasksStatus, CreatePPTTasks, CreatePPTTasksSlides
-from app.services.presentation_composer import PresentationComposer, SlideData
+from app.services.composition_executor import ComposeJob, SlideJob, get_composition_executor
+from app.services.screenshot_request import ScreenshotRequest, VERSION
 from app.services.screenshots_service import ScreenshotsService
+from app.services.template_layout import TemplateLayoutError
 
 logger = logging.getLogger("app:ppt-service")
 
@@ -17,13 +19,22 @@ class PptService:
     def __init__(self, *, redis_conn: Redis = None):
         super().__init__()
         self._redis_conn = redis_conn or new_redis_client()
+        self._blob_store = new_blob_store()
 
     def create_ppt(self, task_id: int):
-        try:
-            self._create_ppt(task_id)
-        except Exception as e:
-            logger.exception(f"Failed to create presentation for {task_id}")
-            self._set_status_if_pending(task_id, TasksStatus.FAILED, f"Error: {e}")
+        """ Errors are raised, so the message is delivered again by the queue """
+        self._create_ppt(task_id)
+
+    def fail_ppt(self, task_id: int, message: str):
+        """ Give up on the task and notify the client """
+        self._set_status_if_pending(task_id, TasksStatus.FAILED, message)
+        with new_session() as session:
+            task = session.query(CreatePPTTasks).filter(CreatePPTTasks.id == task_id).first()
+            if not task:
+                return
+            session.expunge(task)
+        logger.error(f"Failed to create presentation for {task_id}: {message}")
+        self._notify_task_is_done(task)
 
     def _create_ppt(self, task_id: int):
         with new_session() as session:
@@ -50,44 +61,65 @@ class PptService:
                 self._notify_task_is_done(task)
                 return
 
-            if not task.ppt_template:
+            if not task.ppt_template_digest and not task.ppt_template:
                 self._set_status_if_pending(task_id, TasksStatus.FAILED, "No template")
                 self._notify_task_is_done(task)
                 return
 
-        if self._is_filetype_pptx(task):
-            self._process_pptx(task, slides)
-        elif self._is_filetype_ppt(task):
+        ppt_template = self._blob_store.read(task.ppt_template_digest, task.ppt_template)
+
+        if self._is_filetype_pptx(ppt_template):
+            self._process_pptx(task, ppt_template, slides)
+        elif self._is_filetype_ppt(ppt_template):
             self._set_status_if_pending(task_id, TasksStatus.FAILED, "Old PPT format is not supported")
         else:
             self._set_status_if_pending(task_id, TasksStatus.FAILED, "Unknown file type")
 
-    def _process_pptx(self, task: CreatePPTTasks, slides: list[CreatePPTTasksSlides]):
-        composer = PresentationComposer()
-        slide_data = [
-            SlideData(content=slide.content, image=slide.spreadsheet_screenshot, title=slide.title, option=slide.slide_option)
-            for slide in slides]
-        presentation = composer.compose(task.created_ppt_content, task.title, task.subtitle, task.footer, slide_data)
+    def _process_pptx(self, task: CreatePPTTasks, ppt_template: bytes, slides: list[CreatePPTTasksSlides]):
+        # the composition process reads the template and the images from the blob store, legacy rows are stored there
+        job = ComposeJob(
+            template_digest=task.ppt_template_digest or self._blob_store.put(ppt_template),
+            title=task.title, subtitle=task.subtitle, footer=task.footer,
+            slides=tuple(SlideJob(title=slide.title, content=slide.content, option=slide.slide_option,
+                                  image_digest=self._get_image_digest(slide))
+                         for slide in slides),
+            layout=task.template_layout)
+        try:
+            presentation_digest = get_composition_executor().compose(job)
+        except TemplateLayoutError as e:
+            self._set_status_if_pending(task.id, TasksStatus.FAILED, str(e))
+            self._notify_task_is_done(task)
+            return
+        presentation = self._blob_store.get(presentation_digest)
         task_id = None
         with new_session() as session:
             t = session.query(CreatePPTTasks).filter(CreatePPTTasks.id == task.id).first()
             if t:
                 # hint the correct type
                 t: CreatePPTTasks = t
-                t.created_ppt_content = presentation
+                t.created_ppt_content = None
+                t.created_ppt_content_digest = presentation_digest
                 t.status_message = "Presentation created"
                 task_id = t.id
             session.commit()
 
         if task_id:
-            self._request_screenshots(task_id, presentation)
-
-    def _is_filetype_pptx(self, task: CreatePPTTasks):
-        ppt_template = task.ppt_template
+            # the first slide and the composed ones, the template may have more slides which aren't shown;
+            # the composed presentation has at least len(slides) + 1 slides
+            positions = sorted({0} | {slide.position for slide in slides if slide.position <= len(slides)})
+            self._request_screenshots(task_id, presentation, presentation_digest, positions)
+
+    def _get_image_digest(self, slide: CreatePPTTasksSlides) -> str | None:
+        if slide.spreadsheet_screenshot_digest:
+            return slide.spreadsheet_screenshot_digest
+        if slide.spreadsheet_screenshot:
+            return self._blob_store.put(slide.spreadsheet_screenshot)
+        return None
+
+    def _is_filetype_pptx(self, ppt_template: bytes):
         return b'PK' == ppt_template[:2]
 
-    def _is_filetype_ppt(self, task: CreatePPTTasks):
-        ppt_template = task.ppt_template
+    def _is_filetype_ppt(self, ppt_template: bytes):
         mime = magic.from_buffer(ppt_template, mime=True)
         return mime == "application/vnd.ms-powerpoint"
 
@@ -107,5 +139,8 @@ class PptService:
                 task.status_message = message
             session.commit()
 
-    def _request_screenshots(self, task_id: int, presentation: bytes):
-        ScreenshotsService(redis_conn=self._redis_conn).request_screenshot(task_id, presentation)
+    def _request_screenshots(self, task_id: int, presentation: bytes, presentation_digest: str,
+                             positions: list[int]):
+        request = ScreenshotRequest(version=VERSION, targets=tuple(positions), width=settings.SCREENSHOT_SLIDE_WIDTH)
+        ScreenshotsService(redis_conn=self._redis_conn).request_slide_screenshots(task_id, presentation,
+                                                                                  presentation_digest, request)
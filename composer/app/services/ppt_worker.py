@@ -2,30 +2,35 @@ import logging
 import time
 from threading import Thread
 
-from redis import Redis
-
-from app.config.factories import new_redis_client
-from app.config.queues import QUEUE_PPT_REQUEST, QUEUE_PPT_DUP_REQUEST
-from app.services.ppt_dup_service import PptDupService
+from app.config import settings
+from app.config.factories import new_redis_client, new_reliable_queue
+from app.config.queues import QUEUE_PPT_REQUEST
 from app.services.ppt_service import PptService
+from app.services.reliable_queue import ReliableQueue, Message
 
 logger = logging.getLogger("app:ppt-worker")
 
 
-def start_worker_thread() -> Thread:
-    thread = Thread(target=run_worker, daemon=True)
-    thread.start()
-    logger.info("PPT worker started")
-    return thread
+def start_worker_threads() -> list[Thread]:
+    """ A worker leases a request only when it is idle, the rest stay in the queue for other instances """
+    threads = []
+    for _ in range(max(settings.COMPOSER_MAX_IN_FLIGHT, 1)):
+        thread = Thread(target=run_worker, daemon=True)
+        thread.start()
+        threads.append(thread)
+    logger.info(f"{len(threads)} PPT workers started")
+    return threads
 
 
 def run_worker():
     redis_conn = None
+    queue = None
     while True:
         try:
             if not redis_conn:
                 redis_conn = new_redis_client()
-            _handle_request(redis_conn)
+                queue = new_reliable_queue(redis_conn, QUEUE_PPT_REQUEST, on_dead_letter=_on_dead_letter)
+            _handle_request(queue)
         except Exception as e:
             logger.exception(f"Service worker failure: {e}")
             try:
@@ -37,16 +42,20 @@ def run_worker():
             time.sleep(10)
 
 
-def _handle_request(redis_conn: Redis):
-    ret = redis_conn.blpop([QUEUE_PPT_REQUEST], timeout=10)
-    if not ret:
-        return
-    queue, payload = ret
+def _handle_request(queue: ReliableQueue):
+    queue.process(_process_request, timeout=10)
+
+
+def _process_request(message: Message):
     try:
-        task_id = int(payload)
+        task_id = int(message.payload)
     except ValueError:
-        raise ValueError(f"Invalid task id '{payload}' in {QUEUE_PPT_REQUEST}")
-    logger.info(f"Starting processing request for #{task_id} @ {queue}")
-    srv = PptDupService(redis_conn=redis_conn)
-    srv.send(task_id)
-    logger.info(f"Sent to slides dup for #{task_id} @ {QUEUE_PPT_REQUEST}")
+        raise ValueError(f"Invalid task id '{message.payload}' in {QUEUE_PPT_REQUEST}")
+    logger.info(f"Starting processing request for #{task_id} @ {QUEUE_PPT_REQUEST}, attempt {message.attempts}")
+    srv = PptService()
+    srv.create_ppt(task_id)
+    logger.info(f"Finished processing request for #{task_id} @ {QUEUE_PPT_REQUEST}")
+
+
+def _on_dead_letter(payload: str):
+    PptService().fail_ppt(int(payload), "Failed to process PPT request")
@@ -1,12 +1,29 @@
+import copy
 import io
+import re
 from dataclasses import dataclass
 
-from PIL import Image
 from pptx import Presentation
-from pptx.enum.shapes import MSO_SHAPE_TYPE, PP_PLACEHOLDER_TYPE
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.package import XmlPart
+from pptx.opc.packuri import PackURI
+from pptx.oxml.ns import qn
 from pptx.slide import Slide
 from pptx.util import Inches, Pt
 
+from app.services.image_preparer import ImagePreparer
+from app.services.template_cache import TemplateCache
+from app.services.template_layout import TemplateLayout, ShapeBox
+
+# Parts shared by the duplicated slides, other related parts (charts, diagrams, ...) are copied
+_SHARED_RELATIONSHIPS = (RT.IMAGE, RT.MEDIA, RT.VIDEO, RT.AUDIO, RT.HYPERLINK, RT.SLIDE)
+# Relationships not copied to the duplicated slides
+_SKIPPED_RELATIONSHIPS = (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE)
+
+# Attributes referring to relationships of the part (r:id, r:embed, r:link, ...)
+_R_PREFIX = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
 class SlideDoesntExist(Exception):
     """ Raised when no such slide exists. """
 
@@ -22,19 +39,47 @@ class SlideData:
     option: int
 
 
+@dataclass
+class _ImagePlacement:
+    slide: Slide
+    # position of the picture in the shapes of the slide
+    index: int
+    image: bytes
+    left: int
+    top: int
+    width: int
+    height: int
+
+
 class PresentationComposer:
-    def __init__(self):
+    def __init__(self, *, template_cache: TemplateCache | None = None, image_dpi: int = 150):
+        """ :param image_dpi: images are resampled to their placed size at this DPI, 0 embeds them as they are """
         super().__init__()
+        self._template_cache = template_cache
+        self._image_dpi = image_dpi
 
     def compose(self, template: bytes,
                 title: str, subtitle: str | None, footer: str | None,
-                slides: list[SlideData]) -> bytes:
-        input_file = io.BytesIO(template)
-        prs: Presentation = Presentation(input_file)
+                slides: list[SlideData], *, template_digest: str | None = None,
+                layout: TemplateLayout | None = None) -> bytes:
+        """ :param layout: layout index of the template, the template is analysed if there is none or it is stale """
+        if self._template_cache:
+            prs: Presentation = self._template_cache.presentation(template, template_digest)
+        else:
+            prs: Presentation = Presentation(io.BytesIO(template))
+        if layout is None or layout.slide_count != len(prs.slides):
+            layout = TemplateLayout.analyze(prs)
+
+        # the title slide and a slide per slide data
+        self._ensure_slides_count(prs, len(slides) + 1)
+
+        images = ImagePreparer(dpi=self._image_dpi)
+        placements: list[_ImagePlacement] = []
 
         first_slide = prs.slides[0]
 
-        title_placeholder, subtitle_placeholder = self._find_title_and_subtitle_shapes(first_slide)
+        title_placeholder = self._get_shape(first_slide, layout.slide(0).title)
+        subtitle_placeholder = self._get_shape(first_slide, layout.slide(0).subtitle)
         if title_placeholder:
             new_text = title or ''
             self._update_text_with_formatting2(title_placeholder, new_text)
@@ -46,23 +91,18 @@ class PresentationComposer:
             if slide_no > len(prs.slides):
                 raise SlideDoesntExist()
             slide = prs.slides[slide_no]
+            slide_layout = layout.slide(slide_no)
 
             # Add title
-            title_placeholder, subtitle_placeholder = self._find_title_and_subtitle_shapes(slide)
             title_bottom = None
             if slide_data.option == 4:
                 title_bottom = 0
             else:
-                if title_placeholder:
-                    new_text = slide_data.title or ''
-                    self._update_text_with_formatting2(title_placeholder, new_text)
-                    title_bottom = title_placeholder.top + title_placeholder.height
-                else:
-                    title_shape = self._find_first_textbox_shape(slide)
-                    new_text = slide_data.title or ''
-                    if title_shape:
-                        self._update_text_with_formatting2(title_shape, new_text)
-                        title_bottom = title_shape.top + title_shape.height
+                title_box = slide_layout.title or slide_layout.textbox
+                title_shape = self._get_shape(slide, title_box)
+                if title_shape:
+                    self._update_text_with_formatting2(title_shape, slide_data.title or '')
+                    title_bottom = title_box.bottom
 
             text_content = slide_data.content.replace('**', '')
 
@@ -71,50 +111,110 @@ class PresentationComposer:
             else:
                 if slide_data.option == 1:
                     self._add_left_half_slide_text(prs, slide, text_content, title_bottom=title_bottom)
-                    self._add_right_half_slide_image2(prs, slide, slide_data.image, title_bottom=title_bottom)
+                    placements.append(self._place_right_half_slide_image(prs, slide, images, slide_data.image,
+                                                                         title_bottom=title_bottom))
                 if slide_data.option == 3 or slide_data.option == 4:
-                    self._add_full_slide_image(prs, slide, slide_data.image, title_bottom=title_bottom)
+                    placements.append(self._place_full_slide_image(prs, slide, images, slide_data.image,
+                                                                   title_bottom=title_bottom))
                 if slide_data.option == 5:
                     text_height = self._add_half_height_slide_text(prs, slide, text_content, title_bottom=title_bottom)
-                    self._add_full_slide_image(prs, slide, slide_data.image, title_bottom=int(title_bottom + text_height))
+                    placements.append(self._place_full_slide_image(prs, slide, images, slide_data.image,
+                                                                   title_bottom=int(title_bottom + text_height)))
             # Add footer
             if footer:
-                footer_placeholder = self._find_footer_shape(slide)
+                footer_placeholder = self._get_shape(slide, slide_layout.footer)
                 if footer_placeholder:
                     self._update_text_with_formatting2(footer_placeholder, footer)
                 else:
-                    footer_placeholder = self._find_footer_shape(prs.slide_master)
+                    footer_placeholder = self._get_shape(prs.slide_master, layout.master_footer)
                     if footer_placeholder:
                         slide.shapes.clone_placeholder(footer_placeholder)
-                        footer_placeholder = self._find_footer_shape(slide)
-                        self._update_text_with_formatting2(footer_placeholder, footer)
+                        # the clone is appended to the shapes of the slide
+                        self._update_text_with_formatting2(slide.shapes[-1], footer)
+
+        # the images are embedded once all their placements are known
+        self._add_images(images, placements)
 
         # Save the modified presentation
         output_file = io.BytesIO()
         prs.save(output_file)
         return output_file.getvalue()
 
-    def _find_title_and_subtitle_shapes(self, slide: Slide):
-        title = None
-        subtitle = None
-        for placeholder in slide.placeholders:
-            if title is None and (placeholder.placeholder_format.type == PP_PLACEHOLDER_TYPE.TITLE or
-                                  placeholder.placeholder_format.type == PP_PLACEHOLDER_TYPE.CENTER_TITLE):
-                title = placeholder
-            elif subtitle is None and (placeholder.placeholder_format.type == PP_PLACEHOLDER_TYPE.SUBTITLE):
-                subtitle = placeholder
-
-        return title, subtitle
-
-    def _find_footer_shape(self, slide: Slide):
-        for placeholder in slide.placeholders:
-            if placeholder.placeholder_format.type == PP_PLACEHOLDER_TYPE.FOOTER:
-                return placeholder
-        return None
+    def _ensure_slides_count(self, prs: Presentation, count: int):
+        """ Duplicate the last slide of the template until the presentation has count slides """
+        while len(prs.slides) < count:
+            self._duplicate_slide(prs, prs.slides[-1])
+
+    def _duplicate_slide(self, prs: Presentation, source: Slide) -> Slide:
+        slide = prs.slides.add_slide(source.slide_layout)
+
+        # relate the new slide to the parts of the source, media is reused and not copied
+        r_ids = {}
+        for r_id, rel in source.part.rels.items():
+            if rel.reltype in _SKIPPED_RELATIONSHIPS:
+                continue
+            if rel.is_external:
+                r_ids[r_id] = slide.part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+            elif rel.reltype in _SHARED_RELATIONSHIPS:
+                r_ids[r_id] = slide.part.relate_to(rel.target_part, rel.reltype)
+            else:
+                r_ids[r_id] = slide.part.relate_to(self._copy_part(rel.target_part), rel.reltype)
+
+        # replace the placeholders created from the layout by the content of the source,
+        # the slide keeps its own cSld and spTree elements as its shapes collection refers to them
+        element, source_element = slide.part._element, source.part._element
+        for name, value in source_element.attrib.items():
+            element.set(name, value)
+        for child in list(element):
+            if child is not element.cSld:
+                element.remove(child)
+        for child in source_element:
+            if child is not source_element.cSld:
+                element.append(copy.deepcopy(child))
+
+        c_sld, sp_tree = element.cSld, element.cSld.spTree
+        for child in list(c_sld):
+            if child is not sp_tree:
+                c_sld.remove(child)
+        for child in list(sp_tree):
+            sp_tree.remove(child)
+        for name, value in source_element.cSld.attrib.items():
+            c_sld.set(name, value)
+        for child in source_element.cSld:
+            if child is source_element.cSld.spTree:
+                sp_tree.extend(copy.deepcopy(shape) for shape in child)
+            elif child.tag == qn("p:bg"):
+                sp_tree.addprevious(copy.deepcopy(child))
+            else:
+                c_sld.append(copy.deepcopy(child))
+
+        _replace_r_ids(element, r_ids)
+
+        return slide
 
-    def _find_first_textbox_shape(self, slide: Slide):
+    def _copy_part(self, part):
+        package = part.package
+        partname = package.next_partname(re.sub(r"\d+(\.\w+)$", r"%d\1", str(part.partname)))
+        clone = type(part).load(PackURI(partname), part.content_type, package, part.blob)
+
+        # the clone numbers its relationships from rId1, its XML refers to the ids of the part (chart -> rId3)
+        r_ids = {}
+        for r_id, rel in part.rels.items():
+            if rel.is_external:
+                r_ids[r_id] = clone.relate_to(rel.target_ref, rel.reltype, is_external=True)
+            else:
+                r_ids[r_id] = clone.relate_to(rel.target_part, rel.reltype)
+        # binary parts (embedded workbooks, ...) have no relationships to refer to
+        if isinstance(clone, XmlPart):
+            _replace_r_ids(clone._element, r_ids)
+        return clone
+
+    def _get_shape(self, slide: Slide, box: ShapeBox | None):
+        """ Shape of the slide indexed in the template layout """
+        if box is None:
+            return None
         for shape in slide.shapes:
-            if shape.shape_type == MSO_SHAPE_TYPE.TEXT_BOX or shape.shape_type == MSO_SHAPE_TYPE.AUTO_SHAPE:
+            if shape.shape_id == box.id:
                 return shape
         return None
 
@@ -145,17 +245,7 @@ class PresentationComposer:
         width = prs.slide_width - 2 * margin
         top, height = self._calculate_text_top_and_height(prs.slide_height, title_bottom)
 
-        textbox = slide.shapes.add_textbox(left, top, width, height)
-        text_frame = textbox.text_frame
-        text_frame.word_wrap = True
-        p = text_frame.add_paragraph()
-
-        if len(text) < 3600:
-            p.font.size = Pt(10)
-        else:
-            p.font.size = Pt(8)
-        p.text = text
-
+        self._add_text(slide, left, top, width, height, text, Pt(10) if len(text) < 3600 else Pt(8))
         return height
     
     def _add_half_height_slide_text(self, prs: Presentation, slide, text: str, *, title_bottom=None, margin=Inches(0.5)):
@@ -164,17 +254,7 @@ class PresentationComposer:
         top, height = self._calculate_text_top_and_height(prs.slide_height, title_bottom)
         height /= 4
 
-        textbox = slide.shapes.add_textbox(left, top, width, height)
-        text_frame = textbox.text_frame
-        text_frame.word_wrap = True
-        p = text_frame.add_paragraph()
-
-        if len(text) < 3600:
-            p.font.size = Pt(10)
-        else:
-            p.font.size = Pt(8)
-        p.text = text
-
+        self._add_text(slide, left, top, width, height, text, Pt(10) if len(text) < 3600 else Pt(8))
         return height
 
     def _add_left_half_slide_text(self, prs: Presentation, slide, text: str, *, title_bottom=None):
@@ -182,46 +262,32 @@ class PresentationComposer:
         width = int(prs.slide_width / 2 - Inches(1))
         top, height = self._calculate_text_top_and_height(prs.slide_height, title_bottom)
 
-        textbox = slide.shapes.add_textbox(left, top, width, height)
-        text_frame = textbox.text_frame
-        text_frame.word_wrap = True
-        p = text_frame.add_paragraph()
         if len(text) < 900:
-            p.font.size = Pt(12)
+            font_size = Pt(12)
         elif len(text) < 1800:
-            p.font.size = Pt(10)
+            font_size = Pt(10)
         elif len(text) < 3600:
-            p.font.size = Pt(8)
+            font_size = Pt(8)
         else:
-            p.font.size = Pt(6)
+            font_size = Pt(6)
+        self._add_text(slide, left, top, width, height, text, font_size)
 
+    def _add_text(self, slide: Slide, left: int, top: int, width: int, height: int, text: str, font_size: int):
+        """ Add wrapped text box with a paragraph of the text """
+        textbox = slide.shapes.add_textbox(left, top, width, height)
+        text_frame = textbox.text_frame
+        text_frame.word_wrap = True
+        p = text_frame.add_paragraph()
+        p.font.size = font_size
         p.text = text
 
-    def _add_right_half_slide_image(self, slide, image: bytes):
-        left = Inches(4.5)
-        top = Inches(1)
-        height = Inches(4)
-        image_file = io.BytesIO(image)
-        slide.shapes.add_picture(image_file=image_file, left=left, top=top, height=height)
-
-        img = Image.open(io.BytesIO(image))
-        img_width, img_height = img.size
-
-        # Calculate the scaling factor to fit within the specified dimensions
-        scaling_factor = min(4 / img_width, 4 / img_height)
-        new_width = int(img_width * scaling_factor)
-        new_height = int(img_height * scaling_factor)
-
-        # Add the image to the slide
-        pic = slide.shapes.add_picture(io.BytesIO(image), left, top, width=Inches(new_width / 96), height=Inches(new_height / 96))
-
-    def _add_right_half_slide_image2(self, prs: Presentation, slide: Slide, image: bytes, title_bottom=0, margin=Inches(0.5)):
+    def _place_right_half_slide_image(self, prs: Presentation, slide: Slide, images: ImagePreparer, image: bytes,
+                                      title_bottom=0, margin=Inches(0.5)) -> _ImagePlacement:
         # Get slide dimensions
         slide_width = prs.slide_width
         slide_height = int(prs.slide_height - title_bottom)
 
-        img = Image.open(io.BytesIO(image))
-        img_width, img_height = img.size
+        img_width, img_height = images.size(image)
         img_ratio = img_width / img_height
         half_slide_ratio = slide_width / 2 / slide_height
 
@@ -239,20 +305,15 @@ class PresentationComposer:
             left = int(slide_width / 2 + (slide_width / 2 - width) / 2)
             top = int(title_bottom + margin)
 
-        # Add picture to slide
-        pic = slide.shapes.add_picture(io.BytesIO(image), left, top, width, height)
+        return self._place_image(slide, images, image, left, top, width, height)
 
-        # Adjust picture position to fit in right half
-        pic.left = left
-        pic.top = top
-
-    def _add_full_slide_image(self, prs: Presentation, slide: Slide, image: bytes, title_bottom=0, margin=Inches(0.5)):
+    def _place_full_slide_image(self, prs: Presentation, slide: Slide, images: ImagePreparer, image: bytes,
+                                title_bottom=0, margin=Inches(0.5)) -> _ImagePlacement:
         # Get slide dimensions
         slide_width = prs.slide_width
         slide_height = int(prs.slide_height - title_bottom)
 
-        img = Image.open(io.BytesIO(image))
-        img_width, img_height = img.size
+        img_width, img_height = images.size(image)
         img_ratio = img_width / img_height
         slide_ratio = slide_width / slide_height
 
@@ -270,5 +331,28 @@ class PresentationComposer:
             left = int((slide_width - width) / 2)
             top = int(title_bottom + margin)
 
-        # Add picture to slide
-        slide.shapes.add_picture(io.BytesIO(image), left, top, width, height)
\ No newline at end of file
+        return self._place_image(slide, images, image, left, top, width, height)
+
+    def _place_image(self, slide: Slide, images: ImagePreparer, image: bytes,
+                     left: int, top: int, width: int, height: int) -> _ImagePlacement:
+        images.place(image, width, height)
+        return _ImagePlacement(slide=slide, index=len(slide.shapes._spTree), image=image,
+                               left=left, top=top, width=width, height=height)
+
+    def _add_images(self, images: ImagePreparer, placements: list[_ImagePlacement]):
+        for placement in placements:
+            self._add_picture(placement, images.prepared(placement.image))
+
+    def _add_picture(self, placement: _ImagePlacement, image: bytes):
+        picture = placement.slide.shapes.add_picture(io.BytesIO(image), placement.left, placement.top,
+                                                     placement.width, placement.height)
+        # keep the picture under the shapes added after it was placed (footer)
+        placement.slide.shapes._spTree.insert(placement.index, picture._element)
+
+
+def _replace_r_ids(element, r_ids: dict[str, str]):
+    """ Point the relationship attributes of the element and its descendants to the new relationship ids """
+    for node in element.iter():
+        for name, value in node.attrib.items():
+            if name.startswith(_R_PREFIX) and value in r_ids:
+                node.set(name, r_ids[value])
@@ -0,0 +1,107 @@
+"""
+Screenshot results cache helpers
+
+Screenshots depend only on the document and the renderer, so results are indexed by
+a normalised digest of the document plus the renderer version (screenshot_results table).
+Producers check the index before enqueueing a request, and join an in-flight request
+for the same document instead of enqueueing a duplicate one. Requests for some sheets or
+slides, or for another size, are keyed by screenshot_request.request_digest instead.
+
+Keys:
+    srv:screenshot:renderer-version                    published by the screenshots maker
+    srv:screenshot:in-flight:<version>:<digest>        id of the task being rendered
+    srv:screenshot:in-flight:<version>:<digest>:followers  ids of tasks waiting for it
+
+The same module is used by backend, composer and screenshotsmaker, keep the copies in sync.
+"""
+
+import io
+import hashlib
+import zipfile
+
+from redis import Redis
+
+RENDERER_VERSION_KEY = "srv:screenshot:renderer-version"
+IN_FLIGHT_KEY = "srv:screenshot:in-flight:%s:%s"
+
+# Document properties (author, modification time, ...) are not rendered
+_IGNORED_PARTS = ("docProps/",)
+
+# KEYS: leader, followers; ARGV: task id, ttl.
+# Returns leader task id if the task has joined it, nil if the task has become the leader.
+_JOIN_SCRIPT = """
+local leader = redis.call('GET', KEYS[1])
+if leader then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    return leader
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+
+# KEYS: leader, followers; ARGV: task id.
+# Returns followers of the task, nothing if another task has become the leader meanwhile.
+_RELEASE_SCRIPT = """
+local leader = redis.call('GET', KEYS[1])
+if leader and leader ~= ARGV[1] then
+    return {}
+end
+local followers = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2])
+return followers
+"""
+
+
+def normalized_digest(content: bytes) -> str:
+    """
+    Digest of the document content
+
+    Office documents are hashed part by part in name order, skipping document properties,
+    so saving the same document again gives the same digest.
+    """
+
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile:
+        return hashlib.sha256(content).hexdigest()
+
+    digest = hashlib.sha256()
+    with archive:
+        for info in sorted(archive.infolist(), key=lambda i: i.filename):
+            if info.is_dir() or info.filename.startswith(_IGNORED_PARTS):
+                continue
+            digest.update(info.filename.encode() + b"\0")
+            with archive.open(info) as part:
+                digest.update(hashlib.sha256(part.read()).digest())
+    return digest.hexdigest()
+
+
+class InFlightScreenshots:
+
+    def __init__(self, redis_conn: Redis, *, ttl: int = 3600):
+        super().__init__()
+        self._redis = redis_conn
+        self._ttl = ttl
+        self._join = redis_conn.register_script(_JOIN_SCRIPT)
+        self._release = redis_conn.register_script(_RELEASE_SCRIPT)
+
+    def publish_renderer_version(self, version: str):
+        self._redis.set(RENDERER_VERSION_KEY, version)
+
+    def get_renderer_version(self) -> str | None:
+        """ :return: version of the running renderer, None if the screenshots maker has never started """
+        version = self._redis.get(RENDERER_VERSION_KEY)
+        return version.decode() if isinstance(version, bytes) else version
+
+    def join(self, digest: str, renderer_version: str, task_id: int) -> int | None:
+        """ :return: id of the in-flight task the task has joined, None if the task must be rendered """
+        key = IN_FLIGHT_KEY % (renderer_version, digest)
+        leader = self._join(keys=[key, f"{key}:followers"], args=[task_id, self._ttl])
+        return int(leader) if leader is not None else None
+
+    def release(self, digest: str, renderer_version: str, task_id: int) -> list[int]:
+        """ Finish the in-flight task, :return: ids of the tasks waiting for its result """
+        key = IN_FLIGHT_KEY % (renderer_version, digest)
+        followers = self._release(keys=[key, f"{key}:followers"], args=[task_id])
+        return [int(follower) for follower in followers]
@@ -4,8 +4,9 @@ from threading import Thread
 
 from redis import Redis
 
-from app.config.factories import new_redis_client
+from app.config.factories import new_redis_client, new_reliable_queue
 from app.config.queues import QUEUE_SCREENSHOT_RESPONSE
+from app.services.reliable_queue import ReliableQueue, Message
 from app.services.screenshots_service import ScreenshotsService
 
 logger = logging.getLogger("app:screenshots-ready-worker")
@@ -20,11 +21,14 @@ def start_worker_thread() -> Thread:
 
 def run_worker():
     redis_conn = None
+    queue = None
     while True:
         try:
             if not redis_conn:
                 redis_conn = new_redis_client()
-            _handle_response(redis_conn)
+                queue = new_reliable_queue(redis_conn, QUEUE_SCREENSHOT_RESPONSE % "composer",
+                                           on_dead_letter=lambda payload: _on_dead_letter(redis_conn, payload))
+            _handle_response(redis_conn, queue)
         except Exception as e:
             logger.exception(f"Service worker failure: {e}")
             try:
@@ -36,16 +40,20 @@ def run_worker():
             time.sleep(10)
 
 
-def _handle_response(redis_conn: Redis):
-    ret = redis_conn.blpop([QUEUE_SCREENSHOT_RESPONSE % "composer"], timeout=10)
-    if not ret:
-        return
-    queue, payload = ret
+def _handle_response(redis_conn: Redis, queue: ReliableQueue):
+    queue.process(lambda message: _process_response(redis_conn, message), timeout=10)
+
+
+def _process_response(redis_conn: Redis, message: Message):
     try:
-        task_id = int(payload)
+        task_id = int(message.payload)
     except ValueError:
-        raise ValueError(f"Invalid task id '{payload}'")
-    logger.info(f"Starting processing response of #{task_id}")
+        raise ValueError(f"Invalid task id '{message.payload}'")
+    logger.info(f"Starting processing response of #{task_id}, attempt {message.attempts}")
     srv = ScreenshotsService(redis_conn=redis_conn)
     srv.process_response(task_id)
     logger.info(f"Finished processing response of #{task_id}")
+
+
+def _on_dead_letter(redis_conn: Redis, payload: str):
+    ScreenshotsService(redis_conn=redis_conn).fail_response(int(payload))
@@ -1,13 +1,17 @@
 import json
 import logging
-from hashlib import md5
+from dataclasses import replace
 
 from redis import Redis
 
 from app.config import queues
 from app.config.database import new_session
+from app.config.factories import new_blob_store, new_slide_screenshots_cache
 from app.models.models import CreateScreenshotTasks, TasksStatus, CreateScreenshotTasksScreenshots, CreatePPTTasks, \
-    CreatePPTTasksSlides
+    CreatePPTTasksSlides, ScreenshotResults
+from app.services.screenshot_request import ScreenshotRequest, request_digest
+from app.services.screenshot_results import InFlightScreenshots, normalized_digest
+from app.services.slide_cache import SlideScreenshot, slide_digests, slide_key
 
 
 logger = logging.getLogger(__name__)
@@ -20,24 +24,99 @@ class ScreenshotsServiceError(Exception):
 class ScreenshotsService:
     def __init__(self, redis_conn: Redis):
         self.redis_conn = redis_conn
+        self._blob_store = new_blob_store()
+        self._slide_cache = new_slide_screenshots_cache(redis_conn)
+
+    def request_slide_screenshots(self, task_id: int, pptx_content: bytes, pptx_digest: str,
+                                  request: ScreenshotRequest):
+        """ Set screenshots of the cached slides right away and request only the rest of them """
+        renderer_version = InFlightScreenshots(self.redis_conn).get_renderer_version()
+        digests = slide_digests(pptx_content) if self._slide_cache and renderer_version else []
+        if not digests:
+            self.request_screenshot(task_id, pptx_content, pptx_digest, request)
+            return
+
+        positions = [position for position in request.targets or range(len(digests)) if position < len(digests)]
+        keys = {position: slide_key(digests[position], request) for position in positions}
+        cached = self._slide_cache.get_many(renderer_version, [keys[position] for position in positions])
+        hits = {position: screenshot for position, screenshot in zip(positions, cached) if screenshot}
+        misses = [position for position in positions if position not in hits]
+        logger.info(f"{len(hits)} of {len(positions)} slides of {task_id} are cached")
+
+        task = self._set_screenshots(task_id, hits) if hits else None
+        if task and not misses:
+            self._set_status_if_pending(task.id, TasksStatus.COMPLETED, "Screenshots added")
+            self._notify_task_is_done(task)
+            return
+        self.request_screenshot(task_id, pptx_content, pptx_digest, replace(request, targets=tuple(misses)),
+                                slide_keys={position: keys[position] for position in misses})
+
+    def request_screenshot(self, task_id: int, pptx_content: bytes, pptx_digest: str,
+                           request: ScreenshotRequest = ScreenshotRequest(), *,
+                           slide_keys: dict[int, str] | None = None):
+        """
+        Request screenshots of the presentation, rendered or in-flight results of the same request are reused
+        :param slide_keys: keys of the requested slides in the slides cache, the screenshots are cached when ready
+        """
+        in_flight = InFlightScreenshots(self.redis_conn)
+        content_digest = request_digest(normalized_digest(pptx_content), request)
+        renderer_version = in_flight.get_renderer_version()
+        extra_data = {"task_id": task_id}
+        if slide_keys and renderer_version:
+            extra_data.update(renderer_version=renderer_version, slide_keys=slide_keys)
 
-    def request_screenshot(self, task_id: int, pptx_content: bytes):
         with new_session() as session:
+            result = None
+            if renderer_version:
+                result = session.query(ScreenshotResults).filter(
+                    ScreenshotResults.content_digest == content_digest,
+                    ScreenshotResults.renderer_version == renderer_version,
+                ).first()
+
             ss_task = CreateScreenshotTasks(
                 client_uid="composer",
                 name="composer.pptx",
-                extra_data=json.dumps({"task_id": task_id}),
-                content_hash=md5(pptx_content).hexdigest(),
+                extra_data=json.dumps(extra_data),
+                content_hash=content_digest,
                 status=TasksStatus.PENDING,
                 status_message="Submitted",
-                content=pptx_content,
+                content_digest=pptx_digest,
+                request=None if request.is_default else request.to_json(),
             )
+            if result:
+                ss_task.status = TasksStatus.COMPLETED
+                ss_task.status_message = f"OK. Copied from {result.screenshot_task_id}"
             session.add(ss_task)
             session.flush()
             session.refresh(ss_task)
             ss_task_id = ss_task.id
+
+            if result:
+                screenshots = session.query(CreateScreenshotTasksScreenshots).filter(
+                    CreateScreenshotTasksScreenshots.screenshot_task_id == result.screenshot_task_id
+                ).all()
+                for screenshot in screenshots:
+                    session.add(CreateScreenshotTasksScreenshots(
+                        position=screenshot.position,
+                        content=screenshot.content,
+                        content_digest=screenshot.content_digest,
+                        preview_digest=screenshot.preview_digest,
+                        thumbnail_digest=screenshot.thumbnail_digest,
+                        screenshot_task_id=ss_task_id,
+                    ))
             session.commit()
 
+        if result:
+            logger.info(f"Screenshots for {task_id} are copied from #{result.screenshot_task_id} at #{ss_task_id}")
+            self.redis_conn.rpush(queues.QUEUE_SCREENSHOT_RESPONSE % "composer", str(ss_task_id))
+            return
+
+        if renderer_version:
+            leader_id = in_flight.join(content_digest, renderer_version, ss_task_id)
+            if leader_id is not None:
+                logger.info(f"Screenshots for {task_id} at #{ss_task_id} wait for in-flight #{leader_id}")
+                return
+
         self.redis_conn.rpush(queues.QUEUE_SCREENSHOT_REQUEST, str(ss_task_id))
         logger.info(f"Requesting screenshots for {task_id} at #{ss_task_id}")
 
@@ -70,32 +149,82 @@ class ScreenshotsService:
                 self._notify_task_is_done(task)
                 return
 
-            task_id = self._get_task_id(ss_task)
-            slides = session.query(CreatePPTTasksSlides).filter(CreatePPTTasksSlides.ppt_task_id == task_id).all()
-            slides: [CreatePPTTasksSlides] = list(slides)
-            # Set the main slide screenshot
-            screenshot = session.query(CreateScreenshotTasksScreenshots).filter(
-                CreateScreenshotTasksScreenshots.screenshot_task_id == screenshots_task_id,
-                CreateScreenshotTasksScreenshots.position == 0
-            ).first()
-            if screenshot:
-                task.screenshot_first_slide = screenshot.content
-
-            # Set the rest of the slides screenshots
-            for slide in slides:
-                screenshot = session.query(CreateScreenshotTasksScreenshots).filter(
-                    CreateScreenshotTasksScreenshots.screenshot_task_id == screenshots_task_id,
-                    CreateScreenshotTasksScreenshots.position == slide.position
-                ).first()
-                if screenshot:
-                    slide.screenshot = screenshot.content
+            screenshots = {
+                screenshot.position: SlideScreenshot(content_digest=self._get_digest(screenshot),
+                                                     preview_digest=screenshot.preview_digest,
+                                                     thumbnail_digest=screenshot.thumbnail_digest)
+                for screenshot in session.query(CreateScreenshotTasksScreenshots).filter(
+                    CreateScreenshotTasksScreenshots.screenshot_task_id == screenshots_task_id
+                ).all()
+            }
+            self._apply_screenshots(session, task, screenshots)
+            extra_data = json.loads(ss_task.extra_data)
 
             session.flush()
             session.expunge(task)
             session.commit()
+        self._cache_slide_screenshots(extra_data, screenshots)
         self._set_status_if_pending(task.id, TasksStatus.COMPLETED, "Screenshots added")
         self._notify_task_is_done(task)
 
+    def fail_response(self, screenshots_task_id: int):
+        """ Give up on the screenshots response and fail the linked PPT task """
+        with new_session() as session:
+            ss_task = session.query(CreateScreenshotTasks).filter(
+                CreateScreenshotTasks.id == screenshots_task_id
+            ).first()
+            if not ss_task:
+                return
+            task = session.query(CreatePPTTasks).filter(
+                CreatePPTTasks.id == self._get_task_id(ss_task)
+            ).first()
+            if not task:
+                return
+            session.expunge(task)
+
+        self._set_status_if_pending(task.id, TasksStatus.FAILED, "Failed to add presentation screenshots")
+        self._notify_task_is_done(task)
+
+    def _set_screenshots(self, task_id: int, screenshots: dict[int, SlideScreenshot]) -> CreatePPTTasks | None:
+        """ Set the screenshots of the presentation slides by position, :return: the PPT task """
+        with new_session() as session:
+            task = session.query(CreatePPTTasks).filter(CreatePPTTasks.id == task_id).first()
+            if not task:
+                return None
+            self._apply_screenshots(session, task, screenshots)
+            session.flush()
+            session.expunge(task)
+            session.commit()
+        return task
+
+    def _apply_screenshots(self, session, task: CreatePPTTasks, screenshots: dict[int, SlideScreenshot]):
+        # Set the main slide screenshot
+        screenshot = screenshots.get(0)
+        if screenshot:
+            task.screenshot_first_slide_digest = screenshot.content_digest
+            task.screenshot_first_slide_preview_digest = screenshot.preview_digest
+            task.screenshot_first_slide_thumbnail_digest = screenshot.thumbnail_digest
+
+        # Set the rest of the slides screenshots
+        slides = session.query(CreatePPTTasksSlides).filter(CreatePPTTasksSlides.ppt_task_id == task.id).all()
+        for slide in slides:
+            screenshot = screenshots.get(slide.position)
+            if screenshot:
+                slide.screenshot_digest = screenshot.content_digest
+                slide.screenshot_preview_digest = screenshot.preview_digest
+                slide.screenshot_thumbnail_digest = screenshot.thumbnail_digest
+
+    def _cache_slide_screenshots(self, extra_data: dict, screenshots: dict[int, SlideScreenshot]):
+        if not self._slide_cache or "slide_keys" not in extra_data:
+            return
+        try:
+            for position, key in extra_data["slide_keys"].items():
+                screenshot = screenshots.get(int(position))
+                if screenshot:
+                    self._slide_cache.put(extra_data["renderer_version"], key, screenshot)
+        except Exception as e:
+            logger.warning(f"Failed to cache slide screenshots of {extra_data['task_id']}: {e}")
+
     def _set_status_if_pending(self, task_id: int, status: TasksStatus, message: str):
         with new_session() as session:
             t = session.query(CreatePPTTasks).filter(
@@ -113,5 +242,11 @@ class ScreenshotsService:
         logger.info(f"Screenshot task for {task.id} notified via queue {queues.QUEUE_PPT_RESPONSE % task.client_uid}")
         self.redis_conn.rpush(queues.QUEUE_PPT_RESPONSE % task.client_uid, str(task.id))
 
+    def _get_digest(self, screenshot: CreateScreenshotTasksScreenshots) -> str:
+        """ Screenshots are shared by digest, inline ones are moved to the blob store first """
+        if screenshot.content_digest:
+            return screenshot.content_digest
+        return self._blob_store.put(screenshot.content)
+
     def _get_task_id(self, ss_task: CreateScreenshotTasks) -> int:
         return json.loads(ss_task.extra_data)["task_id"]
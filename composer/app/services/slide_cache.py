@@ -0,0 +1,162 @@
+"""
+Per-slide screenshots cache
+
+A regenerated presentation differs from the previous one only in the edited slides, so
+screenshots are cached slide by slide. The digest of a slide covers everything its picture
+depends on: the slide XML, its layout and master with their theme, the media and charts they
+refer to and the slide size. Parts are hashed by content, not by name, so a slide keeps its
+digest when python-pptx numbers the media of the composed presentation differently.
+Slides showing their number depend on the position too. Number placeholders of layouts and
+masters are not drawn, only their other shapes show the number on the slides.
+
+Keys:
+    srv:screenshot:slide:<renderer version>:<key>   json {content_digest, preview_digest, thumbnail_digest}
+
+The key is request_digest of the slide digest and the request without targets.
+"""
+
+import io
+import re
+import json
+import hashlib
+import zipfile
+import posixpath
+from dataclasses import dataclass, asdict, replace
+from xml.etree import ElementTree
+
+from redis import Redis
+
+from app.services.screenshot_request import ScreenshotRequest, request_digest
+
+SLIDE_KEY = "srv:screenshot:slide:%s:%s"
+
+_PRESENTATION_PART = "ppt/presentation.xml"
+_PRESENTATION_NS = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Relations which don't change the picture of the slide; a master refers to all its layouts,
+# skipping them keeps the relations acyclic
+_SKIPPED_RELS = ("/notesSlide", "/slide", "/comments", "/commentAuthors", "/tags")
+_SKIPPED_MASTER_RELS = ("/slideLayout",)
+
+_SLIDE_SIZE_RE = re.compile(rb"<(?:\w+:)?sldSz\b[^>]*>")
+_SLIDE_NUMBER_FIELD = b'type="slidenum"'
+
+
+@dataclass(frozen=True)
+class SlideScreenshot:
+    content_digest: str
+    preview_digest: str | None = None
+    thumbnail_digest: str | None = None
+
+
+def slide_digests(content: bytes) -> list[str]:
+    """ :return: digests of the slides of the presentation in their order, empty for invalid files """
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            return _PartHasher(archive).slide_digests()
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+        return []
+
+
+def slide_key(digest: str, request: ScreenshotRequest) -> str:
+    """ Key of the screenshot of a slide with the digest rendered as requested """
+    return request_digest(digest, replace(request, targets=None))
+
+
+class SlideScreenshotsCache:
+
+    def __init__(self, redis_conn: Redis, *, ttl: int = 30 * 24 * 3600):
+        super().__init__()
+        self._redis = redis_conn
+        self._ttl = ttl
+
+    def get_many(self, renderer_version: str, keys: list[str]) -> list[SlideScreenshot | None]:
+        if not keys:
+            return []
+        values = self._redis.mget([SLIDE_KEY % (renderer_version, key) for key in keys])
+        return [SlideScreenshot(**json.loads(value)) if value else None for value in values]
+
+    def put(self, renderer_version: str, key: str, screenshot: SlideScreenshot):
+        self._redis.set(SLIDE_KEY % (renderer_version, key), json.dumps(asdict(screenshot)), ex=self._ttl)
+
+
+class _PartHasher:
+    """ Content digests of the parts with everything they refer to, memoized per presentation """
+
+    def __init__(self, archive: zipfile.ZipFile):
+        super().__init__()
+        self._archive = archive
+        self._digests: dict[str, bytes] = {}
+        self._numbered: set[str] = set()
+
+    def slide_digests(self) -> list[str]:
+        presentation = self._archive.read(_PRESENTATION_PART)
+        slide_size = _SLIDE_SIZE_RE.search(presentation)
+        rels = _read_rels(self._archive, _PRESENTATION_PART)
+
+        digests = []
+        for position, slide_id in enumerate(ElementTree.fromstring(presentation).iter(f"{_PRESENTATION_NS}sldId")):
+            _, part = rels[slide_id.get(f"{_REL_NS}id")]
+            digest = hashlib.sha256(self.digest(part))
+            digest.update(slide_size.group(0) if slide_size else b"")
+            if part in self._numbered:
+                digest.update(f":{position}".encode())
+            digests.append(digest.hexdigest())
+        return digests
+
+    def digest(self, part: str) -> bytes:
+        if part in self._digests:
+            return self._digests[part]
+
+        content = self._archive.read(part)
+        digest = hashlib.sha256(content)
+        numbered = _shows_slide_number(part, content)
+        skipped = _SKIPPED_RELS + (_SKIPPED_MASTER_RELS if "/slideMasters/" in part else ())
+        # the XML refers to the related parts by id, the ids stay and the part names may change
+        for rel_id, (rel_type, target) in sorted(_read_rels(self._archive, part).items()):
+            if rel_type.endswith(skipped) or target not in self._archive.NameToInfo:
+                continue
+            digest.update(f"{rel_id}\0{rel_type}\0".encode() + self.digest(target))
+            numbered = numbered or target in self._numbered
+
+        if numbered:
+            self._numbered.add(part)
+        self._digests[part] = digest.digest()
+        return self._digests[part]
+
+
+def _shows_slide_number(part: str, content: bytes) -> bool:
+    if _SLIDE_NUMBER_FIELD not in content:
+        return False
+    if "/slideLayouts/" not in part and "/slideMasters/" not in part:
+        return True
+    for shape in ElementTree.fromstring(content).iter(f"{_PRESENTATION_NS}sp"):
+        if shape.find(f"{_PRESENTATION_NS}nvSpPr/{_PRESENTATION_NS}nvPr/{_PRESENTATION_NS}ph") is not None:
+            continue
+        if any(field.get("type") == "slidenum" for field in shape.iter(f"{_DRAWING_NS}fld")):
+            return True
+    return False
+
+
+def _read_rels(archive: zipfile.ZipFile, part: str) -> dict[str, tuple[str, str]]:
+    """ Relationships of the part: id -> (type, target part), external targets are skipped """
+
+    directory, name = posixpath.split(part)
+    rels_part = posixpath.join(directory, "_rels", f"{name}.rels")
+    if rels_part not in archive.NameToInfo:
+        return {}
+
+    rels = {}
+    for rel in ElementTree.fromstring(archive.read(rels_part)).iter(f"{_PACKAGE_REL_NS}Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(directory, target))
+        rels[rel.get("Id")] = (rel.get("Type"), target)
+    return rels
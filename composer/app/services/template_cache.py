@@ -0,0 +1,147 @@
+"""
+Parsed templates cache
+
+Users compose their presentations from a few templates for months, so templates are parsed
+once and kept by digest. The cached package is never modified: every job gets a clone of it,
+with copies of the parsed XML trees and the relationships between the parts, while the binary
+parts (images, media, fonts) share their content, it is immutable bytes.
+
+Templates are evicted least recently used first once their unpacked size exceeds the limit.
+
+python-pptx has no public API to copy a package, the clone builds the relationships with its
+private classes, as of the version pinned in requirements.txt. The clone is checked once against
+the installed version, if it doesn't work the templates are parsed for every job.
+"""
+
+import copy
+import functools
+import hashlib
+import io
+import logging
+import threading
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from pptx import Presentation
+from pptx.opc.package import OpcPackage, XmlPart
+from pptx.package import Package
+
+try:
+    from pptx.opc.package import _Relationship, _Relationships
+except ImportError:
+    _Relationship = _Relationships = None
+
+logger = logging.getLogger("app:template-cache")
+
+
+@dataclass
+class _Entry:
+    package: Package
+    size: int
+
+
+class TemplateCache:
+
+    def __init__(self, *, max_size: int = 256 * 1024 * 1024):
+        """
+        :param max_size: bytes of the unpacked templates kept, a larger template is not cached
+        """
+        super().__init__()
+        self._max_size = max_size
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._enabled = clone_supported()
+        if not self._enabled:
+            logger.warning("Packages of the installed python-pptx can't be cloned, templates are not cached")
+
+    def presentation(self, template: bytes, digest: str | None = None) -> Presentation:
+        """ :return: a new presentation of the template, the caller may modify it """
+        if not self._enabled:
+            return Presentation(io.BytesIO(template))
+        digest = digest or hashlib.sha256(template).hexdigest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry:
+            return _clone(entry.package).main_document_part.presentation
+
+        package = Package.open(io.BytesIO(template))
+        self._put(digest, package, _unpacked_size(template))
+        logger.info(f"Template {digest} parsed, cache stats: {self.stats()}")
+        return _clone(package).main_document_part.presentation
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "templates": len(self._entries), "size": self._size}
+
+    def _put(self, digest: str, package: Package, size: int):
+        if size > self._max_size:
+            return
+        with self._lock:
+            if digest in self._entries:
+                return
+            self._entries[digest] = _Entry(package=package, size=size)
+            self._size += size
+            while self._size > self._max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+
+
+@functools.lru_cache(maxsize=None)
+def clone_supported() -> bool:
+    """ The private API used by the clone is the one of the installed python-pptx """
+    if _Relationship is None:
+        return False
+    try:
+        package = Presentation().part.package
+        clone = _clone(package)
+        presentation = clone.main_document_part.presentation
+        return (presentation.part is not package.main_document_part
+                and presentation.slide_masters[0].part.package is clone)
+    except (AttributeError, TypeError, KeyError, IndexError) as e:
+        logger.warning(f"Cloning a package failed: {e!r}")
+        return False
+
+
+def _unpacked_size(template: bytes) -> int:
+    """ Size of the template parts, parsed XML takes a few times more memory, binary parts as much """
+    with zipfile.ZipFile(io.BytesIO(template)) as archive:
+        return sum(info.file_size for info in archive.infolist())
+
+
+def _clone(package: OpcPackage) -> OpcPackage:
+    """ Copy of the package which can be modified, the package itself is only read """
+
+    clone = type(package)(None)
+    parts = {}
+    for part in package.iter_parts():
+        if isinstance(part, XmlPart):
+            parts[part] = type(part)(part.partname, part.content_type, clone, copy.deepcopy(part._element))
+        else:
+            # values cached by the part are derived from the content, except the relationships
+            parts[part] = copy.copy(part)
+            parts[part].__dict__.pop("_rels", None)
+            parts[part]._package = clone
+
+    _copy_rels(package._rels, clone._rels, parts)
+    for part, part_clone in parts.items():
+        _copy_rels(part._rels, part_clone._rels, parts)
+    return clone
+
+
+def _copy_rels(rels: _Relationships, target: _Relationships, parts: dict):
+    for r_id, rel in rels.items():
+        target._rels[r_id] = _Relationship(rel._base_uri, r_id, rel.reltype, rel._target_mode,
+                                           rel.target_ref if rel.is_external else parts[rel.target_part])
@@ -0,0 +1,155 @@
+"""
+Template layout index
+
+A template is analysed once, when it is uploaded, and the index is stored with it (json):
+
+    {
+        "version": 1,
+        "slide_width": 12192000,            EMU
+        "slide_height": 6858000,
+        "slides": [                         a slide of the template each
+            {
+                "title": {"id": 2, "left": 0, "top": 0, "width": 100, "height": 50},
+                "subtitle": null,           title and subtitle placeholders
+                "footer": null,             footer placeholder
+                "textbox": null             first text box or auto shape, the title of slides without placeholder
+            }
+        ],
+        "master_footer": null               footer placeholder of the slide master
+    }
+
+The composer places the content by the shape ids and geometry of the index instead of searching
+the shapes of every slide. Slides added to the template are copies of its last slide, with the
+same shape ids. Templates which can't be composed raise TemplateLayoutError.
+
+The same module is used by backend and composer, keep the copies in sync.
+"""
+
+import io
+import json
+from dataclasses import dataclass, asdict
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE, PP_PLACEHOLDER_TYPE
+
+VERSION = 1
+
+_TITLE_TYPES = (PP_PLACEHOLDER_TYPE.TITLE, PP_PLACEHOLDER_TYPE.CENTER_TITLE)
+_TEXTBOX_TYPES = (MSO_SHAPE_TYPE.TEXT_BOX, MSO_SHAPE_TYPE.AUTO_SHAPE)
+
+
+class TemplateLayoutError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ShapeBox:
+    id: int
+    left: int
+    top: int
+    width: int
+    height: int
+
+    @property
+    def bottom(self) -> int:
+        return self.top + self.height
+
+    @classmethod
+    def of(cls, shape) -> "ShapeBox | None":
+        if shape is None:
+            return None
+        return cls(id=shape.shape_id, left=shape.left or 0, top=shape.top or 0, width=shape.width or 0,
+                   height=shape.height or 0)
+
+
+@dataclass(frozen=True)
+class SlideLayout:
+    title: ShapeBox | None = None
+    subtitle: ShapeBox | None = None
+    footer: ShapeBox | None = None
+    textbox: ShapeBox | None = None
+
+
+@dataclass(frozen=True)
+class TemplateLayout:
+    slide_width: int
+    slide_height: int
+    slides: tuple[SlideLayout, ...]
+    master_footer: ShapeBox | None = None
+
+    @property
+    def slide_count(self) -> int:
+        return len(self.slides)
+
+    def slide(self, index: int) -> SlideLayout:
+        """ Layout of the slide of the composed presentation, the added slides are copies of the last one """
+        return self.slides[min(index, len(self.slides) - 1)]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "version": VERSION,
+            "slide_width": self.slide_width,
+            "slide_height": self.slide_height,
+            "slides": [asdict(slide) for slide in self.slides],
+            "master_footer": asdict(self.master_footer) if self.master_footer else None,
+        }, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, value: str | None) -> "TemplateLayout | None":
+        """ :return: None for a missing, outdated or malformed index, the template is analysed again """
+        if not value:
+            return None
+        try:
+            data = json.loads(value)
+            if data.get("version") != VERSION or not data["slides"]:
+                return None
+            return cls(
+                slide_width=int(data["slide_width"]),
+                slide_height=int(data["slide_height"]),
+                slides=tuple(SlideLayout(**{name: _box(box) for name, box in slide.items()})
+                             for slide in data["slides"]),
+                master_footer=_box(data["master_footer"]),
+            )
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    @classmethod
+    def analyze(cls, presentation: Presentation) -> "TemplateLayout":
+        """ Index the template, raise TemplateLayoutError if it can't be composed """
+        if not len(presentation.slides):
+            raise TemplateLayoutError("The template has no slides.")
+        return cls(
+            slide_width=presentation.slide_width,
+            slide_height=presentation.slide_height,
+            slides=tuple(_analyze_slide(slide) for slide in presentation.slides),
+            master_footer=ShapeBox.of(_find_placeholder(presentation.slide_master, (PP_PLACEHOLDER_TYPE.FOOTER,))),
+        )
+
+
+def analyze_template(content: bytes) -> TemplateLayout:
+    """ Index the template file, raise TemplateLayoutError if it is not a presentation or can't be composed """
+    try:
+        presentation = Presentation(io.BytesIO(content))
+    except Exception as e:
+        raise TemplateLayoutError(f"Invalid presentation: {e}")
+    return TemplateLayout.analyze(presentation)
+
+
+def _analyze_slide(slide) -> SlideLayout:
+    return SlideLayout(
+        title=ShapeBox.of(_find_placeholder(slide, _TITLE_TYPES)),
+        subtitle=ShapeBox.of(_find_placeholder(slide, (PP_PLACEHOLDER_TYPE.SUBTITLE,))),
+        footer=ShapeBox.of(_find_placeholder(slide, (PP_PLACEHOLDER_TYPE.FOOTER,))),
+        textbox=ShapeBox.of(next((shape for shape in slide.shapes if shape.shape_type in _TEXTBOX_TYPES), None)),
+    )
+
+
+def _find_placeholder(slide, types: tuple):
+    for placeholder in slide.placeholders:
+        if placeholder.placeholder_format.type in types:
+            return placeholder
+    return None
+
+
+def _box(value: dict | None) -> ShapeBox | None:
+    return ShapeBox(**value) if value else None
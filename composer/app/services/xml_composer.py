@@ -0,0 +1,118 @@
+"""
+Presentation composition by XML templates
+
+The default composer adds every slide and shape through the python-pptx object model: a
+duplicated slide is created from the layout with its placeholders, which are then replaced by
+the content of the template slide, and every text box and picture is built by proxy objects.
+On large decks most of the time goes there.
+
+This composer produces the same presentation, directly from XML:
+ - the template slide is duplicated once by python-pptx, its serialized XML is the template
+   of the other copies, which are loaded from it into new slide parts with the same relationships
+ - the text boxes and pictures of the slide options are DrawingML fragments, filled with the
+   escaped text, the geometry and the relationship id of the picture
+
+Titles and footers still go through python-pptx, they modify the shapes of the template.
+"""
+
+import io
+import re
+from xml.sax.saxutils import escape
+
+from pptx import Presentation
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.parts.slide import SlidePart
+from pptx.slide import Slide
+
+from app.services.presentation_composer import PresentationComposer, _ImagePlacement, _SHARED_RELATIONSHIPS
+
+_TEXTBOX_TEMPLATE = (
+    f'<p:sp {nsdecls("a", "p")}>'
+    '<p:nvSpPr><p:cNvPr id="{id}" name="TextBox {number}"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+    '<p:spPr><a:xfrm><a:off x="{left}" y="{top}"/><a:ext cx="{width}" cy="{height}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+    '<p:txBody><a:bodyPr wrap="square"><a:spAutoFit/></a:bodyPr><a:lstStyle/><a:p/>'
+    '<a:p><a:pPr><a:defRPr sz="{font_size}"/></a:pPr>{runs}</a:p></p:txBody>'
+    '</p:sp>'
+)
+
+_PICTURE_TEMPLATE = (
+    f'<p:pic {nsdecls("a", "p", "r")}>'
+    '<p:nvPicPr><p:cNvPr id="{id}" name="Picture {number}" descr="{description}"/>'
+    '<p:cNvPicPr><a:picLocks noChangeAspect="1"/></p:cNvPicPr><p:nvPr/></p:nvPicPr>'
+    '<p:blipFill><a:blip r:embed="{r_id}"/><a:stretch><a:fillRect/></a:stretch></p:blipFill>'
+    '<p:spPr><a:xfrm><a:off x="{left}" y="{top}"/><a:ext cx="{width}" cy="{height}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr>'
+    '</p:pic>'
+)
+
+# lines of the text are runs separated by line breaks, empty runs are skipped, like python-pptx does
+_LINE_BREAK_RE = re.compile("\n|\v")
+# control characters are not allowed in XML, python-pptx writes them as _xHHHH_
+_CONTROL_CHARS_RE = re.compile(r"([\x00-\x08\x0B-\x1F])")
+
+
+class XmlPresentationComposer(PresentationComposer):
+
+    def _ensure_slides_count(self, prs: Presentation, count: int):
+        if len(prs.slides) >= count:
+            return
+
+        # every copy of the last slide is the same, python-pptx makes the first one
+        first = self._duplicate_slide(prs, prs.slides[-1])
+        blob = serialize_part_xml(first.part._element)
+        while len(prs.slides) < count:
+            self._load_slide(prs, first, blob)
+
+    def _load_slide(self, prs: Presentation, first: Slide, blob: bytes):
+        """ Add a copy of the first duplicated slide from its XML """
+        presentation_part = prs.part
+        slide_part = SlidePart.load(presentation_part._next_slide_partname, CT.PML_SLIDE,
+                                    presentation_part.package, blob)
+
+        # the relationships are added in the order of the first slide, so they get the ids its XML refers to
+        for rel in first.part.rels.values():
+            if rel.is_external:
+                slide_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+            elif rel.reltype == RT.SLIDE_LAYOUT or rel.reltype in _SHARED_RELATIONSHIPS:
+                slide_part.relate_to(rel.target_part, rel.reltype)
+            else:
+                slide_part.relate_to(self._copy_part(rel.target_part), rel.reltype)
+
+        r_id = presentation_part.relate_to(slide_part, RT.SLIDE)
+        prs.slides._sldIdLst.add_sldId(r_id)
+
+    def _add_text(self, slide: Slide, left: int, top: int, width: int, height: int, text: str, font_size: int):
+        sp_tree = slide.shapes._spTree
+        shape_id = sp_tree.max_shape_id + 1
+        sp = parse_xml(_TEXTBOX_TEMPLATE.format(
+            id=shape_id, number=shape_id - 1, left=int(left), top=int(top), width=int(width), height=int(height),
+            font_size=font_size.centipoints, runs=_runs(text)))
+        sp_tree.insert_element_before(sp, "p:extLst")
+
+    def _add_picture(self, placement: _ImagePlacement, image: bytes):
+        slide_part = placement.slide.part
+        image_part, r_id = slide_part.get_or_add_image_part(io.BytesIO(image))
+        sp_tree = placement.slide.shapes._spTree
+        shape_id = sp_tree.max_shape_id + 1
+        pic = parse_xml(_PICTURE_TEMPLATE.format(
+            id=shape_id, number=shape_id - 1,
+            description=escape(image_part.desc, {'"': "&quot;"}), r_id=r_id,
+            left=int(placement.left), top=int(placement.top), width=int(placement.width),
+            height=int(placement.height)))
+        # under the shapes added after it was placed (footer)
+        sp_tree.insert(placement.index, pic)
+
+
+def _runs(text: str) -> str:
+    runs = []
+    for index, line in enumerate(_LINE_BREAK_RE.split(text)):
+        if index:
+            runs.append("<a:br/>")
+        if line:
+            line = _CONTROL_CHARS_RE.sub(lambda match: "_x%04X_" % ord(match.group(1)), line)
+            runs.append(f"<a:r><a:t>{escape(line)}</a:t></a:r>")
+    return "".join(runs)
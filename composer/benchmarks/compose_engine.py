@@ -0,0 +1,46 @@
+"""
+Compare the compose time of the python-pptx and XML composers, and check they produce the same presentation
+
+Usage: python -m benchmarks.compose_engine --template-slides 5 --slides 150 --repeat 5
+"""
+
+import argparse
+
+from benchmarks.template_cache import make_template, make_slides, measure
+from app.services.presentation_composer import PresentationComposer
+from app.services.template_cache import TemplateCache
+from app.services.xml_composer import XmlPresentationComposer
+
+# right half image, full slide image, full slide image without title, text above image
+OPTIONS = (1, 3, 4, 5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--template-slides', type=int, default=5)
+    parser.add_argument('--shapes', type=int, default=40)
+    parser.add_argument('--slides', type=int, default=150)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    template = make_template(args.template_slides, args.shapes)
+    slides = make_slides(args.slides)
+    for index, slide in enumerate(slides):
+        slide.option = OPTIONS[index % len(OPTIONS)]
+    # text only slides
+    for slide in slides[::len(OPTIONS) + 1]:
+        slide.image = None
+    print(f'Template {args.template_slides} slides, {args.slides} slides composed')
+
+    cache = TemplateCache()
+    pptx, xml = PresentationComposer(template_cache=cache), XmlPresentationComposer(template_cache=cache)
+    identical = pptx.compose(template, 'Title', 'Subtitle', 'Footer', slides) == \
+        xml.compose(template, 'Title', 'Subtitle', 'Footer', slides)
+    print(f'identical      {identical}')
+
+    measure('compose pptx', lambda: pptx.compose(template, 'Title', 'Subtitle', 'Footer', slides), args.repeat)
+    measure('compose xml', lambda: xml.compose(template, 'Title', 'Subtitle', 'Footer', slides), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
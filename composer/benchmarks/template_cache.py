@@ -0,0 +1,80 @@
+"""
+Compare the compose time of a presentation with the parsed template cache warm and cold
+
+Usage: python -m benchmarks.template_cache --template-slides 20 --slides 10 --repeat 10
+"""
+
+import io
+import time
+import random
+import argparse
+
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches, Pt
+
+from app.services.presentation_composer import PresentationComposer, SlideData
+from app.services.template_cache import TemplateCache
+
+
+def make_template(slides: int, shapes: int, seed: int = 0) -> bytes:
+    """ Create synthetic template with decorated sample slides, like the corporate ones """
+
+    rnd = random.Random(seed)
+    presentation = Presentation()
+    for index in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[0 if index == 0 else 1])
+        slide.shapes.title.text = f'Sample slide {index}'
+        for _ in range(shapes):
+            box = slide.shapes.add_textbox(Inches(rnd.uniform(0, 8)), Inches(rnd.uniform(0, 6)), Inches(1), Inches(0.3))
+            box.text_frame.text = 'Lorem ipsum dolor sit amet'
+            box.text_frame.paragraphs[0].font.size = Pt(8)
+        image = io.BytesIO()
+        Image.new('RGB', (640, 480), (rnd.randint(0, 255), 128, 128)).save(image, 'PNG')
+        slide.shapes.add_picture(image, Inches(6), Inches(4), Inches(2))
+
+    output = io.BytesIO()
+    presentation.save(output)
+    return output.getvalue()
+
+
+def make_slides(count: int) -> list[SlideData]:
+    image = io.BytesIO()
+    Image.new('RGB', (1024, 768), 'white').save(image, 'PNG')
+    return [SlideData(title=f'Slide {i}', content='Revenue grew by 12% ' * 40, image=image.getvalue(), option=1)
+            for i in range(count)]
+
+
+def measure(name: str, func, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f'{name:<14} {elapsed * 1000:8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--template-slides', type=int, default=20)
+    parser.add_argument('--shapes', type=int, default=40)
+    parser.add_argument('--slides', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    template = make_template(args.template_slides, args.shapes)
+    slides = make_slides(args.slides)
+    print(f'Template {args.template_slides} slides, {len(template) / 2 ** 10:.0f} KiB, {args.slides} slides composed')
+
+    cache = TemplateCache()
+    cold, warm = PresentationComposer(), PresentationComposer(template_cache=cache)
+    warm.compose(template, 'Title', 'Subtitle', 'Footer', slides)
+
+    measure('load cold', lambda: Presentation(io.BytesIO(template)), args.repeat)
+    measure('load warm', lambda: cache.presentation(template), args.repeat)
+    measure('compose cold', lambda: cold.compose(template, 'Title', 'Subtitle', 'Footer', slides), args.repeat)
+    measure('compose warm', lambda: warm.compose(template, 'Title', 'Subtitle', 'Footer', slides), args.repeat)
+    print(f'cache stats    {cache.stats()}')
+
+
+if __name__ == '__main__':
+    main()
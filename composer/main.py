@@ -1,11 +1,14 @@
 from app.config import configurer
-from app.services import ppt_worker, screenshots_ready_worker, dup_ppt_worker
+from app.config.factories import new_blob_store, new_redis_client
+from app.services import ppt_worker, screenshots_ready_worker
+from app.services.blob_store import check_shared
 
 if __name__ == '__main__':
     configurer.configure()
+    # templates and screenshots are blobs of the other services
+    check_shared(new_blob_store(), new_redis_client(), 'composer')
     threads = [
-        ppt_worker.start_worker_thread(),
-        dup_ppt_worker.start_worker_thread(),
+        *ppt_worker.start_worker_threads(),
         screenshots_ready_worker.start_worker_thread(),
     ]
 
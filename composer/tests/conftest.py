@@ -0,0 +1,5 @@
+import os
+
+# settings require a profile and the database password, the tests don't connect to the database
+os.environ.setdefault("PROFILE", "dev")
+os.environ.setdefault("DATABASE_PASSWORD", "test")
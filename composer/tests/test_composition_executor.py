@@ -0,0 +1,52 @@
+"""
+Composition in worker processes
+
+Run from the composer directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.services import composition_executor
+from app.services.composition_executor import ComposeJob, CompositionExecutor
+
+JOB = ComposeJob(template_digest='template', title='Deck', subtitle=None, footer=None, slides=())
+
+
+def crash(job: ComposeJob) -> str:
+    """ Worker process killed while composing, e.g. by the OOM killer """
+    os._exit(1)
+
+
+def echo(job: ComposeJob) -> str:
+    return f'{job.title} in {os.getpid()}'
+
+
+@pytest.fixture
+def executor():
+    executor = CompositionExecutor(processes=1)
+    yield executor
+    executor.shutdown()
+
+
+def test_pool_is_started_again_after_a_worker_process_died(executor, monkeypatch):
+    # spawned processes import the functions by name from this module
+    monkeypatch.setattr(composition_executor, 'compose_job', crash)
+    with pytest.raises(BrokenProcessPool):
+        executor.compose(JOB)
+    assert executor._pool is None
+
+    monkeypatch.setattr(composition_executor, 'compose_job', echo)
+    first = executor.compose(JOB)
+    assert first.startswith('Deck in ')
+    assert int(first.split()[-1]) != os.getpid()
+    # the new pool is kept for the next jobs
+    assert executor.compose(JOB) == first
+
+
+def test_composes_in_the_calling_thread_without_processes(monkeypatch):
+    monkeypatch.setattr(composition_executor, 'compose_job', echo)
+
+    assert CompositionExecutor(processes=0).compose(JOB) == f'Deck in {os.getpid()}'
@@ -0,0 +1,92 @@
+"""
+Images resampled to their placed size
+
+Run from the composer directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from app.services import image_preparer
+from app.services.image_preparer import ImagePreparer, image_size
+
+EMU_PER_INCH = 914400
+
+
+def make_image(size=(1600, 900), image_format: str = 'PNG', mode: str = 'RGB') -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, 'steelblue').save(output, format=image_format)
+    return output.getvalue()
+
+
+def open_image(content: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(content))
+
+
+def test_png_size_is_read_from_the_header(monkeypatch):
+    png = make_image((1234, 567))
+
+    def decode(*args, **kwargs):
+        raise AssertionError('the image is decoded')
+
+    monkeypatch.setattr(image_preparer.Image, 'open', decode)
+    assert image_size(png) == (1234, 567)
+
+
+def test_size_of_other_formats_is_read_by_pillow():
+    assert image_size(make_image((800, 600), 'JPEG')) == (800, 600)
+
+
+def test_image_is_resampled_to_its_largest_placement():
+    image = make_image()
+    images = ImagePreparer(dpi=100)
+
+    images.place(image, 4 * EMU_PER_INCH, 2.25 * EMU_PER_INCH)
+    images.place(image, 8 * EMU_PER_INCH, 4.5 * EMU_PER_INCH)
+    images.place(image, 2 * EMU_PER_INCH, 1.125 * EMU_PER_INCH)
+
+    prepared = images.prepared(image)
+    assert open_image(prepared).size == (800, 450)
+    assert open_image(prepared).format == 'PNG'
+    # every placement embeds the same bytes, python-pptx shares their part
+    assert images.prepared(image) is prepared
+
+
+def test_ratio_is_kept_for_placements_of_another_ratio():
+    image = make_image()
+    images = ImagePreparer(dpi=100)
+
+    images.place(image, 4 * EMU_PER_INCH, 4 * EMU_PER_INCH)
+
+    assert open_image(images.prepared(image)).size == (711, 400)
+
+
+@pytest.mark.parametrize('dpi, width', [(0, 4), (100, 20)])
+def test_image_is_embedded_as_it_is(dpi, width):
+    """ Without resampling or when the placement is larger than the image, images are never scaled up """
+    image = make_image()
+    images = ImagePreparer(dpi=dpi)
+
+    images.place(image, width * EMU_PER_INCH, width * 9 / 16 * EMU_PER_INCH)
+
+    assert images.prepared(image) is image
+
+
+def test_jpeg_stays_jpeg_and_palette_is_converted():
+    jpeg, palette = make_image(image_format='JPEG'), make_image(mode='P')
+    images = ImagePreparer(dpi=100)
+
+    for image in (jpeg, palette):
+        images.place(image, 4 * EMU_PER_INCH, 2.25 * EMU_PER_INCH)
+
+    assert open_image(images.prepared(jpeg)).format == 'JPEG'
+    resampled = open_image(images.prepared(palette))
+    assert (resampled.format, resampled.mode, resampled.size) == ('PNG', 'RGB', (400, 225))
+
+
+def test_size_of_the_source_image():
+    image = make_image((1000, 500))
+
+    assert ImagePreparer().size(image) == (1000, 500)
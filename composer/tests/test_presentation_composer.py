@@ -0,0 +1,167 @@
+"""
+Presentations composed by both composers: texts, pictures, layout fallback and duplicated slides
+
+Run from the composer directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import io
+import re
+import zipfile
+
+import pytest
+from PIL import Image
+from pptx import Presentation
+from pptx.chart.data import CategoryChartData
+from pptx.enum.chart import XL_CHART_TYPE
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml.ns import qn
+from pptx.util import Inches
+
+from app.services.presentation_composer import PresentationComposer, SlideData
+from app.services.template_layout import SlideLayout, TemplateLayout
+from app.services.xml_composer import XmlPresentationComposer
+
+
+@pytest.fixture(params=[PresentationComposer, XmlPresentationComposer], ids=['pptx', 'xml'])
+def composer(request) -> PresentationComposer:
+    return request.param()
+
+
+def make_template() -> bytes:
+    """ Title slide and a slide with a chart, its embedded workbook related as rId3 like PowerPoint does """
+    presentation = Presentation()
+    presentation.slides.add_slide(presentation.slide_layouts[0]).shapes.title.text = 'Title'
+    slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+    slide.shapes.title.text = 'Chart'
+    chart_data = CategoryChartData()
+    chart_data.categories = ['East', 'West']
+    chart_data.add_series('Sales', (1.5, 2.5))
+    slide.shapes.add_chart(XL_CHART_TYPE.COLUMN_CLUSTERED, Inches(1), Inches(2), Inches(6), Inches(4), chart_data)
+
+    output = io.BytesIO()
+    presentation.save(output)
+
+    # python-pptx relates the workbook as rId1, PowerPoint puts the chart style and colors first
+    renumbered = io.BytesIO()
+    with zipfile.ZipFile(output) as source, zipfile.ZipFile(renumbered, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if re.fullmatch(r'ppt/charts/(_rels/)?chart\d+\.xml(\.rels)?', item.filename):
+                data = data.replace(b'"rId1"', b'"rId3"')
+            target.writestr(item, data)
+    return renumbered.getvalue()
+
+
+def make_text_template(*, title_placeholder: bool = True) -> bytes:
+    """ Title slide and a content slide, titled by a placeholder or by a text box """
+    presentation = Presentation()
+    presentation.slides.add_slide(presentation.slide_layouts[0]).shapes.title.text = 'Title'
+    if title_placeholder:
+        presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = 'Content'
+    else:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        slide.shapes.add_textbox(Inches(0.5), Inches(0.3), Inches(9), Inches(1)).text = 'Content'
+
+    output = io.BytesIO()
+    presentation.save(output)
+    return output.getvalue()
+
+
+def make_image(width: int = 1600, height: int = 900) -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), (68, 114, 196)).save(output, format='PNG')
+    return output.getvalue()
+
+
+def compose(composer: PresentationComposer, template: bytes, slides: list[SlideData], **kwargs) -> Presentation:
+    content = composer.compose(template, 'Deck', 'Subtitle', 'Footer', slides, **kwargs)
+    return Presentation(io.BytesIO(content))
+
+
+def texts(slide) -> list[str]:
+    return [shape.text_frame.text for shape in slide.shapes if shape.has_text_frame]
+
+
+def test_title_slide_and_texts(composer):
+    slides = [SlideData(title=f'Slide {i}', content=f'**Sales** <{i}> & more\nsecond line', image=None, option=1)
+              for i in range(3)]
+
+    composed = compose(composer, make_text_template(), slides)
+
+    assert len(composed.slides) == 4
+    assert texts(composed.slides[0])[:2] == ['Deck', 'Subtitle']
+    for i, slide in enumerate(list(composed.slides)[1:]):
+        assert slide.shapes.title.text == f'Slide {i}'
+        textbox = slide.shapes[-2]
+        assert textbox.text_frame.paragraphs[-1].text == f'Sales <{i}> & more\vsecond line'
+        assert textbox.text_frame.word_wrap
+        # the template has no footer on the slides, the one of the slide master is cloned
+        assert slide.shapes[-1].text_frame.text == 'Footer'
+
+
+@pytest.mark.parametrize('option', [1, 3, 4, 5])
+def test_pictures(composer, option):
+    image = make_image()
+    slides = [SlideData(title=f'Slide {i}', content='Sales by region', image=image, option=option) for i in range(3)]
+
+    composed = compose(composer, make_text_template(), slides)
+
+    image_parts = set()
+    for i, slide in enumerate(list(composed.slides)[1:]):
+        # the image takes the whole slide with option 4, the title of the template is kept
+        assert slide.shapes.title.text == ('Content' if option == 4 else f'Slide {i}')
+        shapes = list(slide.shapes)
+        pictures = [shape for shape in shapes if shape.shape_type == MSO_SHAPE_TYPE.PICTURE]
+        assert len(pictures) == 1
+        picture = pictures[0]
+        assert picture.width / picture.height == pytest.approx(1600 / 900, rel=0.01)
+        assert picture.left + picture.width <= composed.slide_width
+        assert picture.top + picture.height <= composed.slide_height
+        # placed under the footer added after it
+        assert shapes.index(picture) < len(shapes) - 1
+        assert shapes[-1].text_frame.text == 'Footer'
+        image_parts.add(picture.image.sha1)
+
+    # the image is embedded once
+    assert len(image_parts) == 1
+
+
+def test_stale_layout_falls_back_to_analysis(composer):
+    template = make_text_template()
+    slides = [SlideData(title=f'Slide {i}', content='Sales by region', image=None, option=1) for i in range(2)]
+    # stored for another template, it has no shapes to place the texts in
+    stale = TemplateLayout(slide_width=9144000, slide_height=6858000, slides=(SlideLayout(),))
+
+    expected = [texts(slide) for slide in compose(composer, template, slides).slides]
+
+    assert [texts(slide) for slide in compose(composer, template, slides, layout=stale).slides] == expected
+    assert expected[1][0] == 'Slide 0'
+    assert expected[1][-1] == 'Footer'
+
+
+def test_title_goes_to_the_text_box_without_title_placeholder(composer):
+    slides = [SlideData(title=f'Slide {i}', content='Sales by region', image=None, option=1) for i in range(2)]
+
+    composed = compose(composer, make_text_template(title_placeholder=False), slides)
+
+    for i, slide in enumerate(list(composed.slides)[1:]):
+        assert texts(slide)[0] == f'Slide {i}'
+        assert slide.shapes.title is None
+
+
+def test_duplicated_charts_refer_to_their_own_workbooks(composer):
+    slides = [SlideData(title=f'Slide {i}', content='Sales by region', image=None, option=1) for i in range(3)]
+
+    composed = Presentation(io.BytesIO(composer.compose(make_template(), 'Title', None, None, slides)))
+
+    chart_parts = []
+    for slide in list(composed.slides)[1:]:
+        chart = next(shape.chart for shape in slide.shapes if shape.has_chart)
+        chart_parts.append(chart.part)
+
+        r_id = chart.part._element.find(qn('c:externalData')).get(qn('r:id'))
+        assert chart.part.rels[r_id].reltype == RT.PACKAGE
+        assert chart.part.chart_workbook.xlsx_part.blob.startswith(b'PK')
+
+    assert len({part.partname for part in chart_parts}) == 3
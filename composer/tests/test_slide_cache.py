@@ -0,0 +1,89 @@
+"""
+Per-slide screenshots cache
+
+Run from the composer directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import io
+
+import fakeredis
+from PIL import Image
+from pptx import Presentation
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.util import Inches
+
+from app.services.screenshot_request import ScreenshotRequest
+from app.services.slide_cache import SlideScreenshot, SlideScreenshotsCache, slide_digests, slide_key
+
+RENDERER_VERSION = '1'
+
+
+def make_image(color: str) -> io.BytesIO:
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(output, format='PNG')
+    output.seek(0)
+    return output
+
+
+def make_deck(titles: list[str], *, picture_color: str = 'steelblue', slide_numbers: bool = False) -> bytes:
+    presentation = Presentation()
+    for title in titles:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+        slide.shapes.title.text = title
+        slide.shapes.add_picture(make_image(picture_color), Inches(1), Inches(2))
+        if slide_numbers:
+            paragraph = slide.shapes.add_textbox(Inches(9), Inches(7), Inches(1), Inches(0.5)).text_frame.paragraphs[0]
+            paragraph._p.append(parse_xml(f'<a:fld {nsdecls("a")} id="{{B6F15528-21DE-4FAA-801E-634DDDAF4B2B}}" '
+                                          f'type="slidenum"><a:t>‹#›</a:t></a:fld>'))
+    output = io.BytesIO()
+    presentation.save(output)
+    return output.getvalue()
+
+
+def test_only_the_changed_slide_gets_another_digest():
+    before = slide_digests(make_deck(['First', 'Second', 'Third']))
+    after = slide_digests(make_deck(['First', 'Changed', 'Third']))
+
+    assert len(before) == 3
+    assert len(set(before)) == 3
+    assert [a == b for a, b in zip(before, after)] == [True, False, True]
+
+
+def test_changed_media_changes_the_digest():
+    assert slide_digests(make_deck(['First'])) != slide_digests(make_deck(['First'], picture_color='orange'))
+
+
+def test_moved_slide_keeps_its_digest_unless_it_shows_its_number():
+    assert slide_digests(make_deck(['First', 'Second']))[1] == slide_digests(make_deck(['Second']))[0]
+
+    numbered = slide_digests(make_deck(['First', 'Second'], slide_numbers=True))
+    assert numbered[1] != slide_digests(make_deck(['Second'], slide_numbers=True))[0]
+
+
+def test_invalid_presentation_has_no_digests():
+    assert slide_digests(b'not a presentation') == []
+
+
+def test_key_depends_on_the_request_but_not_on_the_targets():
+    digest = slide_digests(make_deck(['First']))[0]
+
+    assert slide_key(digest, ScreenshotRequest(targets=(1,))) == slide_key(digest, ScreenshotRequest(targets=(2,)))
+    assert slide_key(digest, ScreenshotRequest()) != slide_key(digest, ScreenshotRequest(width=800))
+
+
+def test_cached_screenshots_are_hits_and_changed_slides_are_misses():
+    cache = SlideScreenshotsCache(fakeredis.FakeRedis(decode_responses=True), ttl=60)
+    request = ScreenshotRequest()
+    before = [slide_key(digest, request) for digest in slide_digests(make_deck(['First', 'Second']))]
+    for position, key in enumerate(before):
+        cache.put(RENDERER_VERSION, key, SlideScreenshot(content_digest=f'content{position}',
+                                                         preview_digest=f'preview{position}'))
+
+    after = [slide_key(digest, request) for digest in slide_digests(make_deck(['First', 'Changed']))]
+
+    assert cache.get_many(RENDERER_VERSION, after) == [
+        SlideScreenshot(content_digest='content0', preview_digest='preview0'), None]
+    # screenshots of another renderer are never reused
+    assert cache.get_many('2', before) == [None, None]
+    assert cache.get_many(RENDERER_VERSION, []) == []
@@ -0,0 +1,97 @@
+"""
+Parsed templates cache
+
+Run from the composer directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import io
+
+from PIL import Image
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.util import Inches
+
+from app.services import template_cache
+from app.services.presentation_composer import PresentationComposer, SlideData
+from app.services.template_cache import TemplateCache
+
+
+def make_template() -> bytes:
+    """ Title slide and a content slide with a picture, a binary part shared by the clones """
+    presentation = Presentation()
+    presentation.slides.add_slide(presentation.slide_layouts[0]).shapes.title.text = 'Title'
+    slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+    slide.shapes.title.text = 'Content'
+    logo = io.BytesIO()
+    Image.new('RGB', (64, 64), (237, 125, 49)).save(logo, format='PNG')
+    slide.shapes.add_picture(logo, Inches(9), Inches(0.2), Inches(0.5), Inches(0.5))
+
+    output = io.BytesIO()
+    presentation.save(output)
+    return output.getvalue()
+
+
+def snapshot(cache: TemplateCache) -> dict[str, bytes]:
+    """ Parts and relationships of the cached packages """
+    result = {}
+    for digest, entry in cache._entries.items():
+        for part in entry.package.iter_parts():
+            result[f'{digest}:{part.partname}'] = part.blob
+            result[f'{digest}:{part.partname}:rels'] = part.rels.xml
+    return result
+
+
+def titles(content: bytes) -> list[str]:
+    return [slide.shapes.title.text for slide in Presentation(io.BytesIO(content)).slides]
+
+
+def test_cached_template_composes_independent_presentations():
+    template = make_template()
+    cache = TemplateCache()
+    composer = PresentationComposer(template_cache=cache)
+
+    first = composer.compose(template, 'First', None, 'Footer', [
+        SlideData(title=f'First {i}', content='Sales', image=None, option=1) for i in range(3)])
+    cached = snapshot(cache)
+    second = composer.compose(template, 'Second', None, None, [
+        SlideData(title='Second 0', content='Units', image=None, option=1)])
+
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 1
+    assert titles(first) == ['First', 'First 0', 'First 1', 'First 2']
+    assert titles(second) == ['Second', 'Second 0']
+    assert snapshot(cache) == cached
+    # the cached package is the template as it was parsed
+    assert titles(composer.compose(template, 'Title', None, None, [])) == ['Title', 'Content']
+
+
+def test_clones_share_binary_parts_but_not_xml():
+    template = make_template()
+    cache = TemplateCache()
+
+    first, second = cache.presentation(template), cache.presentation(template)
+    first.slides[1].shapes.title.text = 'Changed'
+    first.slides.add_slide(first.slide_layouts[1])
+
+    assert second.slides[1].shapes.title.text == 'Content'
+    assert len(second.slides) == 2
+    first_picture, second_picture = (
+        next(shape for shape in presentation.slides[1].shapes if shape.shape_type == MSO_SHAPE_TYPE.PICTURE)
+        for presentation in (first, second)
+    )
+    assert first_picture.image.blob is second_picture.image.blob
+    assert first_picture.part is not second_picture.part
+
+
+def test_templates_are_parsed_for_every_job_when_packages_cant_be_cloned(monkeypatch):
+    monkeypatch.setattr(template_cache, 'clone_supported', lambda: False)
+    template = make_template()
+    cache = TemplateCache()
+
+    first, second = cache.presentation(template), cache.presentation(template)
+
+    assert first.part is not second.part
+    assert cache.stats()['templates'] == 0
+
+
+def test_packages_of_the_installed_python_pptx_can_be_cloned():
+    assert template_cache.clone_supported()
@@ -1,26 +1,32 @@
 
 import logging
+import os
 import sys
 from logging.handlers import RotatingFileHandler
 
 from app.config import settings
 
 
-def configure_all():
-    configure_logging()
+def configure_all(process_name: str | None = None):
+    configure_logging(process_name)
 
 
-def configure_logging():
+def configure_logging(process_name: str | None = None):
+    """ :param process_name: worker processes log to own files, the rotation of a shared file is not process safe """
     handlers = [
         logging.StreamHandler(stream=sys.stdout)
     ]
     if settings.LOG_FILE:
-        handlers.append(RotatingFileHandler(settings.LOG_FILE,
+        log_file = settings.LOG_FILE
+        if process_name:
+            root, ext = os.path.splitext(log_file)
+            log_file = f"{root}.{process_name}{ext}"
+        handlers.append(RotatingFileHandler(log_file,
                                             maxBytes=settings.LOG_FILE_MAX_BYTES,
                                             backupCount=settings.LOG_FILE_BACKUP_COUNT))
 
     logging.basicConfig(
         handlers=handlers,
         level=logging.DEBUG,
-        format="[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s",
+        format="[%(asctime)s] %(levelname)s [%(processName)s] [%(name)s.%(funcName)s:%(lineno)d] %(message)s",
         datefmt='%Y-%m-%dT%H:%M:%S')
@@ -1,25 +1,89 @@
+import threading
 from threading import Lock
+from typing import Callable
 
 import redis
 from redis import Redis
 
 from app.config import settings
-from app.screenshots.excel import ExcelScreenshotMaker
-from app.screenshots.powerpoint import PowerPointScreenshotMaker
+from app.screenshots.instance_pool import InstancePool, RendererInstance
+from app.screenshots.postprocess import ImagePostprocessor
+from app.screenshots.renderer import WorkbookRenderer, PresentationRenderer
+from app.services.blob_store import BlobStore, create_blob_store
+from app.services.reliable_queue import ReliableQueue
 
 
-def new_excel_screenshot_maker() -> ExcelScreenshotMaker:
-    """ Create a new instance of ExcelScreenshotMaker """
+def new_excel_screenshot_maker() -> WorkbookRenderer:
+    """ Create a new workbook renderer of the configured backend """
+    if settings.SS_EXCEL_RENDERER == "headless":
+        # no COM dependencies, works on Linux
+        from app.screenshots.headless_excel import HeadlessExcelScreenshotMaker, RenderOptions
+        from app.screenshots.renderer import get_render_pool
+        options = RenderOptions(max_rows=settings.SS_HEADLESS_MAX_ROWS, max_columns=settings.SS_HEADLESS_MAX_COLUMNS,
+                                scale=settings.SS_HEADLESS_SCALE, font_dir=settings.SS_HEADLESS_FONT_DIR)
+        return HeadlessExcelScreenshotMaker(options=options,
+                                            executor=get_render_pool(settings.SS_HEADLESS_WORKERS))
+
+    from app.screenshots.excel import ExcelScreenshotMaker, new_excel_application
     box = (settings.SS_EXCEL_CROPBOX_X, settings.SS_EXCEL_CROPBOX_Y,
            settings.SS_EXCEL_CROPBOX_WIDTH, settings.SS_EXCEL_CROPBOX_HEIGHT)
-    return ExcelScreenshotMaker(box=box)
+    return ExcelScreenshotMaker(box=box, pool=_get_office_pool("excel", new_excel_application))
+
 
+def new_power_point_screenshot_maker() -> PresentationRenderer:
+    """ Create a new presentation renderer of the configured backend """
+    if settings.SS_POWERPOINT_RENDERER == "headless":
+        # no COM dependencies, works on Linux
+        from app.screenshots.headless_powerpoint import HeadlessPowerPointScreenshotMaker, RenderOptions
+        from app.screenshots.renderer import get_render_pool
+        options = RenderOptions(width=settings.SS_HEADLESS_SLIDE_WIDTH, font_dir=settings.SS_HEADLESS_FONT_DIR)
+        return HeadlessPowerPointScreenshotMaker(options=options,
+                                                 executor=get_render_pool(settings.SS_HEADLESS_WORKERS))
 
-def new_power_point_screenshot_maker() -> PowerPointScreenshotMaker:
-    """ Create a new instance of PowerPointScreenshotMaker """
+    from app.screenshots.powerpoint import PowerPointScreenshotMaker, new_powerpoint_application
     box = (settings.SS_POWERPOINT_CROPBOX_X, settings.SS_POWERPOINT_CROPBOX_Y,
            settings.SS_POWERPOINT_CROPBOX_WIDTH, settings.SS_POWERPOINT_CROPBOX_HEIGHT)
-    return PowerPointScreenshotMaker(box=box)
+    return PowerPointScreenshotMaker(box=box, pool=_get_office_pool("powerpoint", new_powerpoint_application))
+
+
+def new_image_postprocessor() -> ImagePostprocessor:
+    return ImagePostprocessor(quality=settings.SS_IMAGE_QUALITY, quantize_colors=settings.SS_IMAGE_QUANTIZE_COLORS,
+                              preview_width=settings.SS_PREVIEW_WIDTH, thumbnail_width=settings.SS_THUMBNAIL_WIDTH,
+                              variants_format=settings.SS_VARIANTS_FORMAT, trim=settings.SS_AUTOTRIM,
+                              trim_padding=settings.SS_AUTOTRIM_PADDING)
+
+
+# COM objects belong to the thread which created them, so every worker thread has own pools
+_office_pools = threading.local()
+
+
+def _get_office_pool(name: str, factory: Callable[[], RendererInstance]) -> InstancePool | None:
+    """ Get pool of warm Office applications of the current worker thread, None if disabled """
+    if settings.SS_RENDERER_POOL_MAX_JOBS <= 0:
+        return None
+    pools = getattr(_office_pools, "pools", None)
+    if pools is None:
+        pools = _office_pools.pools = {}
+    if name not in pools:
+        # one application per worker
+        pools[name] = new_instance_pool(factory, size=1)
+    return pools[name]
+
+
+def close_office_pools():
+    """ Quit warm Office applications of the current worker thread """
+    for pool in getattr(_office_pools, "pools", {}).values():
+        pool.close()
+    _office_pools.pools = {}
+
+
+def new_instance_pool(factory: Callable[[], RendererInstance], *, size: int = 1) -> InstancePool:
+    """ Create a new instance of InstancePool """
+    max_memory = settings.SS_RENDERER_POOL_MAX_MEMORY_MB * 1024 * 1024 or None
+    return InstancePool(factory, size=size,
+                        max_jobs=settings.SS_RENDERER_POOL_MAX_JOBS,
+                        max_memory=max_memory,
+                        lease_timeout=settings.SS_RENDERER_POOL_LEASE_TIMEOUT)
 
 
 def new_redis_client() -> Redis:
@@ -33,3 +97,20 @@ def new_redis_client() -> Redis:
         socket_connect_timeout=10,
         socket_timeout=10,
     )
+
+
+def new_reliable_queue(redis_conn: Redis, name: str,
+                       on_dead_letter: Callable[[str], None] | None = None) -> ReliableQueue:
+    """ Create a new instance of ReliableQueue """
+    return ReliableQueue(
+        redis_conn, name,
+        visibility_timeout=settings.QUEUE_VISIBILITY_TIMEOUT,
+        retry_delay=settings.QUEUE_RETRY_DELAY,
+        max_attempts=settings.QUEUE_MAX_ATTEMPTS,
+        on_dead_letter=on_dead_letter,
+    )
+
+
+def new_blob_store() -> BlobStore:
+    """ Create a new instance of BlobStore """
+    return create_blob_store(settings.BLOB_STORE_BACKEND, settings.BLOB_STORE_LOCATION)
@@ -7,7 +7,4 @@ QUEUE_SCREENSHOT_RESPONSE = "srv:screenshot:response:%s"
 QUEUE_PPT_REQUEST = "srv:ppt:request"
 QUEUE_PPT_RESPONSE = "srv:ppt:response:%s"
 
-# Queues for PPT slide duplicator
-QUEUE_PPT_DUP_REQUEST = "srv:ppt-dup:request"
-QUEUE_PPT_DUP_RESPONSE = "srv:ppt-dup:response:%s"
 
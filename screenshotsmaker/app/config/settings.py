@@ -35,12 +35,72 @@ REDIS_PORT = config("REDIS_PORT", default=6379, cast=int)
 REDIS_DB = config("REDIS_DB", default=0, cast=int)
 REDIS_PASSWORD = config("REDIS_PASSWORD", default=None)
 
+# Reliable queues config
+QUEUE_VISIBILITY_TIMEOUT = config("QUEUE_VISIBILITY_TIMEOUT", default=60, cast=int)
+QUEUE_RETRY_DELAY = config("QUEUE_RETRY_DELAY", default=10, cast=int)
+QUEUE_MAX_ATTEMPTS = config("QUEUE_MAX_ATTEMPTS", default=5, cast=int)
+
+# Blob store config, the same store as backend and composer: a filesystem location shared over the network,
+# or redis backend with the Redis URL as the location (e.g. redis://:password@host:6379/1)
+BLOB_STORE_BACKEND = config("BLOB_STORE_BACKEND", default="filesystem")
+BLOB_STORE_LOCATION = config("BLOB_STORE_LOCATION", default="blobs")
+
+# Worker processes, every one renders one document at a time
+SS_WORKERS = config("SS_WORKERS", default=1, cast=int)
+# Seconds to wait for the workers to finish their tasks on shutdown
+SS_WORKER_SHUTDOWN_TIMEOUT = config("SS_WORKER_SHUTDOWN_TIMEOUT", default=60, cast=int)
+
+# Office processes sweeper config
+# Deadline of a task: base seconds plus seconds per started MB of the document, capped by max
+SS_TASK_DEADLINE_BASE = config("SS_TASK_DEADLINE_BASE", default=60, cast=int)
+SS_TASK_DEADLINE_PER_MB = config("SS_TASK_DEADLINE_PER_MB", default=30, cast=int)
+SS_TASK_DEADLINE_MAX = config("SS_TASK_DEADLINE_MAX", default=1800, cast=int)
+# Seconds an Office process nobody has registered may live
+SS_SWEEPER_ORPHAN_AGE = config("SS_SWEEPER_ORPHAN_AGE", default=30, cast=int)
+SS_SWEEPER_INTERVAL = config("SS_SWEEPER_INTERVAL", default=10, cast=int)
+
+# Renderers config
+# com - Excel through COM, Windows only; headless - drawn from openpyxl with Pillow, works on Linux
+SS_EXCEL_RENDERER = config("SS_EXCEL_RENDERER", default="com")
+# com - PowerPoint through COM, Windows only; headless - drawn from python-pptx with Pillow, works on Linux
+SS_POWERPOINT_RENDERER = config("SS_POWERPOINT_RENDERER", default="com")
+# Screenshot results are reused only for the same renderer version, change it when rendering changes
+SCREENSHOT_RENDERER_VERSION = config("SCREENSHOT_RENDERER_VERSION",
+                                     default=f"{SS_EXCEL_RENDERER}-{SS_POWERPOINT_RENDERER}-3")
+
+# Screenshots post-processing config
+# palette size of spreadsheet screenshots with more colours, 0 - keep them in true colour
+SS_IMAGE_QUANTIZE_COLORS = config("SS_IMAGE_QUANTIZE_COLORS", default=256, cast=int)
+# quality of JPEG and WebP images
+SS_IMAGE_QUALITY = config("SS_IMAGE_QUALITY", default=85, cast=int)
+SS_PREVIEW_WIDTH = config("SS_PREVIEW_WIDTH", default=800, cast=int)
+SS_THUMBNAIL_WIDTH = config("SS_THUMBNAIL_WIDTH", default=240, cast=int)
+# png, jpeg or webp
+SS_VARIANTS_FORMAT = config("SS_VARIANTS_FORMAT", default="webp")
+# trim whitespace and gridline-only margins of spreadsheet screenshots, keeping the padding in pixels
+SS_AUTOTRIM = config("SS_AUTOTRIM", default=True, cast=bool)
+SS_AUTOTRIM_PADDING = config("SS_AUTOTRIM_PADDING", default=8, cast=int)
+
 # Excel Screenshot Maker config
 SS_EXCEL_CROPBOX_X = config("SS_EXCEL_CROPBOX_X", default=0, cast=int)
 SS_EXCEL_CROPBOX_Y = config("SS_EXCEL_CROPBOX_Y", default=0, cast=int)
 SS_EXCEL_CROPBOX_HEIGHT = config("SS_EXCEL_CROPBOX_HEIGHT", default=768, cast=int)
 SS_EXCEL_CROPBOX_WIDTH = config("SS_EXCEL_CROPBOX_WIDTH", default=1024, cast=int)
 
+# Warm renderer pool config, Office applications are reused between tasks
+# and recycled after max jobs (0 - start and quit for every task) or above the memory high-water mark
+SS_RENDERER_POOL_MAX_JOBS = config("SS_RENDERER_POOL_MAX_JOBS", default=50, cast=int)
+SS_RENDERER_POOL_MAX_MEMORY_MB = config("SS_RENDERER_POOL_MAX_MEMORY_MB", default=1024, cast=int)
+SS_RENDERER_POOL_LEASE_TIMEOUT = config("SS_RENDERER_POOL_LEASE_TIMEOUT", default=600, cast=int)
+
+# Headless renderer config
+SS_HEADLESS_WORKERS = config("SS_HEADLESS_WORKERS", default=None, cast=lambda v: int(v) if v else None)
+SS_HEADLESS_MAX_ROWS = config("SS_HEADLESS_MAX_ROWS", default=200, cast=int)
+SS_HEADLESS_MAX_COLUMNS = config("SS_HEADLESS_MAX_COLUMNS", default=26, cast=int)
+SS_HEADLESS_SCALE = config("SS_HEADLESS_SCALE", default=1.0, cast=float)
+SS_HEADLESS_FONT_DIR = config("SS_HEADLESS_FONT_DIR", default=None)
+SS_HEADLESS_SLIDE_WIDTH = config("SS_HEADLESS_SLIDE_WIDTH", default=1280, cast=int)
+
 # Presentation Screenshot Maker config
 SS_POWERPOINT_CROPBOX_X = config("SS_POWERPOINT_CROPBOX_X", default=0, cast=int)
 SS_POWERPOINT_CROPBOX_Y = config("SS_POWERPOINT_CROPBOX_Y", default=305, cast=int)
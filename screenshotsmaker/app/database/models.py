@@ -27,6 +27,9 @@ class CreatePPTTasks(Base):
     status_message: Mapped[str] = mapped_column(String)
     ppt_template: Mapped[bytes] = mapped_column(LargeBinary)
     created_ppt_content: Mapped[bytes] = mapped_column(LargeBinary)
+    ppt_template_digest: Mapped[str] = mapped_column(String(64))
+    created_ppt_content_digest: Mapped[str] = mapped_column(String(64))
+    screenshot_first_slide_digest: Mapped[str] = mapped_column(String(64))
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow)
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow,
                                                           onupdate=datetime.datetime.utcnow)
@@ -46,6 +49,8 @@ class CreatePPTTasksSlides(Base):
     screenshot: Mapped[bytes] = mapped_column(LargeBinary)
     ppt_task_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
     spreadsheet_screenshot: Mapped[bytes] = mapped_column(LargeBinary)
+    spreadsheet_screenshot_digest: Mapped[str] = mapped_column(String(64))
+    screenshot_digest: Mapped[str] = mapped_column(String(64))
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow)
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow,
                                                           onupdate=datetime.datetime.utcnow)
@@ -75,6 +80,8 @@ class CreateScreenshotTasks(Base):
     status: Mapped[str] = mapped_column(String, nullable=False)
     status_message: Mapped[str] = mapped_column(String)
     content: Mapped[bytes] = mapped_column(LargeBinary)
+    content_digest: Mapped[str] = mapped_column(String(64))
+    request: Mapped[str] = mapped_column(String)
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow)
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow,
                                                           onupdate=datetime.datetime.utcnow)
@@ -89,7 +96,10 @@ class CreateScreenshotTasksScreenshots(Base):
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     position: Mapped[int] = mapped_column(Integer, nullable=False)
-    content: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    content: Mapped[bytes] = mapped_column(LargeBinary)
+    content_digest: Mapped[str] = mapped_column(String(64))
+    preview_digest: Mapped[str] = mapped_column(String(64))
+    thumbnail_digest: Mapped[str] = mapped_column(String(64))
     screenshot_task_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow)
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow,
@@ -99,6 +109,20 @@ class CreateScreenshotTasksScreenshots(Base):
         return f'<CreateScreenshotTasksScreenshots id={self.id} position={self.position}>'
 
 
+class ScreenshotResults(Base):
+
+    __tablename__ = 'screenshot_results'
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    content_digest: Mapped[str] = mapped_column(String(64), nullable=False)
+    renderer_version: Mapped[str] = mapped_column(String(64), nullable=False)
+    screenshot_task_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    def __str__(self):
+        return f'<ScreenshotResults id={self.id} screenshot_task_id={self.screenshot_task_id}>'
+
+
 class DuplicatePPTSlidesTask(Base):
 
     __tablename__ = 'duplicate_ppt_slides_tasks'
@@ -108,6 +132,8 @@ class DuplicatePPTSlidesTask(Base):
     extra_data: Mapped[str] = mapped_column(String)
     ppt_in: Mapped[bytes] = mapped_column(LargeBinary)
     ppt_out: Mapped[bytes] = mapped_column(LargeBinary)
+    ppt_in_digest: Mapped[str] = mapped_column(String(64))
+    ppt_out_digest: Mapped[str] = mapped_column(String(64))
     target_count: Mapped[int] = mapped_column(Integer, nullable=False)
     status: Mapped[str] = mapped_column(String, nullable=False)
     status_message: Mapped[str] = mapped_column(String)
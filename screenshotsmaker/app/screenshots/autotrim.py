@@ -0,0 +1,99 @@
+"""
+Whitespace auto-trim of spreadsheet screenshots
+
+Clips of a worksheet are usually larger than its content: a uniform background and empty
+cells, which show only gridlines, surround the table. The content box is found with a few
+vectorised passes over the green channel of the image, it weighs most in the luminance and is
+extracted without a conversion:
+    - the background is the most frequent shade
+    - rows and columns covered almost completely by non-background pixels are lines:
+      gridlines, borders of the clip. The coverage is counted on every n-th column and row
+    - content is whatever remains, the box is extended to the gridlines enclosing it so that
+      the cells on the edges keep their borders
+"""
+
+import numpy as np
+from PIL import Image
+
+# shades closer to the background are background, covers anti-aliasing and JPEG noise
+_TOLERANCE = 8
+# part of a row or column covered by a gridline
+_LINE_COVERAGE = 0.98
+# thicker runs of covered rows or columns are content, e.g. a filled header
+_MAX_LINE_WIDTH = 3
+# gridlines farther from the content are not cell borders, e.g. the frame of the clip
+_MAX_CELL_SIZE = 160
+# the background is estimated from every n-th pixel
+_SAMPLE_STEP = 8
+# line coverage is counted on every n-th column or row
+_COVERAGE_STEP = 8
+
+
+def content_box(image: Image.Image, *, padding: int = 0) -> tuple[int, int, int, int] | None:
+    """ :return: box (left, upper, right, lower) of the content with padding, None for a blank image """
+
+    # the lines are painted over with the background
+    pixels = _shades(image)
+    height, width = pixels.shape
+    background = int(np.bincount(pixels[::_SAMPLE_STEP, ::_SAMPLE_STEP].ravel(), minlength=256).argmax())
+    low, high = max(background - _TOLERANCE, 0), min(background + _TOLERANCE, 255)
+
+    sampled_columns = pixels[:, ::_COVERAGE_STEP]
+    sampled_rows = pixels[::_COVERAGE_STEP]
+    line_rows = _thin(_ink(sampled_columns, low, high).sum(axis=1, dtype=np.int32)
+                      >= _LINE_COVERAGE * sampled_columns.shape[1])
+    line_columns = _thin(_ink(sampled_rows, low, high).sum(axis=0, dtype=np.int32)
+                         >= _LINE_COVERAGE * sampled_rows.shape[0])
+
+    # a blank row crossed by gridlines has no ink left
+    pixels[line_rows] = background
+    pixels[:, line_columns] = background
+    rows = np.flatnonzero((pixels.min(axis=1) < low) | (pixels.max(axis=1) > high))
+    columns = np.flatnonzero((pixels.min(axis=0) < low) | (pixels.max(axis=0) > high))
+    if not rows.size or not columns.size:
+        return None
+
+    upper, lower = _enclose(rows[0], rows[-1], np.flatnonzero(line_rows))
+    left, right = _enclose(columns[0], columns[-1], np.flatnonzero(line_columns))
+    return (max(left - padding, 0), max(upper - padding, 0),
+            min(right + 1 + padding, width), min(lower + 1 + padding, height))
+
+
+def trim(image: Image.Image, *, padding: int = 0) -> Image.Image:
+    """ :return: image cropped to its content, blank images are kept """
+    box = content_box(image, padding=padding)
+    if box is None or box == (0, 0, *image.size):
+        return image
+    return image.crop(box)
+
+
+def _shades(image: Image.Image) -> np.ndarray:
+    """ :return: writable array of the green channel, the shades of grey images """
+    if image.mode not in ("RGB", "RGBA", "RGBX", "L"):
+        image = image.convert("RGB")
+    # the raw encoder packs a single band without converting the whole image
+    raw = image.tobytes("raw", "L" if image.mode == "L" else "G")
+    return np.frombuffer(bytearray(raw), np.uint8).reshape(image.height, image.width)
+
+
+def _ink(pixels: np.ndarray, low: int, high: int) -> np.ndarray:
+    """ :return: mask of the shades out of [low, high], uint8 wraps around below low """
+    return (pixels - np.uint8(low)) > np.uint8(high - low)
+
+
+def _thin(lines: np.ndarray) -> np.ndarray:
+    """ Drop the runs of lines thicker than a gridline """
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], lines.view(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    thick = ends - starts > _MAX_LINE_WIDTH
+    result = lines.copy()
+    for start, end in zip(starts[thick], ends[thick]):
+        result[start:end] = False
+    return result
+
+
+def _enclose(first: int, last: int, lines: np.ndarray) -> tuple[int, int]:
+    """ Extend the content span to the nearest lines around it """
+    before = lines[(lines < first) & (lines >= first - _MAX_CELL_SIZE)]
+    after = lines[(lines > last) & (lines <= last + _MAX_CELL_SIZE)]
+    return (int(before[-1]) if before.size else int(first)), (int(after[0]) if after.size else int(last))
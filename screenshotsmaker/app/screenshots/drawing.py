@@ -0,0 +1,57 @@
+import logging
+import os
+from functools import lru_cache
+
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+_FONT_FILES = {
+    (False, False): ('DejaVuSans.ttf', 'arial.ttf'),
+    (True, False): ('DejaVuSans-Bold.ttf', 'arialbd.ttf'),
+    (False, True): ('DejaVuSans-Oblique.ttf', 'ariali.ttf', 'DejaVuSans.ttf', 'arial.ttf'),
+    (True, True): ('DejaVuSans-BoldOblique.ttf', 'arialbi.ttf', 'DejaVuSans-Bold.ttf', 'arialbd.ttf'),
+}
+
+
+@lru_cache(maxsize=64)
+def load_font(font_dir: str | None, bold: bool, italic: bool, size: int):
+    """ Load TrueType font of the style, fonts are looked up in font_dir or in the system fonts """
+    size = max(size, 1)
+    for name in _FONT_FILES[(bold, italic)]:
+        try:
+            return ImageFont.truetype(os.path.join(font_dir, name) if font_dir else name, size)
+        except OSError:
+            continue
+    logger.warning(f"No TrueType font found, using the default one")
+    return ImageFont.load_default(size)
+
+
+def fit_text(text: str, font, width: float) -> str:
+    """ Cut text to fit the width """
+    if font.getlength(text) <= width:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if font.getlength(text[:middle]) <= width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def wrap_text(text: str, font, width: float) -> list[str]:
+    """ Break text into lines fitting the width at spaces and line breaks """
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split(' '):
+            candidate = f'{line} {word}' if line else word
+            if line and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(fit_text(line, font, width))
+    return lines
@@ -1,5 +1,6 @@
 import io
 import time
+from contextlib import contextmanager
 from pathlib import Path
 
 import pyautogui
@@ -12,9 +13,14 @@ import win32gui
 from PIL import ImageGrab
 
 from app.screenshots.exceptions import ScreenshotMakerException
-from app.services import win32com_util
+from app.screenshots.instance_pool import InstancePool
+from app.screenshots.office import OfficeApplication, application_pid
+from app.screenshots.renderer import WorkbookRenderer
+from app.services import proc_sweeper, win32com_util
+from app.services.screenshot_request import ScreenshotRequest, USED_RANGE
 
 _XL_MAXIMIZED = -4137
+_DEFAULT_RANGE = "A1:Z200"
 
 
 class SheetDoesntExist(ScreenshotMakerException):
@@ -24,30 +30,41 @@ class SheetDoesntExist(ScreenshotMakerException):
         super().__init__(f"Invalid sheet name: '{sheet_name}'")
 
 
-class ExcelScreenshotMaker:
+def new_excel_application() -> OfficeApplication:
+    """ Create a new, not started Excel instance for the renderer pool """
+    return OfficeApplication('Excel.Application', hwnd_property='Hwnd',
+                             documents_property='Workbooks', configure=_configure_excel)
 
-    def __init__(self, *, box: tuple[int, int, int, int] | None = None):
-        super().__init__()
-        self._box = box
 
-    def make_sheet_screenshots(self, workbook_path: Path) -> list[bytes]:
-        result: list[bytes] = []
-        excel = self._dispatch_excel()
-        try:
-            workbook = excel.Workbooks.Open(str(workbook_path.absolute()), ReadOnly=True)
+def _configure_excel(excel):
+    excel.DisplayAlerts = False
+    excel.AskToUpdateLinks = False
+    excel.Visible = True
+    excel.WindowState = _XL_MAXIMIZED
 
-            for i in range(1, workbook.Worksheets.Count + 1):
-                ss = self._make_sheet_screenshot(workbook.Worksheets(i))
-                result.append(ss)
-        finally:
-            excel.Quit()
+
+class ExcelScreenshotMaker(WorkbookRenderer):
+
+    def __init__(self, *, box: tuple[int, int, int, int] | None = None,
+                 pool: InstancePool[OfficeApplication] | None = None):
+        """
+        :param pool: warm Excel instances, without it Excel is started and quit for every workbook
+        """
+        super().__init__()
+        self._box = box
+        self._pool = pool
+
+    def make_sheet_screenshots(self, workbook_path: Path,
+                               request: ScreenshotRequest = ScreenshotRequest()) -> dict[int, bytes]:
+        result: dict[int, bytes] = {}
+        with self._open_workbook(workbook_path) as workbook:
+            names = [workbook.Worksheets(i).Name for i in range(1, workbook.Worksheets.Count + 1)]
+            for position in request.positions(names):
+                result[position] = self._make_sheet_screenshot(workbook.Worksheets(position + 1), request.cell_range)
         return result
 
     def make_sheet_screenshot(self, workbook_path: Path, sheet_name: str) -> bytes:
-        excel = self._dispatch_excel()
-        try:
-            workbook = excel.Workbooks.Open(str(workbook_path.absolute()), ReadOnly=True, UpdateLinks=False)
-
+        with self._open_workbook(workbook_path) as workbook:
             worksheet = None
             for i in range(1, workbook.Worksheets.Count + 1):
                 ws = workbook.Worksheets(i)
@@ -57,26 +74,49 @@ class ExcelScreenshotMaker:
             if worksheet is None:
                 raise SheetDoesntExist(sheet_name)
             return self._make_sheet_screenshot(worksheet)
+
+    @contextmanager
+    def _open_workbook(self, workbook_path: Path):
+        with self._excel() as excel:
+            workbook = excel.Workbooks.Open(str(workbook_path.absolute()), ReadOnly=True, UpdateLinks=False)
+            try:
+                yield workbook
+            finally:
+                try:
+                    workbook.Close(SaveChanges=False)
+                except Exception:
+                    pass
+
+    @contextmanager
+    def _excel(self):
+        if self._pool:
+            with self._pool.lease() as instance:
+                yield instance.application
+            return
+
+        excel = self._dispatch_excel()
+        pid = application_pid(excel, 'Hwnd')
+        proc_sweeper.register(pid)
+        try:
+            yield excel
         finally:
             try:
                 excel.Quit()
             except Exception:
                 pass
+            proc_sweeper.forget(pid)
 
     def _dispatch_excel(self):
         pythoncom.CoInitialize()
         excel = win32com_util.ensure_dispatch('Excel.Application')
-        excel.DisplayAlerts = False
-        excel.AskToUpdateLinks = False
-        excel.Visible = True
-        excel.WindowState = _XL_MAXIMIZED
+        _configure_excel(excel)
         return excel
 
     def _guardian_kill(self):
         pass
 
-    def _make_sheet_screenshot(self, worksheet) -> bytes:
-        return self._make_sheet_screenshot_clip(worksheet)
+    def _make_sheet_screenshot(self, worksheet, cell_range: str | None = None) -> bytes:
+        return self._make_sheet_screenshot_clip(worksheet, cell_range)
 
     def _make_sheet_screenshot_true(self, worksheet) -> bytes:
         # excel might require some time to be available
@@ -104,11 +144,15 @@ class ExcelScreenshotMaker:
         bio.seek(0)
         return bio.read()
 
-    def _make_sheet_screenshot_clip(self, worksheet) -> bytes:
+    def _make_sheet_screenshot_clip(self, worksheet, cell_range: str | None = None) -> bytes:
         worksheet.Activate()
         # clear clipboard
         pyperclip.copy('')
-        worksheet.Range("A1:Z200").CopyPicture(Format=win32com.client.constants.xlBitmap)
+        if cell_range == USED_RANGE:
+            source = worksheet.UsedRange
+        else:
+            source = worksheet.Range(cell_range or _DEFAULT_RANGE)
+        source.CopyPicture(Format=win32com.client.constants.xlBitmap)
         for i in range(0, 20):
             time.sleep(0.1)
             image = ImageGrab.grabclipboard()
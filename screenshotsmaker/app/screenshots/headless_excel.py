@@ -0,0 +1,510 @@
+"""
+Headless worksheet renderer
+
+Draws worksheets with Pillow from the openpyxl model: values formatted with their number
+formats, fonts, fills, borders, alignment, column widths, row heights and merged cells.
+It needs neither Excel nor a desktop session, so it runs on Linux, sheets are rendered
+in parallel in a process pool.
+"""
+
+import colorsys
+import datetime
+import io
+import os
+import re
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+from openpyxl import load_workbook
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles.colors import COLOR_INDEX
+from openpyxl.utils.cell import get_column_letter, range_boundaries
+from openpyxl.worksheet.worksheet import Worksheet
+
+from app.screenshots.drawing import load_font, fit_text, wrap_text
+from app.screenshots.renderer import WorkbookRenderer, get_render_pool
+from app.services.screenshot_request import ScreenshotRequest, USED_RANGE
+
+# Default Office theme: lt1, dk1, lt2, dk2, accent1..accent6, hyperlink, followed hyperlink
+_THEME_COLORS = ['FFFFFF', '000000', 'E7E6E6', '44546A', '4472C4', 'ED7D31', 'A5A5A5', 'FFC000', '5B9BD5',
+                 '70AD47', '0563C1', '954F72']
+
+_GRIDLINE_COLOR = (212, 212, 212)
+_DEFAULT_COLUMN_WIDTH = 8.43
+_DEFAULT_ROW_HEIGHT = 15.0
+_CELL_PADDING = 3
+_INDENT_WIDTH = 9
+
+_BORDER_WIDTHS = {
+    'hair': 1, 'thin': 1, 'dotted': 1, 'dashed': 1, 'dashDot': 1, 'dashDotDot': 1,
+    'medium': 2, 'mediumDashed': 2, 'mediumDashDot': 2, 'mediumDashDotDot': 2, 'slantDashDot': 2,
+    'thick': 3, 'double': 3,
+}
+
+
+@dataclass(frozen=True)
+class RenderOptions:
+    max_rows: int = 200
+    max_columns: int = 26
+    scale: float = 1.0
+    font_dir: str | None = None
+
+
+class HeadlessExcelScreenshotMaker(WorkbookRenderer):
+
+    def __init__(self, *, options: RenderOptions = RenderOptions(), executor: Executor | None = None):
+        super().__init__()
+        self._options = options
+        self._executor = executor
+
+    def make_sheet_screenshots(self, workbook_path: Path,
+                               request: ScreenshotRequest = ScreenshotRequest()) -> dict[int, bytes]:
+        workbook = load_workbook(workbook_path, read_only=True)
+        try:
+            names = [worksheet.title for worksheet in workbook.worksheets]
+        finally:
+            workbook.close()
+
+        executor = self._executor or get_render_pool()
+        futures = {index: executor.submit(render_sheet, str(workbook_path.absolute()), index, self._options,
+                                          request.cell_range)
+                   for index in request.positions(names)}
+        return {index: future.result() for index, future in futures.items()}
+
+
+# Workbook loaded last in this worker process with the used ranges of its sheets,
+# sheets of one workbook usually come in a row
+_loaded: tuple[tuple[str, float], object, list[tuple[int, int, int, int]]] | None = None
+
+
+def render_sheet(workbook_path: str, sheet_index: int, options: RenderOptions, cell_range: str | None = None) -> bytes:
+    """
+    Render worksheet to PNG, runs in the pool worker process
+    :param cell_range: e.g. B2:H40 or "used", by default the sheet from A1 up to the max rows and columns
+    """
+    global _loaded
+
+    key = (workbook_path, os.path.getmtime(workbook_path))
+    if _loaded is None or _loaded[0] != key:
+        workbook = load_workbook(workbook_path, data_only=True)
+        # painting adds empty cells to the model, so the used ranges are taken before
+        used_ranges = [(ws.min_column, ws.min_row, ws.max_column, ws.max_row) for ws in workbook.worksheets]
+        _loaded = (key, workbook, used_ranges)
+    _, workbook, used_ranges = _loaded
+
+    bounds = _sheet_bounds(used_ranges[sheet_index], cell_range, options)
+    image = _SheetPainter(workbook.worksheets[sheet_index], options, bounds).paint()
+    bio = io.BytesIO()
+    image.save(bio, format='PNG', optimize=True)
+    return bio.getvalue()
+
+
+def _sheet_bounds(used_range: tuple[int, int, int, int], cell_range: str | None,
+                  options: RenderOptions) -> tuple[int, int, int, int]:
+    """ :return: first column, first row, last column and last row to paint """
+    min_col, min_row, max_col, max_row = (value or 1 for value in used_range)
+    if cell_range == USED_RANGE:
+        return min_col, min_row, max(max_col, min_col), max(max_row, min_row)
+    if cell_range:
+        min_col, min_row, max_col, max_row = range_boundaries(cell_range.replace('$', ''))
+        return min_col, min_row, max_col or min_col, max_row or min_row
+    return 1, 1, max(1, min(max_col, options.max_columns)), max(1, min(max_row, options.max_rows))
+
+
+class _SheetPainter:
+
+    def __init__(self, sheet: Worksheet, options: RenderOptions, bounds: tuple[int, int, int, int]):
+        self._sheet = sheet
+        self._options = options
+        self._scale = options.scale
+
+        # first and last painted column and row
+        self._min_column, self._min_row, self._columns, self._rows = bounds
+
+        # left edges of the painted columns and top edges of the painted rows, plus the right and bottom edges
+        self._x = [0]
+        for column in range(self._min_column, self._columns + 1):
+            self._x.append(self._x[-1] + self._column_width(column))
+        self._y = [0]
+        for row in range(self._min_row, self._rows + 1):
+            self._y.append(self._y[-1] + self._row_height(row))
+
+        # top left cell of every merged range -> its last row and column
+        self._merged: dict[tuple[int, int], tuple[int, int]] = {}
+        for merged_range in sheet.merged_cells.ranges:
+            min_col, min_row, max_col, max_row = range_boundaries(merged_range.coord)
+            if self._min_row <= min_row <= self._rows and self._min_column <= min_col <= self._columns:
+                self._merged[(min_row, min_col)] = (min(max_row, self._rows), min(max_col, self._columns))
+
+        self._image = Image.new('RGB', (max(self._x[-1], 1), max(self._y[-1], 1)), 'white')
+        self._draw = ImageDraw.Draw(self._image)
+
+    def paint(self) -> Image.Image:
+        cells = [(cell, self._cell_box(cell)) for cell in self._iter_cells()]
+
+        if self._sheet.sheet_view.showGridLines is not False:
+            self._paint_gridlines()
+        for cell, box in cells:
+            self._paint_fill(cell, box)
+        for cell, box in cells:
+            self._paint_borders(cell, box)
+        for cell, box in cells:
+            self._paint_text(cell, box)
+
+        return self._image
+
+    def _iter_cells(self):
+        for row in self._sheet.iter_rows(min_row=self._min_row, max_row=self._rows, min_col=self._min_column,
+                                         max_col=self._columns):
+            for cell in row:
+                if not isinstance(cell, MergedCell):
+                    yield cell
+
+    def _column_width(self, column: int) -> int:
+        dimension = self._sheet.column_dimensions.get(get_column_letter(column))
+        if dimension is not None and dimension.hidden:
+            return 0
+        width = dimension.width if dimension is not None and dimension.customWidth else None
+        width = width or self._sheet.sheet_format.defaultColWidth or _DEFAULT_COLUMN_WIDTH
+        return round((width * 7 + 5) * self._scale)
+
+    def _row_height(self, row: int) -> int:
+        dimension = self._sheet.row_dimensions.get(row)
+        if dimension is not None and dimension.hidden:
+            return 0
+        height = dimension.ht if dimension is not None else None
+        height = height or self._sheet.sheet_format.defaultRowHeight or _DEFAULT_ROW_HEIGHT
+        return round(height * 96 / 72 * self._scale)
+
+    def _cell_box(self, cell) -> tuple[int, int, int, int]:
+        last_row, last_column = self._merged.get((cell.row, cell.column), (cell.row, cell.column))
+        column, row = cell.column - self._min_column, cell.row - self._min_row
+        return (self._x[column], self._y[row],
+                self._x[last_column - self._min_column + 1], self._y[last_row - self._min_row + 1])
+
+    def _paint_gridlines(self):
+        width, height = self._image.size
+        for x in self._x[1:]:
+            self._draw.line([(x - 1, 0), (x - 1, height)], fill=_GRIDLINE_COLOR)
+        for y in self._y[1:]:
+            self._draw.line([(0, y - 1), (width, y - 1)], fill=_GRIDLINE_COLOR)
+
+    def _paint_fill(self, cell, box):
+        color = None
+        fill = cell.fill
+        if fill is not None and fill.fill_type == 'solid':
+            color = _to_rgb(fill.fgColor)
+        if color is None and (cell.row, cell.column) in self._merged:
+            # hide gridlines inside merged range
+            color = (255, 255, 255)
+        if color is not None:
+            x0, y0, x1, y1 = box
+            if x1 > x0 and y1 > y0:
+                self._draw.rectangle([x0, y0, x1 - 1, y1 - 1], fill=color)
+
+    def _paint_borders(self, cell, box):
+        border = cell.border
+        if border is None:
+            return
+        x0, y0, x1, y1 = box
+        if x1 <= x0 or y1 <= y0:
+            return
+        sides = (
+            (border.left, [(x0, y0), (x0, y1 - 1)]),
+            (border.right, [(x1 - 1, y0), (x1 - 1, y1 - 1)]),
+            (border.top, [(x0, y0), (x1 - 1, y0)]),
+            (border.bottom, [(x0, y1 - 1), (x1 - 1, y1 - 1)]),
+        )
+        for side, line in sides:
+            if side is None or not side.style:
+                continue
+            width = max(1, round(_BORDER_WIDTHS.get(side.style, 1) * self._scale))
+            self._draw.line(line, fill=_to_rgb(side.color) or (0, 0, 0), width=width)
+
+    def _paint_text(self, cell, box):
+        value = cell.value
+        if value is None or value == '':
+            return
+
+        text = format_value(value, cell.number_format)
+        if not text:
+            return
+
+        x0, y0, x1, y1 = box
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        font_style = cell.font
+        size = (font_style.sz or 11) * 96 / 72 * self._scale
+        font = load_font(self._options.font_dir, bool(font_style.b), bool(font_style.i), round(size))
+        color = _to_rgb(font_style.color) or (0, 0, 0)
+
+        alignment = cell.alignment
+        horizontal = alignment.horizontal or 'general'
+        if horizontal == 'general':
+            if isinstance(value, bool):
+                horizontal = 'center'
+            elif isinstance(value, (int, float, datetime.date, datetime.time, datetime.timedelta)):
+                horizontal = 'right'
+            else:
+                horizontal = 'left'
+
+        padding = round(_CELL_PADDING * self._scale)
+        indent = round((alignment.indent or 0) * _INDENT_WIDTH * self._scale)
+        left, right = x0 + padding + (indent if horizontal == 'left' else 0), x1 - padding - \
+            (indent if horizontal == 'right' else 0)
+        available = max(right - left, 1)
+
+        # dates and times are numbers to Excel
+        is_number = isinstance(value, (int, float, datetime.date, datetime.time, datetime.timedelta)) and \
+            not isinstance(value, bool)
+
+        if alignment.wrap_text and not is_number:
+            lines = wrap_text(text, font, available)
+        else:
+            line = text.replace('\n', ' ')
+            if font.getlength(line) > available:
+                if is_number:
+                    # Excel shows numbers that don't fit as ####
+                    line = '#' * max(1, int(available // max(font.getlength('#'), 1)))
+                elif horizontal == 'left' and (cell.row, cell.column) not in self._merged:
+                    # text overflows into the empty cells on the right
+                    right = self._overflow_right(cell, right)
+                    available = right - left
+                line = fit_text(line, font, available)
+            lines = [line]
+
+        ascent, descent = font.getmetrics()
+        line_height = ascent + descent
+        text_height = line_height * len(lines)
+
+        vertical = alignment.vertical or 'bottom'
+        if vertical == 'top':
+            y = y0 + padding // 2
+        elif vertical in ('center', 'justify', 'distributed'):
+            y = y0 + (y1 - y0 - text_height) / 2
+        else:
+            y = y1 - text_height - padding // 2
+
+        for line in lines:
+            width = font.getlength(line)
+            if horizontal in ('center', 'centerContinuous', 'distributed'):
+                x = x0 + (x1 - x0 - width) / 2
+            elif horizontal == 'right':
+                x = right - width
+            else:
+                x = left
+            self._draw.text((x, y), line, font=font, fill=color)
+            if font_style.u:
+                self._draw.line([(x, y + ascent + 1), (x + width, y + ascent + 1)], fill=color)
+            y += line_height
+
+    def _overflow_right(self, cell, right: int) -> int:
+        for column in range(cell.column + 1, self._columns + 1):
+            neighbour = self._sheet.cell(row=cell.row, column=column)
+            if isinstance(neighbour, MergedCell) or neighbour.value not in (None, ''):
+                break
+            right = self._x[column - self._min_column + 1] - round(_CELL_PADDING * self._scale)
+        return right
+
+
+def _to_rgb(color) -> tuple[int, int, int] | None:
+    """ Convert openpyxl color to RGB, None for automatic color """
+    if color is None:
+        return None
+
+    rgb = None
+    if color.type == 'rgb' and isinstance(color.rgb, str):
+        rgb = color.rgb[-6:]
+    elif color.type == 'theme' and isinstance(color.theme, int) and color.theme < len(_THEME_COLORS):
+        rgb = _THEME_COLORS[color.theme]
+    elif color.type == 'indexed' and isinstance(color.indexed, int) and color.indexed < len(COLOR_INDEX):
+        if color.indexed in (64, 65):
+            # system foreground and background
+            return None
+        rgb = COLOR_INDEX[color.indexed][-6:]
+    if rgb is None:
+        return None
+
+    try:
+        r, g, b = int(rgb[0:2], 16), int(rgb[2:4], 16), int(rgb[4:6], 16)
+    except ValueError:
+        return None
+
+    tint = color.tint or 0
+    if tint:
+        h, l, s = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
+        l = l * (1 + tint) if tint < 0 else l * (1 - tint) + tint
+        r, g, b = (round(c * 255) for c in colorsys.hls_to_rgb(h, l, s))
+    return r, g, b
+
+
+# Number formats
+
+_LITERAL_RE = re.compile(r'"([^"]*)"|\\(.)|_.|\*.|\[[^\]]*\]')
+_DATE_TOKEN_RE = re.compile(r'yyyy|yy|mmmmm|mmmm|mmm|mm|m|dddd|ddd|dd|d|hh|h|ss|s|AM/PM|A/P|\.0+', re.IGNORECASE)
+
+
+def format_value(value, number_format: str | None) -> str:
+    """ Format cell value as Excel displays it """
+
+    number_format = number_format or 'General'
+
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return _format_date(value, number_format)
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    if isinstance(value, (int, float)):
+        return _format_number(value, number_format)
+    return str(value)
+
+
+def _split_sections(number_format: str) -> list[str]:
+    sections, current, quoted = [], '', False
+    for char in number_format:
+        if char == '"':
+            quoted = not quoted
+        if char == ';' and not quoted:
+            sections.append(current)
+            current = ''
+        else:
+            current += char
+    sections.append(current)
+    return sections
+
+
+def _format_general(value: int | float) -> str:
+    if isinstance(value, int) or float(value).is_integer() and abs(value) < 1e11:
+        return str(int(value))
+    text = f'{value:.10g}'
+    if 'e' not in text:
+        return text
+    mantissa, exponent = f'{value:.5E}'.split('E')
+    return f"{mantissa.rstrip('0').rstrip('.')}E{exponent}"
+
+
+def _format_number(value: int | float, number_format: str) -> str:
+    sections = _split_sections(number_format)
+    if value < 0 and len(sections) > 1:
+        section, value = sections[1], -value
+    elif value == 0 and len(sections) > 2:
+        section = sections[2]
+    else:
+        section = sections[0]
+
+    if section.strip().lower() in ('general', ''):
+        text = _format_general(value)
+        return text if section.strip() else ''
+
+    # literal text is kept, fill and padding characters and colors are dropped
+    parts = []
+    position = 0
+    for match in _LITERAL_RE.finditer(section):
+        parts.append(('pattern', section[position:match.start()]))
+        literal = match.group(1) if match.group(1) is not None else match.group(2)
+        if literal is None and match.group(0).startswith('_'):
+            literal = ' '
+        parts.append(('literal', literal or ''))
+        position = match.end()
+    parts.append(('pattern', section[position:]))
+    pattern = ''.join(text for kind, text in parts if kind == 'pattern')
+
+    digits = re.search(r'[0#?][0#?,]*(\.[0#?]*)?(E[+-][0#?]+)?', pattern, re.IGNORECASE)
+    if not digits:
+        if '@' in pattern:
+            return _format_general(value)
+        return ''.join(text for _, text in parts)
+
+    value *= 100 ** pattern.count('%')
+    number = digits.group(0)
+    decimals = len(digits.group(1)) - 1 if digits.group(1) else 0
+
+    if digits.group(2):
+        text = f'{value:.{decimals}E}'
+        mantissa, exponent = text.split('E')
+        text = f'{mantissa}E{int(exponent):+03d}'
+    else:
+        integer_part = number.split('.')[0]
+        grouping = ',' in integer_part.rstrip(',')
+        # trailing commas scale by thousands
+        value /= 1000 ** (len(integer_part) - len(integer_part.rstrip(',')))
+        text = f'{value:{"," if grouping else ""}.{decimals}f}'
+        # optional decimal digits
+        optional = decimals - digits.group(1).count('0') if digits.group(1) else 0
+        while optional and text.endswith('0'):
+            text = text[:-1]
+            optional -= 1
+        if integer_part.rstrip(',').replace(',', '').startswith('#') and text.startswith('0') and decimals:
+            text = text[1:]
+
+    result, placed = '', False
+    for kind, part in parts:
+        if kind == 'literal':
+            result += part
+            continue
+        if not placed and number in part:
+            start = part.index(number)
+            result += part[:start] + text + part[start + len(number):]
+            placed = True
+        else:
+            result += part
+    return result
+
+
+def _format_date(value, number_format: str) -> str:
+    section = _split_sections(number_format)[0]
+    if section.strip().lower() in ('general', '') or not re.search(r'[ymdhs]', section, re.IGNORECASE):
+        if isinstance(value, datetime.datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S' if value.time() != datetime.time() else '%Y-%m-%d')
+        return value.isoformat()
+
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    elif isinstance(value, datetime.time):
+        value = datetime.datetime.combine(datetime.date(1899, 12, 30), value)
+
+    section = _LITERAL_RE.sub(lambda m: m.group(1) if m.group(1) is not None else (m.group(2) or ''), section)
+    twelve_hours = re.search(r'AM/PM|A/P', section, re.IGNORECASE) is not None
+
+    tokens = list(_DATE_TOKEN_RE.finditer(section))
+    result, position = '', 0
+    for index, match in enumerate(tokens):
+        result += section[position:match.start()]
+        position = match.end()
+        token = match.group(0)
+        lower = token.lower()
+
+        if lower.startswith('m') and len(lower) <= 2:
+            # m is minutes right after hours or before seconds
+            previous = tokens[index - 1].group(0).lower() if index > 0 else ''
+            following = tokens[index + 1].group(0).lower() if index + 1 < len(tokens) else ''
+            if previous.startswith('h') or following.startswith('s'):
+                result += f'{value.minute:02d}' if lower == 'mm' else str(value.minute)
+                continue
+
+        hour = value.hour % 12 or 12 if twelve_hours else value.hour
+        result += {
+            'yyyy': f'{value.year:04d}',
+            'yy': f'{value.year % 100:02d}',
+            'mmmmm': value.strftime('%B')[:1],
+            'mmmm': value.strftime('%B'),
+            'mmm': value.strftime('%b'),
+            'mm': f'{value.month:02d}',
+            'm': str(value.month),
+            'dddd': value.strftime('%A'),
+            'ddd': value.strftime('%a'),
+            'dd': f'{value.day:02d}',
+            'd': str(value.day),
+            'hh': f'{hour:02d}',
+            'h': str(hour),
+            'ss': f'{value.second:02d}',
+            's': str(value.second),
+            'am/pm': 'AM' if value.hour < 12 else 'PM',
+            'a/p': 'A' if value.hour < 12 else 'P',
+        }.get(lower) or (f'{value.microsecond / 1e6:.{len(token) - 1}f}'[1:] if lower.startswith('.') else token)
+    result += section[position:]
+    return result
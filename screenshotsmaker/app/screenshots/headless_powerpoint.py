@@ -0,0 +1,671 @@
+"""
+Headless slide rasterizer
+
+Draws slides with Pillow from the python-pptx model: backgrounds, master and layout
+decorations, pictures, basic autoshapes, tables and text frames with the formatting
+inherited from layout and master placeholders and text styles. Charts, SmartArt, effects
+and rotation are not drawn, the PowerPoint renderer stays for pixel exact screenshots.
+Slides are rendered in parallel in a process pool.
+"""
+
+import colorsys
+import io
+import os
+import re
+from concurrent.futures import Executor
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE, PP_PLACEHOLDER
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+
+from app.screenshots.drawing import load_font, fit_text
+from app.screenshots.renderer import PresentationRenderer, get_render_pool
+from app.services.screenshot_request import ScreenshotRequest
+
+_EMU_PER_POINT = 12700
+_DEFAULT_FONT_SIZE = 18
+_LINE_SPACING = 1.2
+
+# Default inset of text frames, EMU
+_INSETS = {'lIns': 91440, 'tIns': 45720, 'rIns': 91440, 'bIns': 45720}
+
+_CELL_MARGINS = {'lIns': 'marL', 'tIns': 'marT', 'rIns': 'marR', 'bIns': 'marB'}
+
+_DEFAULT_CLR_MAP = {'bg1': 'lt1', 'tx1': 'dk1', 'bg2': 'lt2', 'tx2': 'dk2'}
+
+_PRESET_COLORS = {'black': '000000', 'white': 'FFFFFF', 'red': 'FF0000', 'green': '008000', 'blue': '0000FF',
+                  'yellow': 'FFFF00', 'gray': '808080', 'grey': '808080'}
+
+_TITLE_TYPES = (PP_PLACEHOLDER.TITLE, PP_PLACEHOLDER.CENTER_TITLE, PP_PLACEHOLDER.VERTICAL_TITLE)
+_OTHER_TYPES = (PP_PLACEHOLDER.DATE, PP_PLACEHOLDER.FOOTER, PP_PLACEHOLDER.SLIDE_NUMBER)
+
+
+@dataclass(frozen=True)
+class RenderOptions:
+    width: int = 1280
+    font_dir: str | None = None
+
+
+class HeadlessPowerPointScreenshotMaker(PresentationRenderer):
+
+    def __init__(self, *, options: RenderOptions = RenderOptions(), executor: Executor | None = None):
+        super().__init__()
+        self._options = options
+        self._executor = executor
+
+    def make_slides_screenshots(self, presentation_path: Path,
+                                request: ScreenshotRequest = ScreenshotRequest()) -> dict[int, bytes]:
+        presentation = Presentation(str(presentation_path))
+        names = [slide.name for slide in presentation.slides]
+
+        options = self._options
+        if request.width is not None or request.height is not None:
+            # slides are drawn at the requested size rather than scaled afterwards
+            width, _ = request.target_size(presentation.slide_width, presentation.slide_height)
+            options = replace(options, width=width)
+
+        executor = self._executor or get_render_pool()
+        futures = {index: executor.submit(render_slide, str(presentation_path.absolute()), index, options)
+                   for index in request.positions(names)}
+        return {index: future.result() for index, future in futures.items()}
+
+
+# Presentation loaded last in this worker process, slides of one presentation usually come in a row
+_loaded: tuple[tuple[str, float], object] | None = None
+
+
+def render_slide(presentation_path: str, slide_index: int, options: RenderOptions) -> bytes:
+    """ Render slide to PNG, runs in the pool worker process """
+    global _loaded
+
+    key = (presentation_path, os.path.getmtime(presentation_path))
+    if _loaded is None or _loaded[0] != key:
+        _loaded = (key, Presentation(presentation_path))
+    presentation = _loaded[1]
+
+    image = _SlidePainter(presentation, presentation.slides[slide_index], options).paint()
+    bio = io.BytesIO()
+    image.save(bio, format='PNG', optimize=True)
+    return bio.getvalue()
+
+
+@dataclass
+class _Transform:
+    """ Maps EMU of the current shapes tree to pixels """
+    dx: float
+    dy: float
+    sx: float
+    sy: float
+
+    def box(self, left, top, width, height) -> tuple[float, float, float, float]:
+        x0, y0 = self.dx + (left or 0) * self.sx, self.dy + (top or 0) * self.sy
+        return x0, y0, x0 + (width or 0) * self.sx, y0 + (height or 0) * self.sy
+
+
+@dataclass
+class _RunStyle:
+    font: object
+    color: tuple[int, int, int]
+    underline: bool
+    size: float
+
+
+class _SlidePainter:
+
+    def __init__(self, presentation, slide, options: RenderOptions):
+        self._presentation = presentation
+        self._slide = slide
+        self._layout = slide.slide_layout
+        self._master = self._layout.slide_master
+        self._options = options
+
+        self._scale = options.width / presentation.slide_width
+        size = (options.width, max(round(presentation.slide_height * self._scale), 1))
+        self._image = Image.new('RGB', size, 'white')
+        self._draw = ImageDraw.Draw(self._image)
+
+        self._theme_colors = self._load_theme_colors()
+        clr_map = self._master._element.find(qn('p:clrMap'))
+        self._clr_map = dict(clr_map.attrib) if clr_map is not None else dict(_DEFAULT_CLR_MAP)
+        self._default_text_style = self._presentation.part._element.find(qn('p:defaultTextStyle'))
+        self._tx_styles = self._master._element.find(qn('p:txStyles'))
+
+    def paint(self) -> Image.Image:
+        self._paint_background()
+
+        transform = _Transform(0, 0, self._scale, self._scale)
+        if self._shows_master_shapes(self._slide):
+            if self._shows_master_shapes(self._layout):
+                self._paint_shapes(self._master.shapes, transform, decorations_only=True)
+            self._paint_shapes(self._layout.shapes, transform, decorations_only=True)
+        self._paint_shapes(self._slide.shapes, transform)
+
+        return self._image
+
+    # Background
+
+    def _paint_background(self):
+        for source in (self._slide, self._layout, self._master):
+            bg = source._element.find(f"{qn('p:cSld')}/{qn('p:bg')}")
+            if bg is None:
+                continue
+            bg_pr = bg.find(qn('p:bgPr'))
+            if bg_pr is not None:
+                blip = bg_pr.find(f"{qn('a:blipFill')}/{qn('a:blip')}")
+                if blip is not None:
+                    self._paste_blip(source.part, blip, (0, 0, *self._image.size))
+                    return
+                color = self._fill_color(bg_pr)
+            else:
+                bg_ref = bg.find(qn('p:bgRef'))
+                color = self._color(bg_ref) if bg_ref is not None else None
+            if color:
+                self._draw.rectangle([0, 0, *self._image.size], fill=color)
+            return
+
+    def _paste_blip(self, part, blip, box):
+        r_id = blip.get(qn('r:embed'))
+        if not r_id:
+            return
+        try:
+            blob = part.related_part(r_id).blob
+            picture = Image.open(io.BytesIO(blob)).convert('RGBA')
+        except Exception:
+            return
+        self._paste(picture, box)
+
+    def _paste(self, picture: Image.Image, box):
+        x0, y0, x1, y1 = (round(v) for v in box)
+        if x1 <= x0 or y1 <= y0:
+            return
+        picture = picture.resize((x1 - x0, y1 - y0), Image.LANCZOS)
+        self._image.paste(picture, (x0, y0), picture)
+
+    # Shapes
+
+    def _shows_master_shapes(self, source) -> bool:
+        return source._element.get('showMasterSp') not in ('0', 'false')
+
+    def _paint_shapes(self, shapes, transform: _Transform, decorations_only: bool = False):
+        for shape in shapes:
+            if decorations_only and shape.is_placeholder:
+                continue
+            try:
+                self._paint_shape(shape, transform)
+            except Exception:
+                # one broken shape doesn't spoil the slide
+                continue
+
+    def _paint_shape(self, shape, transform: _Transform):
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            self._paint_shapes(shape.shapes, self._group_transform(shape, transform))
+            return
+
+        box = transform.box(shape.left, shape.top, shape.width, shape.height)
+
+        if getattr(shape, 'has_table', False) and shape.has_table:
+            self._paint_table(shape.table, box, transform)
+            return
+
+        if self._is_picture(shape):
+            self._paint_picture(shape, box)
+
+        sp_pr = shape._element.find(qn('p:spPr'))
+        if sp_pr is not None and shape._element.tag == qn('p:sp'):
+            self._paint_geometry(shape, sp_pr, box)
+        elif shape._element.tag == qn('p:cxnSp'):
+            self._paint_connector(shape, sp_pr, box)
+
+        if shape.has_text_frame:
+            self._paint_text_frame(shape, box)
+
+    def _group_transform(self, group, transform: _Transform) -> _Transform:
+        xfrm = group._element.find(f"{qn('p:grpSpPr')}/{qn('a:xfrm')}")
+        if xfrm is None:
+            return transform
+
+        def point(tag, x, y):
+            el = xfrm.find(qn(tag))
+            return (int(el.get(x, 0)), int(el.get(y, 0))) if el is not None else (0, 0)
+
+        off_x, off_y = point('a:off', 'x', 'y')
+        ext_x, ext_y = point('a:ext', 'cx', 'cy')
+        ch_off_x, ch_off_y = point('a:chOff', 'x', 'y')
+        ch_ext_x, ch_ext_y = point('a:chExt', 'cx', 'cy')
+        kx = ext_x / ch_ext_x if ch_ext_x else 1
+        ky = ext_y / ch_ext_y if ch_ext_y else 1
+        return _Transform(
+            dx=transform.dx + (off_x - ch_off_x * kx) * transform.sx,
+            dy=transform.dy + (off_y - ch_off_y * ky) * transform.sy,
+            sx=transform.sx * kx,
+            sy=transform.sy * ky,
+        )
+
+    def _is_picture(self, shape) -> bool:
+        if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+            return True
+        return shape.is_placeholder and shape._element.tag == qn('p:pic')
+
+    def _paint_picture(self, shape, box):
+        try:
+            picture = Image.open(io.BytesIO(shape.image.blob)).convert('RGBA')
+        except Exception:
+            return
+        width, height = picture.size
+        crop = (shape.crop_left, shape.crop_top, shape.crop_right, shape.crop_bottom)
+        if any(crop):
+            left, top, right, bottom = crop
+            picture = picture.crop((round(width * left), round(height * top),
+                                    round(width * (1 - right)), round(height * (1 - bottom))))
+        self._paste(picture, box)
+
+    def _paint_geometry(self, shape, sp_pr, box):
+        geometry = sp_pr.find(qn('a:prstGeom'))
+        preset = geometry.get('prst') if geometry is not None else 'rect'
+
+        fill = self._fill_color(sp_pr)
+        if fill is None and sp_pr.find(qn('a:noFill')) is None:
+            fill = self._style_color(shape, 'a:fillRef')
+        outline, width = self._line(shape, sp_pr)
+
+        if fill is None and outline is None:
+            return
+
+        x0, y0, x1, y1 = box
+        if x1 - x0 < 1 or y1 - y0 < 1:
+            if outline is not None:
+                self._draw.line([(x0, y0), (x1, y1)], fill=outline, width=width)
+            return
+        xy = [x0, y0, x1 - 1, y1 - 1]
+        kwargs = {'fill': fill, 'outline': outline, 'width': width}
+
+        if preset == 'ellipse':
+            self._draw.ellipse(xy, **kwargs)
+        elif preset in ('roundRect', 'round2SameRect', 'snipRoundRect'):
+            self._draw.rounded_rectangle(xy, radius=min(x1 - x0, y1 - y0) / 6, **kwargs)
+        elif preset == 'triangle':
+            self._draw.polygon([((x0 + x1) / 2, y0), (x1, y1), (x0, y1)], **kwargs)
+        elif preset == 'rtTriangle':
+            self._draw.polygon([(x0, y0), (x1, y1), (x0, y1)], **kwargs)
+        elif preset == 'diamond':
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            self._draw.polygon([(cx, y0), (x1, cy), (cx, y1), (x0, cy)], **kwargs)
+        elif preset in ('line', 'straightConnector1'):
+            self._draw.line([(x0, y0), (x1, y1)], fill=outline or fill, width=width)
+        else:
+            self._draw.rectangle(xy, **kwargs)
+
+    def _paint_connector(self, shape, sp_pr, box):
+        outline, width = self._line(shape, sp_pr) if sp_pr is not None else (None, 1)
+        if outline is None:
+            return
+        x0, y0, x1, y1 = box
+        xfrm = sp_pr.find(qn('a:xfrm')) if sp_pr is not None else None
+        if xfrm is not None and xfrm.get('flipH') == '1':
+            x0, x1 = x1, x0
+        if xfrm is not None and xfrm.get('flipV') == '1':
+            y0, y1 = y1, y0
+        self._draw.line([(x0, y0), (x1, y1)], fill=outline, width=width)
+
+    def _line(self, shape, sp_pr) -> tuple[tuple[int, int, int] | None, int]:
+        ln = sp_pr.find(qn('a:ln'))
+        width = 1
+        color = None
+        if ln is not None:
+            if ln.find(qn('a:noFill')) is not None:
+                return None, 1
+            if ln.get('w'):
+                width = max(1, round(int(ln.get('w')) * self._scale))
+            color = self._fill_color(ln)
+        if color is None:
+            color = self._style_color(shape, 'a:lnRef')
+        return color, width
+
+    def _style_color(self, shape, ref_tag: str):
+        ref = shape._element.find(f"{qn('p:style')}/{qn(ref_tag)}")
+        if ref is None or ref.get('idx') in (None, '0'):
+            return None
+        return self._color(ref)
+
+    # Tables
+
+    def _paint_table(self, table, box, transform: _Transform):
+        x0, y0, _, _ = box
+        xs = [x0]
+        for column in table.columns:
+            xs.append(xs[-1] + column.width * transform.sx)
+        ys = [y0]
+        for row in table.rows:
+            ys.append(ys[-1] + row.height * transform.sy)
+
+        for row_index, row in enumerate(table.rows):
+            for column_index, cell in enumerate(row.cells):
+                if cell.is_spanned:
+                    continue
+                last_row = row_index + max(cell.span_height, 1)
+                last_column = column_index + max(cell.span_width, 1)
+                cell_box = (xs[column_index], ys[row_index], xs[last_column], ys[last_row])
+
+                tc_pr = cell._tc.find(qn('a:tcPr'))
+                fill = self._fill_color(tc_pr) if tc_pr is not None else None
+                self._draw.rectangle([cell_box[0], cell_box[1], cell_box[2] - 1, cell_box[3] - 1],
+                                     fill=fill, outline=(191, 191, 191))
+                self._paint_text_body(cell._tc.find(qn('a:txBody')), None, cell_box, tc_pr)
+
+    # Text
+
+    def _paint_text_frame(self, shape, box):
+        tx_body = shape._element.find(qn('p:txBody'))
+        if tx_body is None:
+            return
+        self._paint_text_body(tx_body, shape, box)
+
+    def _paint_text_body(self, tx_body, shape, box, cell_pr=None):
+        if tx_body is None:
+            return
+        paragraphs = tx_body.findall(qn('a:p'))
+        if not any(p.find(qn('a:r')) is not None or p.find(qn('a:fld')) is not None for p in paragraphs):
+            return
+
+        chain = self._style_chain(shape, tx_body)
+        # font color of the shape style overrides colors of the inherited text styles
+        default_color = self._style_color(shape, 'a:fontRef') if shape is not None else None
+        body_pr = self._body_properties(chain, cell_pr)
+
+        if cell_pr is not None:
+            # table cells have margins instead of insets
+            insets = {name: int(cell_pr.get(margin, _INSETS[name])) * self._scale
+                      for name, margin in _CELL_MARGINS.items()}
+        else:
+            insets = {name: int(body_pr.get(name, default)) * self._scale for name, default in _INSETS.items()}
+
+        x0, y0, x1, y1 = box
+        left, top = x0 + insets['lIns'], y0 + insets['tIns']
+        right, bottom = x1 - insets['rIns'], y1 - insets['bIns']
+        wrap = body_pr.get('wrap') != 'none'
+
+        font_scale = 1.0
+        autofit = body_pr.find(qn('a:normAutofit'))
+        if autofit is not None and autofit.get('fontScale'):
+            font_scale = int(autofit.get('fontScale')) / 100000
+
+        lines = []
+        auto_numbers: dict[int, int] = {}
+        for paragraph in paragraphs:
+            lines.extend(self._layout_paragraph(paragraph, chain, left, right, wrap, font_scale, default_color,
+                                                auto_numbers))
+
+        text_height = sum(line[2] for line in lines)
+        anchor = body_pr.get('anchor', 't')
+        if anchor == 'ctr':
+            y = top + (bottom - top - text_height) / 2
+        elif anchor == 'b':
+            y = bottom - text_height
+        else:
+            y = top
+
+        for segments, x, height, ascent in lines:
+            for text, style, width in segments:
+                baseline_y = y + (height / _LINE_SPACING - style.size) / 2 + ascent - style.font.getmetrics()[0]
+                self._draw.text((x, baseline_y), text, font=style.font, fill=style.color)
+                if style.underline:
+                    underline_y = baseline_y + style.font.getmetrics()[0] + 1
+                    self._draw.line([(x, underline_y), (x + width, underline_y)], fill=style.color)
+                x += width
+            y += height
+
+    def _layout_paragraph(self, paragraph, chain, left, right, wrap, font_scale, default_color, auto_numbers):
+        p_pr = paragraph.find(qn('a:pPr'))
+        level = int(p_pr.get('lvl', 0)) if p_pr is not None else 0
+        level_tag = f'a:lvl{level + 1}pPr'
+
+        def paragraph_property(name, default=None):
+            if p_pr is not None and p_pr.get(name) is not None:
+                return p_pr.get(name)
+            for list_style in chain:
+                pr = list_style.find(qn(level_tag)) if list_style is not None else None
+                if pr is not None and pr.get(name) is not None:
+                    return pr.get(name)
+            return default
+
+        def bullet():
+            for pr in [p_pr] + [s.find(qn(level_tag)) if s is not None else None for s in chain]:
+                if pr is None:
+                    continue
+                if pr.find(qn('a:buNone')) is not None:
+                    return None
+                bu_char = pr.find(qn('a:buChar'))
+                if bu_char is not None:
+                    return bu_char.get('char', '•')
+                if pr.find(qn('a:buAutoNum')) is not None:
+                    auto_numbers[level] = auto_numbers.get(level, 0) + 1
+                    return f'{auto_numbers[level]}.'
+            return None
+
+        align = paragraph_property('algn', 'l')
+        margin = int(paragraph_property('marL', 0)) * self._scale
+        indent = int(paragraph_property('indent', 0)) * self._scale
+
+        tokens = []
+        for child in paragraph:
+            if child.tag in (qn('a:r'), qn('a:fld')):
+                text = ''.join(t.text or '' for t in child.iter(qn('a:t')))
+                style = self._run_style(child.find(qn('a:rPr')), chain, level_tag, font_scale, default_color)
+                for part in re.split(r'(\v|\n)', text):
+                    if part in ('\v', '\n'):
+                        tokens.append(('\n', style))
+                    elif part:
+                        tokens.extend((word, style) for word in re.findall(r'\S+\s*|\s+', part))
+            elif child.tag == qn('a:br'):
+                style = self._run_style(child.find(qn('a:rPr')), chain, level_tag, font_scale, default_color)
+                tokens.append(('\n', style))
+
+        end_style = self._run_style(paragraph.find(qn('a:endParaRPr')), chain, level_tag, font_scale, default_color)
+        has_text = any(token.strip() for token, _ in tokens)
+        bullet_text = bullet() if has_text else None
+        if bullet_text:
+            first_style = next(style for token, style in tokens if token.strip())
+            tokens.insert(0, (f'{bullet_text} ', first_style))
+
+        # lines of (segments of (text, style, width), x, height, ascent)
+        lines = []
+        start = left + margin + indent
+        available = max(right - start, 1)
+        segments, width = [], 0.0
+
+        def flush(next_start):
+            nonlocal segments, width, start, available
+            styles = [style for _, style, _ in segments] or [end_style]
+            height = max(style.size for style in styles) * _LINE_SPACING
+            ascent = max(style.font.getmetrics()[0] for style in styles)
+            if align == 'ctr':
+                x = start + (right - start - width) / 2
+            elif align == 'r':
+                x = right - width
+            else:
+                x = start
+            lines.append((segments, x, height, ascent))
+            segments, width = [], 0.0
+            start = next_start
+            available = max(right - start, 1)
+
+        for token, style in tokens:
+            if token == '\n':
+                flush(left + margin)
+                continue
+            token_width = style.font.getlength(token)
+            if wrap and segments and width + style.font.getlength(token.rstrip()) > available:
+                flush(left + margin)
+                token = token.lstrip()
+                token_width = style.font.getlength(token)
+            if wrap and token_width > available:
+                token = fit_text(token, style.font, available)
+                token_width = style.font.getlength(token)
+            segments.append((token, style, token_width))
+            width += token_width
+        flush(left + margin)
+
+        return lines
+
+    def _run_style(self, r_pr, chain, level_tag, font_scale, default_color) -> _RunStyle:
+        candidates = [r_pr] + [
+            s.find(f"{qn(level_tag)}/{qn('a:defRPr')}") if s is not None else None for s in chain
+        ]
+        # run properties and the list style of the shape itself
+        own = [c for c in candidates[:2] if c is not None]
+        candidates = [c for c in candidates if c is not None]
+
+        def attribute(name, default=None):
+            for candidate in candidates:
+                if candidate.get(name) is not None:
+                    return candidate.get(name)
+            return default
+
+        color = None
+        color_candidates = own if default_color is not None else candidates
+        for candidate in color_candidates:
+            color = self._fill_color(candidate)
+            if color is not None:
+                break
+        if color is None:
+            color = default_color or self._scheme_color('tx1') or (0, 0, 0)
+
+        size_pt = int(attribute('sz', _DEFAULT_FONT_SIZE * 100)) / 100 * font_scale
+        size = size_pt * _EMU_PER_POINT * self._scale
+        bold = attribute('b') in ('1', 'true')
+        italic = attribute('i') in ('1', 'true')
+        underline = attribute('u', 'none') != 'none'
+        return _RunStyle(font=load_font(self._options.font_dir, bold, italic, round(size)),
+                         color=color, underline=underline, size=size)
+
+    def _style_chain(self, shape, tx_body) -> list:
+        """ List styles the text inherits from, nearest first """
+        chain = [tx_body.find(qn('a:lstStyle'))]
+
+        if shape is not None and shape.is_placeholder:
+            base = shape
+            while True:
+                base = getattr(base, '_base_placeholder', None)
+                if base is None:
+                    break
+                chain.append(base._element.find(f"{qn('p:txBody')}/{qn('a:lstStyle')}"))
+
+            placeholder_type = shape.placeholder_format.type
+            if placeholder_type in _TITLE_TYPES:
+                style = 'p:titleStyle'
+            elif placeholder_type in _OTHER_TYPES:
+                style = 'p:otherStyle'
+            else:
+                style = 'p:bodyStyle'
+            chain.append(self._tx_styles.find(qn(style)) if self._tx_styles is not None else None)
+        else:
+            chain.append(self._tx_styles.find(qn('p:otherStyle')) if self._tx_styles is not None else None)
+            chain.append(self._default_text_style)
+
+        return chain
+
+    def _body_properties(self, chain, cell_pr):
+        """ bodyPr of the shape merged with the bodyPr of placeholders it inherits from """
+        merged = parse_xml(f'<a:bodyPr xmlns:a="{_A_NS}"/>')
+        bodies = []
+        for list_style in chain:
+            if list_style is not None and list_style.getparent() is not None:
+                body_pr = list_style.getparent().find(qn('a:bodyPr'))
+                if body_pr is not None:
+                    bodies.append(body_pr)
+        for body_pr in reversed(bodies):
+            for name, value in body_pr.attrib.items():
+                merged.set(name, value)
+            autofit = body_pr.find(qn('a:normAutofit'))
+            if autofit is not None and body_pr is bodies[0]:
+                merged.append(parse_xml(f'<a:normAutofit xmlns:a="{_A_NS}" '
+                                        f'fontScale="{autofit.get("fontScale", "100000")}"/>'))
+        if cell_pr is not None and cell_pr.get('anchor'):
+            merged.set('anchor', cell_pr.get('anchor'))
+        return merged
+
+    # Colors
+
+    def _load_theme_colors(self) -> dict[str, str]:
+        try:
+            theme = parse_xml(self._master.part.part_related_by(RT.THEME).blob)
+        except Exception:
+            return {}
+        scheme = theme.find(f"{qn('a:themeElements')}/{qn('a:clrScheme')}")
+        colors = {}
+        for child in scheme if scheme is not None else []:
+            name = child.tag.split('}')[-1]
+            value = child.find(qn('a:srgbClr'))
+            if value is not None:
+                colors[name] = value.get('val')
+            value = child.find(qn('a:sysClr'))
+            if value is not None:
+                colors[name] = value.get('lastClr')
+        return colors
+
+    def _scheme_color(self, name: str) -> tuple[int, int, int] | None:
+        name = self._clr_map.get(name, name)
+        value = self._theme_colors.get(name)
+        return _hex_to_rgb(value) if value else None
+
+    def _fill_color(self, element) -> tuple[int, int, int] | None:
+        """ Color of solid or gradient fill child of the element """
+        solid = element.find(qn('a:solidFill'))
+        if solid is not None:
+            return self._color(solid)
+        gradient = element.find(qn('a:gradFill'))
+        if gradient is not None:
+            stop = gradient.find(f"{qn('a:gsLst')}/{qn('a:gs')}")
+            if stop is not None:
+                return self._color(stop)
+        return None
+
+    def _color(self, element) -> tuple[int, int, int] | None:
+        """ Color of the color choice child of the element """
+        for child in element:
+            name = child.tag.split('}')[-1]
+            if name == 'srgbClr':
+                rgb = _hex_to_rgb(child.get('val'))
+            elif name == 'schemeClr':
+                rgb = self._scheme_color(child.get('val'))
+            elif name == 'sysClr':
+                rgb = _hex_to_rgb(child.get('lastClr'))
+            elif name == 'prstClr':
+                rgb = _hex_to_rgb(_PRESET_COLORS.get(child.get('val'), '000000'))
+            else:
+                continue
+            return _apply_color_modifiers(rgb, child) if rgb else None
+        return None
+
+
+_A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+
+def _hex_to_rgb(value: str | None) -> tuple[int, int, int] | None:
+    if not value or len(value) < 6:
+        return None
+    try:
+        return int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16)
+    except ValueError:
+        return None
+
+
+def _apply_color_modifiers(rgb: tuple[int, int, int], element) -> tuple[int, int, int]:
+    r, g, b = (c / 255 for c in rgb)
+    for modifier in element:
+        name = modifier.tag.split('}')[-1]
+        value = int(modifier.get('val', 100000)) / 100000
+        if name in ('lumMod', 'lumOff'):
+            h, l, s = colorsys.rgb_to_hls(r, g, b)
+            l = l * value if name == 'lumMod' else l + value
+            r, g, b = colorsys.hls_to_rgb(h, min(max(l, 0), 1), s)
+        elif name == 'tint':
+            r, g, b = (c + (1 - c) * (1 - value) for c in (r, g, b))
+        elif name == 'shade':
+            r, g, b = (c * value for c in (r, g, b))
+    return round(r * 255), round(g * 255), round(b * 255)
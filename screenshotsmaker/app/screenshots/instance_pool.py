@@ -0,0 +1,195 @@
+"""
+Pool of warm renderer instances
+
+Starting Excel or PowerPoint costs more than rendering a document, so the applications
+are kept running between tasks. The pool starts up to size instances on demand, leases
+an idle one to a task and takes it back afterwards. An instance is recycled (stopped and
+replaced by a fresh one on the next lease) after max jobs, when its memory exceeds the
+high-water mark or when it fails the health check.
+
+The pool knows nothing about the rendering backend, instances implement RendererInstance.
+"""
+
+import logging
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Generic, Iterator, TypeVar
+
+from app.screenshots.exceptions import ScreenshotMakerException
+
+logger = logging.getLogger(__name__)
+
+
+class RendererInstance(ABC):
+    """ A running renderer application """
+
+    @abstractmethod
+    def start(self):
+        """ Start the application """
+
+    @abstractmethod
+    def stop(self):
+        """ Stop the application, must not raise """
+
+    @abstractmethod
+    def is_healthy(self) -> bool:
+        """ :return: False if the application doesn't respond and must be replaced """
+
+    def memory_usage(self) -> int | None:
+        """ :return: memory used by the application in bytes, None if unknown """
+        return None
+
+    def leased(self):
+        """ The instance is leased to a task """
+
+    def returned(self):
+        """ The instance is returned to the pool """
+
+
+I = TypeVar("I", bound=RendererInstance)
+
+
+class PoolExhausted(ScreenshotMakerException):
+    """ Raised when no instance becomes idle in time """
+
+    def __init__(self, timeout: float):
+        super().__init__(f"No renderer instance is available in {timeout} seconds")
+
+
+class _Slot(Generic[I]):
+
+    def __init__(self, instance: I):
+        self.instance = instance
+        self.jobs = 0
+
+
+class InstancePool(Generic[I]):
+
+    def __init__(self, factory: Callable[[], I], *,
+                 size: int = 1,
+                 max_jobs: int = 50,
+                 max_memory: int | None = None,
+                 lease_timeout: float = 600):
+        """
+        :param factory: creates a new, not started instance
+        :param size: max number of running instances
+        :param max_jobs: recycle an instance after this number of jobs
+        :param max_memory: recycle an instance using more memory, bytes
+        :param lease_timeout: seconds to wait for an idle instance
+        """
+        super().__init__()
+        self._factory = factory
+        self._max_jobs = max_jobs
+        self._max_memory = max_memory
+        self._lease_timeout = lease_timeout
+
+        self._idle: queue.LifoQueue[_Slot[I]] = queue.LifoQueue()
+        # slots available for a new instance, a slot is taken by every running instance
+        self._free = threading.Semaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"started": 0, "recycled": 0, "jobs": 0}
+
+    @contextmanager
+    def lease(self) -> Iterator[I]:
+        """ Lease an instance for one job """
+
+        slot = self._acquire()
+        slot.instance.leased()
+        failed = False
+        try:
+            yield slot.instance
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            slot.jobs += 1
+            self._release(slot, failed)
+
+    def close(self):
+        """ Stop idle instances, leased ones are stopped when returned """
+
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                slot = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._stop(slot)
+
+    def _acquire(self) -> _Slot[I]:
+        deadline = time.monotonic() + self._lease_timeout
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise ScreenshotMakerException("Renderer pool is closed")
+            try:
+                slot = self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                if slot.instance.is_healthy():
+                    return slot
+                logger.warning(f"Renderer instance {slot.instance} failed the health check, recycling")
+                self.stats["recycled"] += 1
+                self._stop(slot)
+                continue
+
+            if self._free.acquire(blocking=False):
+                return self._start()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolExhausted(self._lease_timeout)
+            try:
+                slot = self._idle.get(timeout=min(remaining, 1))
+            except queue.Empty:
+                continue
+            self._idle.put(slot)
+
+    def _start(self) -> _Slot[I]:
+        instance = self._factory()
+        try:
+            instance.start()
+        except BaseException:
+            self._free.release()
+            raise
+        self.stats["started"] += 1
+        logger.info(f"Started renderer instance {instance}")
+        return _Slot(instance)
+
+    def _release(self, slot: _Slot[I], failed: bool):
+        self.stats["jobs"] += 1
+        slot.instance.returned()
+
+        reason = self._recycle_reason(slot, failed)
+        if reason or self._closed:
+            if reason:
+                logger.info(f"Recycling renderer instance {slot.instance}: {reason}")
+                self.stats["recycled"] += 1
+            self._stop(slot)
+        else:
+            self._idle.put(slot)
+
+    def _recycle_reason(self, slot: _Slot[I], failed: bool) -> str | None:
+        if slot.jobs >= self._max_jobs:
+            return f"{slot.jobs} jobs done"
+        if self._max_memory:
+            memory = slot.instance.memory_usage()
+            if memory and memory > self._max_memory:
+                return f"uses {memory // (1024 * 1024)} MB"
+        if failed and not slot.instance.is_healthy():
+            return "health check failed"
+        return None
+
+    def _stop(self, slot: _Slot[I]):
+        try:
+            slot.instance.stop()
+        except Exception as e:
+            logger.warning(f"Failed to stop renderer instance {slot.instance}: {e}")
+        finally:
+            self._free.release()
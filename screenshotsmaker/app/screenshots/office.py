@@ -0,0 +1,74 @@
+from typing import Callable
+
+import psutil
+import pythoncom
+import win32process
+
+from app.screenshots.instance_pool import RendererInstance
+from app.services import proc_sweeper, win32com_util
+
+
+class OfficeApplication(RendererInstance):
+    """ Office application driven through COM, the instance must be used by the thread which started it """
+
+    def __init__(self, app_name: str, *, hwnd_property: str = "Hwnd", documents_property: str = "Workbooks",
+                 configure: Callable[[object], None] | None = None):
+        super().__init__()
+        self._app_name = app_name
+        self._hwnd_property = hwnd_property
+        self._documents_property = documents_property
+        self._configure = configure
+        self.application = None
+        self.pid: int | None = None
+
+    def __repr__(self):
+        return f"{self._app_name}(pid={self.pid})"
+
+    def start(self):
+        pythoncom.CoInitialize()
+        self.application = win32com_util.ensure_dispatch(self._app_name)
+        if self._configure:
+            self._configure(self.application)
+        self.pid = application_pid(self.application, self._hwnd_property)
+        proc_sweeper.register(self.pid)
+
+    def stop(self):
+        try:
+            # single instance applications (PowerPoint) are shared by the worker processes,
+            # it is not quit while another worker has documents open in it
+            if self.application is not None and getattr(self.application, self._documents_property).Count == 0:
+                self.application.Quit()
+        except Exception:
+            pass
+        finally:
+            self.application = None
+            if self.pid is not None:
+                proc_sweeper.forget(self.pid)
+
+    def is_healthy(self) -> bool:
+        if self.application is None or self.pid is None or not psutil.pid_exists(self.pid):
+            return False
+        try:
+            _ = self.application.Version
+            return True
+        except Exception:
+            return False
+
+    def memory_usage(self) -> int | None:
+        try:
+            return psutil.Process(self.pid).memory_info().rss
+        except (psutil.Error, TypeError):
+            return None
+
+    def leased(self):
+        # owned by the current task, killed by the sweeper when the task is overdue
+        proc_sweeper.register(self.pid)
+
+    def returned(self):
+        proc_sweeper.release(self.pid)
+
+
+def application_pid(application, hwnd_property: str = "Hwnd") -> int:
+    """ :return: pid of the Office application process """
+    _, pid = win32process.GetWindowThreadProcessId(getattr(application, hwnd_property))
+    return pid
@@ -0,0 +1,103 @@
+"""
+Screenshot post-processing
+
+Rendered PNGs are scaled to the requested size and encoded compactly: PNGs are optimised
+and flat images (spreadsheets) are stored with a palette, which is lossless while the image
+has no more than 256 colours. Whitespace around the content of flat images is trimmed
+first, see autotrim. Smaller preview and thumbnail variants are generated once
+for the clients which show screenshots in a gallery, spreadsheet screenshots are
+never shown there and get none.
+"""
+
+import io
+from dataclasses import dataclass
+
+from PIL import Image
+
+from app.screenshots import autotrim
+from app.services.screenshot_request import ScreenshotRequest
+
+
+@dataclass(frozen=True)
+class Variants:
+    full: bytes
+    preview: bytes | None = None
+    thumbnail: bytes | None = None
+
+
+class ImagePostprocessor:
+
+    def __init__(self, *, quality: int = 85, quantize_colors: int = 256,
+                 preview_width: int = 800, thumbnail_width: int = 240, variants_format: str = "webp",
+                 trim: bool = True, trim_padding: int = 8):
+        """
+        :param quality: quality of lossy formats (JPEG, WebP)
+        :param quantize_colors: palette size of flat images with more colours, 0 keeps them in true colour
+        :param variants_format: format of the preview and thumbnail variants
+        :param trim: trim whitespace and gridline-only margins of flat images
+        :param trim_padding: pixels kept around the trimmed content
+        """
+        super().__init__()
+        self._quality = quality
+        self._quantize_colors = quantize_colors
+        self._preview_width = preview_width
+        self._thumbnail_width = thumbnail_width
+        self._variants_format = variants_format
+        self._trim = trim
+        self._trim_padding = trim_padding
+
+    def make_variants(self, png: bytes, request: ScreenshotRequest, *, flat: bool = False,
+                      gallery: bool = True) -> Variants:
+        """
+        :param flat: the image is flat (a spreadsheet), it's trimmed and stored with a palette
+        :param gallery: make the preview and thumbnail variants too
+        """
+        image = Image.open(io.BytesIO(png))
+        image.load()
+        if flat and self._trim:
+            image = autotrim.trim(image, padding=self._trim_padding)
+        full = self._scale(image, request.target_size(*image.size))
+        if not gallery:
+            return Variants(full=self.encode(full, request.format, flat=flat))
+        # colours of the scaled down variants needn't be exact
+        return Variants(
+            full=self.encode(full, request.format, flat=flat),
+            preview=self.encode(self._scale_to_width(full, self._preview_width), self._variants_format, flat=flat,
+                                exact=False),
+            thumbnail=self.encode(self._scale_to_width(full, self._thumbnail_width), self._variants_format,
+                                  flat=flat, exact=False),
+        )
+
+    def encode(self, image: Image.Image, image_format: str, *, flat: bool = False, exact: bool = True) -> bytes:
+        bio = io.BytesIO()
+        if image_format == "jpeg":
+            image.convert("RGB").save(bio, format="JPEG", quality=self._quality, optimize=True, progressive=True)
+            return bio.getvalue()
+
+        image = self._to_palette(image, flat, exact)
+        if image_format == "webp":
+            # lossy WebP blurs text of flat images, while their palette compresses well losslessly
+            image.convert("RGB").save(bio, format="WEBP", lossless=flat, quality=self._quality, method=4)
+        else:
+            image.save(bio, format="PNG", optimize=True)
+        return bio.getvalue()
+
+    def _to_palette(self, image: Image.Image, flat: bool, exact: bool) -> Image.Image:
+        if not flat or image.mode != "RGB":
+            return image
+        if exact and image.getcolors(256) is not None:
+            # median cut keeps the exact colours while there are no more than 256 of them
+            return image.quantize(256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        if self._quantize_colors:
+            return image.quantize(self._quantize_colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        return image
+
+    def _scale(self, image: Image.Image, size: tuple[int, int]) -> Image.Image:
+        if size == image.size:
+            return image
+        return image.resize(size, Image.LANCZOS)
+
+    def _scale_to_width(self, image: Image.Image, width: int) -> Image.Image:
+        if image.width <= width:
+            return image
+        return image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
@@ -5,13 +5,18 @@ import re
 import shutil
 import tempfile
 import time
+from contextlib import contextmanager
 from pathlib import Path
 
 import pyautogui
 import pythoncom
 
 from app.screenshots.exceptions import ScreenshotMakerException
-from app.services import win32com_util
+from app.screenshots.instance_pool import InstancePool
+from app.screenshots.office import OfficeApplication, application_pid
+from app.screenshots.renderer import PresentationRenderer
+from app.services import proc_sweeper, win32com_util
+from app.services.screenshot_request import ScreenshotRequest
 
 logger = logging.getLogger(__name__)
 
@@ -33,26 +38,61 @@ class PowerPointBringToFrontException(ScreenshotMakerException):
         super().__init__("Can't bring PowerPoint to the front")
 
 
-class PowerPointScreenshotMaker:
+def new_powerpoint_application() -> OfficeApplication:
+    """ Create a new, not started PowerPoint instance for the renderer pool """
+    return OfficeApplication('Powerpoint.Application', hwnd_property='HWND',
+                             documents_property='Presentations', configure=_configure_powerpoint)
 
-    def __init__(self, *, box: tuple[int, int, int, int] | None = None):
+
+def _configure_powerpoint(powerpoint):
+    powerpoint.Visible = True
+    powerpoint.WindowState = PP_WINDOW_MAXIMIZED
+    powerpoint.Activate()
+
+
+class PowerPointScreenshotMaker(PresentationRenderer):
+
+    def __init__(self, *, box: tuple[int, int, int, int] | None = None,
+                 pool: InstancePool[OfficeApplication] | None = None):
+        """
+        :param pool: warm PowerPoint instances, without it PowerPoint is started and quit for every presentation
+        """
         super().__init__()
         self._box = box
+        self._pool = pool
+
+    def make_slides_screenshots(self, presentation_path: Path,
+                                request: ScreenshotRequest = ScreenshotRequest()) -> dict[int, bytes]:
+        with self._powerpoint() as powerpoint:
+            presentation = powerpoint.Presentations.Open(str(presentation_path.absolute()), ReadOnly=True)
+            try:
+                return self._make_slides_images(presentation, request)
+            finally:
+                try:
+                    presentation.Close()
+                except Exception:
+                    pass
+
+    @contextmanager
+    def _powerpoint(self):
+        if self._pool:
+            with self._pool.lease() as instance:
+                yield instance.application
+            return
 
-    def make_slides_screenshots(self, presentation_path: Path) -> list[bytes]:
         pythoncom.CoInitialize()
-        # powerpoint = win32.gencache.EnsureDispatch('Powerpoint.Application')
         powerpoint = win32com_util.ensure_dispatch('Powerpoint.Application')
+        pid = None
         try:
-            powerpoint.Visible = True
-            powerpoint.WindowState = PP_WINDOW_MAXIMIZED
-            powerpoint.Activate()
-
-            presentation = powerpoint.Presentations.Open(str(presentation_path.absolute()), ReadOnly=True)
-            return self._make_slides_images(presentation)
+            _configure_powerpoint(powerpoint)
+            pid = application_pid(powerpoint, 'HWND')
+            proc_sweeper.register(pid)
+            yield powerpoint
         finally:
             powerpoint.Quit()
             del powerpoint
+            if pid is not None:
+                proc_sweeper.forget(pid)
 
     def _make_slides_screenshots(self, presentation) -> list[bytes]:
         shots = []
@@ -68,7 +108,8 @@ class PowerPointScreenshotMaker:
 
         return shots
 
-    def _make_slides_images(self, presentation) -> list[bytes]:
+    def _make_slides_images(self, presentation,
+                            request: ScreenshotRequest = ScreenshotRequest()) -> dict[int, bytes]:
         def extract_int(s: str, default: int | None = None):
             match = re.search(r'\d+', s)
             if match:
@@ -76,16 +117,28 @@ class PowerPointScreenshotMaker:
             else:
                 return default
 
-        result = []
+        # Export scales slides to the requested size, without it they get the PowerPoint default size
+        size = self._export_size(presentation, request)
+
+        result = {}
         target_dir = None
         try:
             target_dir = tempfile.mktemp(prefix="pp_ss_", suffix=str(int(time.time())))
-            presentation.Export(target_dir, "png")
-            files = [f for f in Path(target_dir).glob("*.png")]
-            files.sort(key=lambda f: extract_int(f.name))
+            if request.targets is None:
+                presentation.Export(target_dir, "png", *size)
+                files = [f for f in Path(target_dir).glob("*.png")]
+                files.sort(key=lambda f: extract_int(f.name))
 
-            for f in files:
-                result.append(f.read_bytes())
+                for position, f in enumerate(files):
+                    result[position] = f.read_bytes()
+            else:
+                os.makedirs(target_dir)
+                slides = presentation.Slides
+                names = [slides(i).Name for i in range(1, slides.Count + 1)]
+                for position in request.positions(names):
+                    f = Path(target_dir) / f"slide{position + 1}.png"
+                    slides(position + 1).Export(str(f), "PNG", *size)
+                    result[position] = f.read_bytes()
         finally:
             if target_dir and os.path.isdir(target_dir):
                 try:
@@ -95,6 +148,11 @@ class PowerPointScreenshotMaker:
 
         return result
 
+    def _export_size(self, presentation, request: ScreenshotRequest) -> tuple[int, ...]:
+        if request.width is None and request.height is None:
+            return ()
+        return request.target_size(presentation.PageSetup.SlideWidth, presentation.PageSetup.SlideHeight)
+
     def _make_slide_screenshot(self) -> bytes:
         img = pyautogui.screenshot()
         if self._box:
@@ -104,30 +162,3 @@ class PowerPointScreenshotMaker:
         bio.seek(0)
         return bio.read()
 
-
-class SlidesCopier:
-
-    def duplicate_slides(self, presentation_path: Path, save_path: Path, total_count: int):
-        pythoncom.CoInitialize()
-        powerpoint = win32com_util.ensure_dispatch('Powerpoint.Application')
-        try:
-            powerpoint.Visible = True
-            powerpoint.WindowState = PP_WINDOW_MAXIMIZED
-            powerpoint.Activate()
-
-            presentation = powerpoint.Presentations.Open(str(presentation_path.absolute()))
-            self._duplicate_slides(presentation, total_count, save_path)
-        finally:
-            powerpoint.Quit()
-            del powerpoint
-
-    def _duplicate_slides(self, presentation, total_count: int, save_path: Path):
-        while presentation.Slides.Count < total_count:
-            presentation.Slides(presentation.Slides.Count).Duplicate()
-        presentation.SaveAs(str(save_path.absolute()))
-
-if __name__ == "__main__":
-    sc = SlidesCopier()
-    s = Path("c:\\data\\2.pptx")
-    t = Path("c:\\data\\dup.pptx")
-    sc.duplicate_slides(s, t, 10)
\ No newline at end of file
@@ -0,0 +1,37 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from threading import Lock
+
+from app.services.screenshot_request import ScreenshotRequest
+
+
+class WorkbookRenderer(ABC):
+    """ Renders worksheets of a workbook to images """
+
+    @abstractmethod
+    def make_sheet_screenshots(self, workbook_path: Path,
+                               request: ScreenshotRequest = ScreenshotRequest()) -> dict[int, bytes]:
+        """ :return: PNG image of every requested worksheet by its position in the workbook """
+
+
+class PresentationRenderer(ABC):
+    """ Renders slides of a presentation to images """
+
+    @abstractmethod
+    def make_slides_screenshots(self, presentation_path: Path,
+                                request: ScreenshotRequest = ScreenshotRequest()) -> dict[int, bytes]:
+        """ :return: PNG image of every requested slide by its position in the presentation """
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = Lock()
+
+
+def get_render_pool(max_workers: int | None = None) -> ProcessPoolExecutor:
+    """ Get process pool shared by the headless renderers of this process """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+        return _pool
@@ -1,11 +1,234 @@
+"""
+Office processes reclaimer
+
+Worker processes register the Office applications they use in a Redis registry of their host,
+as pids are only meaningful there and the sweeper of a host checks them on that host.
+While an application renders a document it is owned by the task, with a deadline which
+grows with the document size; between tasks a pooled application is idle.
+The sweeper kills only:
+    - overdue applications, the deadline of their task has passed
+    - orphaned applications, the worker which registered them is gone or nobody has
+      registered them within the grace period (e.g. left over by a crashed worker)
+Kills and seconds of rendering lost by killing overdue tasks are counted in the stats hash.
+
+Keys:
+    srv:screenshot:process-registry:<host>   hash "<application pid>:<worker pid>" -> registration json
+    srv:screenshot:sweeper-stats             hash kills, overdue, orphaned, wasted_seconds of all hosts
+
+PowerPoint is a single instance application, so several workers may register the same pid.
+"""
+
+import json
 import logging
+import math
+import os
+import socket
+import threading
 import time
-from threading import Thread
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Thread, Lock
 
 import psutil
+from redis import Redis
+
+from app.config import settings
+from app.config.factories import new_redis_client
 
 logger = logging.getLogger("APP.process-killer")
 
+REGISTRY_KEY = "srv:screenshot:process-registry"
+STATS_KEY = "srv:screenshot:sweeper-stats"
+
+OFFICE_PROCESS_NAMES = ("EXCEL.EXE", "POWERPNT.EXE")
+
+
+@dataclass
+class Registration:
+    pid: int
+    worker_pid: int
+    task_id: int | None = None
+    busy_since: float | None = None
+    deadline: float | None = None
+
+
+@dataclass
+class _TaskScope:
+    task_id: int
+    deadline: float
+
+
+class ProcessRegistry:
+
+    def __init__(self, redis_conn: Redis, *, key: str = REGISTRY_KEY, host: str | None = None):
+        """ :param host: render host of the registered processes, this one by default """
+        super().__init__()
+        self._redis = redis_conn
+        self._key = f"{key}:{host or socket.gethostname()}"
+
+    def register(self, pid: int, *, task_id: int | None = None, deadline: float | None = None):
+        """ Register the application used by this worker, owned by the task till the deadline or idle """
+        value = {}
+        if task_id is not None:
+            value = {"task_id": task_id, "busy_since": time.time(), "deadline": deadline}
+        self._redis.hset(self._key, self._field(pid), json.dumps(value))
+
+    def release(self, pid: int):
+        """ The task is done, the application stays registered as idle """
+        self.register(pid)
+
+    def forget(self, pid: int):
+        self._redis.hdel(self._key, self._field(pid))
+
+    def forget_worker(self, worker_pid: int):
+        """ Forget applications registered by the worker process, called when the worker has exited """
+        fields = [field for field in _decode_all(self._redis.hkeys(self._key)) if field.endswith(f":{worker_pid}")]
+        if fields:
+            self._redis.hdel(self._key, *fields)
+
+    def registrations(self) -> list[Registration]:
+        result = []
+        for field, value in _decode_all(self._redis.hgetall(self._key)).items():
+            pid, worker_pid = field.split(":")
+            result.append(Registration(pid=int(pid), worker_pid=int(worker_pid), **json.loads(value)))
+        return result
+
+    def _field(self, pid: int) -> str:
+        return f"{pid}:{os.getpid()}"
+
+
+class Sweeper:
+
+    def __init__(self, registry: ProcessRegistry, redis_conn: Redis, *,
+                 process_names: tuple[str, ...] = OFFICE_PROCESS_NAMES,
+                 orphan_age: float = 30,
+                 stats_key: str = STATS_KEY):
+        """
+        :param process_names: names of the swept processes, e.g. EXCEL.EXE
+        :param orphan_age: seconds an unregistered process may live, covers the start of an application
+        """
+        super().__init__()
+        self._registry = registry
+        self._redis = redis_conn
+        self._process_names = process_names
+        self._orphan_age = orphan_age
+        self._stats_key = stats_key
+
+    def sweep(self) -> list[int]:
+        """ Kill overdue and orphaned processes, :return: killed pids """
+
+        now = time.time()
+        registrations: dict[int, list[Registration]] = {}
+        stale: list[Registration] = []
+        for registration in self._registry.registrations():
+            if psutil.pid_exists(registration.worker_pid):
+                registrations.setdefault(registration.pid, []).append(registration)
+            else:
+                stale.append(registration)
+        for registration in stale:
+            self._registry.forget_worker(registration.worker_pid)
+
+        killed = []
+        for proc in psutil.process_iter(["pid", "name", "create_time"]):
+            try:
+                if proc.info['name'] not in self._process_names:
+                    continue
+                pid = proc.info['pid']
+                reason, wasted = self._kill_reason(registrations.get(pid), proc.info['create_time'], now)
+                if reason is None:
+                    continue
+                logger.warning(f"Killing {reason} PID: {pid}, Process Name: {proc.info['name']}, "
+                               f"Wasted Seconds: {int(wasted)}")
+                proc.kill()
+                killed.append(pid)
+                self._count(reason, wasted)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+        return killed
+
+    def stats(self) -> dict[str, float]:
+        return {name: float(value) for name, value in _decode_all(self._redis.hgetall(self._stats_key)).items()}
+
+    def _kill_reason(self, registrations: list[Registration] | None, create_time: float,
+                     now: float) -> tuple[str | None, float]:
+        if not registrations:
+            if now - create_time > self._orphan_age:
+                return "orphaned", 0
+            return None, 0
+
+        overdue = [r for r in registrations if r.deadline is not None and r.deadline < now]
+        if overdue:
+            wasted = max(now - r.busy_since for r in overdue)
+            return "overdue", wasted
+        return None, 0
+
+    def _count(self, reason: str, wasted: float):
+        try:
+            pipe = self._redis.pipeline()
+            pipe.hincrby(self._stats_key, "kills", 1)
+            pipe.hincrby(self._stats_key, reason, 1)
+            pipe.hincrbyfloat(self._stats_key, "wasted_seconds", wasted)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to count the kill: {e}")
+
+
+def task_deadline(input_size: int) -> float:
+    """ Seconds a task may render a document of input_size bytes """
+    size_mb = input_size / (1024 * 1024)
+    return min(settings.SS_TASK_DEADLINE_BASE + math.ceil(size_mb) * settings.SS_TASK_DEADLINE_PER_MB,
+               settings.SS_TASK_DEADLINE_MAX)
+
+
+_scope = threading.local()
+
+
+@contextmanager
+def task_scope(task_id: int, input_size: int):
+    """ Applications used by this thread inside the scope are owned by the task """
+    _scope.task = _TaskScope(task_id=task_id, deadline=time.time() + task_deadline(input_size))
+    try:
+        yield
+    finally:
+        _scope.task = None
+
+
+def register(pid: int):
+    """ Register the application for the task of the current scope, idle outside of a scope """
+    task: _TaskScope | None = getattr(_scope, "task", None)
+    if task is None:
+        _get_registry().register(pid)
+    else:
+        _get_registry().register(pid, task_id=task.task_id, deadline=task.deadline)
+
+
+def release(pid: int):
+    _get_registry().release(pid)
+
+
+def forget(pid: int):
+    _get_registry().forget(pid)
+
+
+def forget_worker(worker_pid: int):
+    _get_registry().forget_worker(worker_pid)
+
+
+_redis: Redis | None = None
+_redis_lock = Lock()
+
+
+def _get_redis() -> Redis:
+    global _redis
+    with _redis_lock:
+        if _redis is None:
+            _redis = new_redis_client()
+        return _redis
+
+
+def _get_registry() -> ProcessRegistry:
+    return ProcessRegistry(_get_redis())
+
 
 def start_worker_thread() -> Thread:
     thread = Thread(target=run_worker, daemon=True)
@@ -14,42 +237,23 @@ def start_worker_thread() -> Thread:
 
 
 def run_worker():
+    sweeper = None
     while True:
         try:
-            kill_old_processes(30)
+            if sweeper is None:
+                sweeper = Sweeper(_get_registry(), _get_redis(), orphan_age=settings.SS_SWEEPER_ORPHAN_AGE)
+            if sweeper.sweep():
+                logger.info(f"Sweeper stats: {sweeper.stats()}")
         except Exception as e:
             logger.warning(f"Old processes killer worker experienced an error: {e}")
-        time.sleep(10)
+        time.sleep(settings.SS_SWEEPER_INTERVAL)
 
 
-def kill_old_processes(age: int):
-    _kill_old_excel(age)
-    _kill_old_powerpoint(age)
+def _decode_all(value):
+    if isinstance(value, dict):
+        return {_decode(k): _decode(v) for k, v in value.items()}
+    return [_decode(v) for v in value]
 
 
-def _kill_old_excel(age: int):
-    _kill_proc("EXCEL.EXE", age)
-
-
-def _kill_old_powerpoint(age: int):
-    _kill_proc("POWERPNT.EXE", age)
-
-
-def _kill_proc(proc_name: str, age: int):
-    """ Kill process with  proc_name and running time more than age
-
-        :param proc_name: process name, e.g. EXCEL.EXE
-        :param age: required age of process in seconds
-    """
-    for proc in psutil.process_iter(["pid", "name", "create_time"]):
-        try:
-            if proc.info['name'] and proc_name == proc.info['name']:
-                pid = proc.info['pid']
-                name = proc.info['name']
-                create_time = proc.info['create_time']
-                runtime = time.time() - create_time
-                if runtime > age:
-                    logger.warning(f"Killing PID: {pid}, Process Name: {name}, Running Seconds: {int(runtime)}")
-                    proc.kill()
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
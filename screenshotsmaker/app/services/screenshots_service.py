@@ -1,14 +1,20 @@
+import datetime
 import logging
 import tempfile
 from pathlib import Path
 
 from redis import Redis
-from sqlalchemy import text, bindparam
+from sqlalchemy.dialects.postgresql import insert
 
-from app.config import queues
+from app.config import queues, settings
 from app.config.database import new_session
-from app.config.factories import new_redis_client, new_excel_screenshot_maker, new_power_point_screenshot_maker
-from app.database.models import CreateScreenshotTasksScreenshots, CreateScreenshotTasks, CreateScreenshotTasksStatus
+from app.config.factories import new_redis_client, new_excel_screenshot_maker, new_power_point_screenshot_maker, \
+    new_blob_store, new_image_postprocessor
+from app.database.models import CreateScreenshotTasksScreenshots, CreateScreenshotTasks, CreateScreenshotTasksStatus, \
+    ScreenshotResults
+from app.services import proc_sweeper
+from app.services.screenshot_request import ScreenshotRequest, ScreenshotRequestError
+from app.services.screenshot_results import InFlightScreenshots
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +24,9 @@ class ScreenshotsService:
     def __init__(self, *, redis_conn: Redis = None):
         super().__init__()
         self._redis_conn = redis_conn or new_redis_client()
+        self._blob_store = new_blob_store()
+        self._in_flight = InFlightScreenshots(self._redis_conn)
+        self._postprocessor = new_image_postprocessor()
 
     def create_screenshots(self, task_id: int):
         with new_session() as session:
@@ -30,12 +39,25 @@ class ScreenshotsService:
         if not task:
             return
 
-        try:
-            self._create_screenshots(task)
-        except Exception as e:
-            logger.exception(f"Failed to create screenshot for {task_id}")
-            self._set_status_if_pending(task_id, CreateScreenshotTasksStatus.FAILED, f"Error: {e}")
-            self._notify_task_is_done(task)
+        # errors are raised, so the request is delivered again by the queue
+        self._create_screenshots(task)
+        self._complete_followers(task)
+
+    def fail(self, task_id: int, message: str):
+        """ Give up on the task and notify the client """
+        with new_session() as session:
+            t = session.query(CreateScreenshotTasks).filter(
+                CreateScreenshotTasks.id == task_id,
+            ).first()
+            # hint the correct type
+            task: CreateScreenshotTasks = t
+
+        if not task:
+            return
+
+        self._set_status_if_pending(task_id, CreateScreenshotTasksStatus.FAILED, message)
+        self._notify_task_is_done(task)
+        self._complete_followers(task)
 
     def _create_screenshots(self, task: CreateScreenshotTasks):
         if task.status != CreateScreenshotTasksStatus.PENDING:
@@ -46,10 +68,17 @@ class ScreenshotsService:
             self._notify_task_is_done(task)
             return
 
+        try:
+            request = ScreenshotRequest.from_json(task.request)
+        except ScreenshotRequestError as e:
+            self._set_status_if_pending(task.id, CreateScreenshotTasksStatus.FAILED, str(e))
+            self._notify_task_is_done(task)
+            return
+
         if self._is_excel(task):
-            self._process_excel(task)
+            self._process_excel(task, request)
         elif self._is_powerpoint(task):
-            self._process_powerpoint(task)
+            self._process_powerpoint(task, request)
         else:
             self._set_status_if_pending(task.id, CreateScreenshotTasksStatus.FAILED, "Unknown file type")
         self._notify_task_is_done(task)
@@ -79,7 +108,7 @@ class ScreenshotsService:
             session.commit()
 
     def _try_already_completed(self, task_id: int) -> bool:
-        """ Search for existing tasks and check is this task already completed previously.
+        """ Search the results index for the same document rendered by the same renderer version.
 
             Copy results from previously completed task with the same payload.
 
@@ -93,73 +122,120 @@ class ScreenshotsService:
             if not task:
                 return False
 
-            stmt = text("""
-                SELECT prev.id
-                    FROM create_screenshot_tasks curr
-                        INNER JOIN create_screenshot_tasks prev ON curr.content_hash = prev.content_hash
-                    WHERE
-                        curr.id = :curr_id
-                        AND curr.id <> prev.id
-                        AND curr.content = prev.content
-                        AND prev.status = 'COMPLETED'
-                    ORDER BY prev.updated_at DESC
-                    LIMIT 1
-            """)
-            prev_task_id = session.execute(stmt, params={"curr_id": task_id}).scalar_one_or_none()
-            if prev_task_id is None:
+            prev_task_id = session.query(ScreenshotResults.screenshot_task_id).filter(
+                ScreenshotResults.content_digest == task.content_hash,
+                ScreenshotResults.renderer_version == settings.SCREENSHOT_RENDERER_VERSION,
+            ).scalar()
+            if prev_task_id is None or prev_task_id == task_id:
                 return False
 
-            # copy result
-            screenshots = session.query(CreateScreenshotTasksScreenshots).filter(
-                CreateScreenshotTasksScreenshots.screenshot_task_id == prev_task_id
+            self._copy_screenshots(session, prev_task_id, task)
+            session.commit()
+
+            return True
+
+    def _copy_screenshots(self, session, prev_task_id: int, task: CreateScreenshotTasks):
+        screenshots = session.query(CreateScreenshotTasksScreenshots).filter(
+            CreateScreenshotTasksScreenshots.screenshot_task_id == prev_task_id
+        ).all()
+
+        for s in screenshots:
+            # fix type hint
+            prev_screenshot: CreateScreenshotTasksScreenshots = s
+            screenshot = CreateScreenshotTasksScreenshots(
+                position=prev_screenshot.position,
+                content=prev_screenshot.content,
+                content_digest=prev_screenshot.content_digest,
+                preview_digest=prev_screenshot.preview_digest,
+                thumbnail_digest=prev_screenshot.thumbnail_digest,
+                screenshot_task_id=task.id,
+            )
+            session.add(screenshot)
+        task.status = CreateScreenshotTasksStatus.COMPLETED
+        task.status_message = f"OK. Copied from {prev_task_id}"
+
+    def _complete_followers(self, task: CreateScreenshotTasks):
+        """ Complete tasks for the same document which have joined the task while it was in flight """
+
+        followers = self._in_flight.release(task.content_hash, settings.SCREENSHOT_RENDERER_VERSION, task.id)
+        if not followers:
+            return
+
+        with new_session() as session:
+            t = session.query(CreateScreenshotTasks).filter(CreateScreenshotTasks.id == task.id).first()
+            # fix type hint
+            leader: CreateScreenshotTasks = t
+
+            pending = session.query(CreateScreenshotTasks).filter(
+                CreateScreenshotTasks.id.in_(followers),
+                CreateScreenshotTasks.status == CreateScreenshotTasksStatus.PENDING,
             ).all()
 
-            for s in screenshots:
+            for f in pending:
                 # fix type hint
-                prev_screenshot: CreateScreenshotTasksScreenshots = s
-                screenshot = CreateScreenshotTasksScreenshots(
-                    position=prev_screenshot.position,
-                    content=prev_screenshot.content,
-                    screenshot_task_id=task_id,
-                )
-                session.add(screenshot)
-            task.status = CreateScreenshotTasksStatus.COMPLETED
-            task.status_message = f"OK. Copied from {prev_task_id}"
+                follower: CreateScreenshotTasks = f
+                if leader.status == CreateScreenshotTasksStatus.COMPLETED:
+                    self._copy_screenshots(session, leader.id, follower)
+                else:
+                    follower.status = CreateScreenshotTasksStatus.FAILED
+                    follower.status_message = leader.status_message
             session.commit()
 
-            return True
+            for follower in pending:
+                logger.info(f"Completed #{follower.id} with results of in-flight #{leader.id}")
+                self._notify_task_is_done(follower)
 
-    def _process_excel(self, task: CreateScreenshotTasks):
+    def _process_excel(self, task: CreateScreenshotTasks, request: ScreenshotRequest):
         maker = new_excel_screenshot_maker()
         suffix = Path(task.name).suffix
         filename = tempfile.mktemp(suffix=suffix, prefix="screenshots_")
         file = Path(filename)
         try:
-            file.write_bytes(task.content)
-            screenshots = maker.make_sheet_screenshots(file)
-            self._write_screenshots(task.id, screenshots)
+            self._write_content(task, file)
+            with proc_sweeper.task_scope(task.id, file.stat().st_size):
+                screenshots = maker.make_sheet_screenshots(file, request)
+        except ScreenshotRequestError as e:
+            # the document has no such sheet or slide, rendering it again doesn't help
+            self._set_status_if_pending(task.id, CreateScreenshotTasksStatus.FAILED, str(e))
+        else:
+            # spreadsheets are flat images, they are stored with a palette and aren't shown in a gallery
+            self._write_screenshots(task.id, screenshots, request, flat=True)
         finally:
             try:
                 file.unlink(missing_ok=True)
             except IOError:
                 pass
 
-    def _process_powerpoint(self, task: CreateScreenshotTasks):
+    def _process_powerpoint(self, task: CreateScreenshotTasks, request: ScreenshotRequest):
         maker = new_power_point_screenshot_maker()
         suffix = Path(task.name).suffix
         filename = tempfile.mktemp(suffix=suffix, prefix="screenshots_")
         file = Path(filename)
         try:
-            file.write_bytes(task.content)
-            screenshots = maker.make_slides_screenshots(file)
-            self._write_screenshots(task.id, screenshots)
+            self._write_content(task, file)
+            with proc_sweeper.task_scope(task.id, file.stat().st_size):
+                screenshots = maker.make_slides_screenshots(file, request)
+        except ScreenshotRequestError as e:
+            # the document has no such sheet or slide, rendering it again doesn't help
+            self._set_status_if_pending(task.id, CreateScreenshotTasksStatus.FAILED, str(e))
+        else:
+            self._write_screenshots(task.id, screenshots, request)
         finally:
             try:
                 file.unlink(missing_ok=True)
             except IOError:
                 pass
 
-    def _write_screenshots(self, task_id: int, screenshots: list[bytes]):
+    def _write_content(self, task: CreateScreenshotTasks, file: Path):
+        if task.content_digest:
+            self._blob_store.copy_to(task.content_digest, file)
+        else:
+            file.write_bytes(task.content)
+
+    def _write_screenshots(self, task_id: int, screenshots: dict[int, bytes], request: ScreenshotRequest, *,
+                           flat: bool = False):
+        variants = {position: self._postprocessor.make_variants(content, request, flat=flat, gallery=not flat)
+                    for position, content in screenshots.items()}
         with new_session() as session:
             t = session.query(CreateScreenshotTasks).filter(
                 CreateScreenshotTasks.id == task_id,
@@ -168,14 +244,23 @@ class ScreenshotsService:
             # fix type hint
             up_task: CreateScreenshotTasks = t
             if up_task:
-                for position, content in enumerate(screenshots):
+                for position, variant in variants.items():
                     screenshot = CreateScreenshotTasksScreenshots(
                         position=position,
-                        content=content,
+                        content_digest=self._blob_store.put(variant.full),
+                        preview_digest=self._blob_store.put(variant.preview) if variant.preview else None,
+                        thumbnail_digest=self._blob_store.put(variant.thumbnail) if variant.thumbnail else None,
                         screenshot_task_id=up_task.id,
                     )
                     session.add(screenshot)
                 up_task.status = CreateScreenshotTasksStatus.COMPLETED
                 up_task.status_message = 'OK'
 
+                session.execute(insert(ScreenshotResults).values(
+                    content_digest=up_task.content_hash,
+                    renderer_version=settings.SCREENSHOT_RENDERER_VERSION,
+                    screenshot_task_id=up_task.id,
+                    created_at=datetime.datetime.utcnow(),
+                ).on_conflict_do_nothing())
+
             session.commit()
@@ -1,32 +1,51 @@
 import logging
-import time
-from threading import Thread
+import shutil
+import signal
+import tempfile
+from multiprocessing.synchronize import Event
 
 from redis import Redis
 
-from app.config.factories import new_redis_client
+from app.config import configurer
+from app.config.factories import new_redis_client, new_reliable_queue, close_office_pools
 from app.config.queues import QUEUE_SCREENSHOT_REQUEST
 from app.services import proc_sweeper
+from app.services.reliable_queue import ReliableQueue, Message
 from app.services.screenshots_service import ScreenshotsService
 
 logger = logging.getLogger()
 
 
-def start_worker_thread() -> Thread:
-    thread = Thread(target=run_worker, daemon=True)
-    thread.start()
-    return thread
+def run_process(worker_index: int, stop_event: Event):
+    """ Entry point of a worker process started by the supervisor """
 
+    # Ctrl+C reaches all processes of the console, the supervisor stops the workers with the event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configurer.configure_all(process_name=f"worker-{worker_index}")
 
-def run_worker():
+    # documents and exported images of the worker never mix with the other workers' ones
+    temp_dir = tempfile.mkdtemp(prefix=f"screenshots_worker_{worker_index}_")
+    tempfile.tempdir = temp_dir
+    try:
+        run_worker(stop_event)
+    finally:
+        close_office_pools()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        logger.info(f"Service worker {worker_index} stopped")
+
+
+def run_worker(stop_event: Event):
     redis_conn = None
+    queue = None
     logger.info(f"Service worker started")
-    while True:
+    while not stop_event.is_set():
         try:
             if not redis_conn:
                 logger.info(f"Acquiring new redis connection")
                 redis_conn = new_redis_client()
-            _handle_request(redis_conn)
+                queue = new_reliable_queue(redis_conn, QUEUE_SCREENSHOT_REQUEST,
+                                           on_dead_letter=lambda payload: _on_dead_letter(redis_conn, payload))
+            _handle_request(redis_conn, queue)
         except Exception as e:
             logger.exception(f"Service worker failure: {e}")
             try:
@@ -35,18 +54,24 @@ def run_worker():
             except Exception as e:
                 logger.warning(f"Failed to close redis connection: {e}")
             redis_conn = None
-            time.sleep(10)
+            stop_event.wait(10)
+    if redis_conn:
+        redis_conn.close()
+
 
+def _handle_request(redis_conn: Redis, queue: ReliableQueue):
+    queue.process(lambda message: _process_request(redis_conn, message), timeout=5)
 
-def _handle_request(redis_conn: Redis):
-    ret = redis_conn.blpop([QUEUE_SCREENSHOT_REQUEST], timeout=5)
-    if not ret:
-        return
-    queue, payload = ret
+
+def _process_request(redis_conn: Redis, message: Message):
     try:
-        task_id = int(payload)
+        task_id = int(message.payload)
     except ValueError:
-        raise ValueError(f"Invalid task id '{payload}' in {QUEUE_SCREENSHOT_REQUEST}")
-    logger.info(f"Starting processing request for #{task_id}")
+        raise ValueError(f"Invalid task id '{message.payload}' in {QUEUE_SCREENSHOT_REQUEST}")
+    logger.info(f"Starting processing request for #{task_id}, attempt {message.attempts}")
     ScreenshotsService(redis_conn=redis_conn).create_screenshots(task_id)
     logger.info(f"Finished processing request for #{task_id}")
+
+
+def _on_dead_letter(redis_conn: Redis, payload: str):
+    ScreenshotsService(redis_conn=redis_conn).fail(int(payload), "Failed to create screenshots")
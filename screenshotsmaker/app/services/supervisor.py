@@ -0,0 +1,136 @@
+import logging
+import multiprocessing
+import signal
+import time
+from dataclasses import dataclass
+from multiprocessing.context import SpawnProcess
+from multiprocessing.synchronize import Event
+from typing import Callable
+
+from app.services import proc_sweeper
+
+logger = logging.getLogger("APP.supervisor")
+
+# A worker exited sooner than this after its start is restarted with a growing delay
+_STABLE_RUNTIME = 60
+
+
+@dataclass
+class _Worker:
+    index: int
+    process: SpawnProcess | None = None
+    started_at: float = 0.0
+    restart_at: float = 0.0
+    restart_delay: float = 0.0
+
+
+class Supervisor:
+    """ Runs worker processes, restarts crashed ones and stops them gracefully on SIGINT/SIGTERM
+
+        Workers are spawned, so every one starts clean: own renderer, temp directory and Redis connection.
+    """
+
+    def __init__(self, target: Callable[[int, Event], None], workers: int, *,
+                 shutdown_timeout: float = 60,
+                 restart_delay: float = 5,
+                 max_restart_delay: float = 300):
+        """
+        :param target: worker entry point, called with the worker index and the stop event
+        :param workers: number of worker processes
+        :param shutdown_timeout: seconds to wait for workers to finish their tasks before terminating them
+        """
+        super().__init__()
+        self._context = multiprocessing.get_context("spawn")
+        self._target = target
+        self._workers = [_Worker(index=i + 1) for i in range(workers)]
+        self._stop_event = self._context.Event()
+        # set by the signal handler, which must not take the locks of the event
+        self._stopping = False
+        self._shutdown_timeout = shutdown_timeout
+        self._restart_delay = restart_delay
+        self._max_restart_delay = max_restart_delay
+
+    def run(self):
+        """ Run workers until stopped, blocks the calling (main) thread """
+
+        self._install_signal_handlers()
+        logger.info(f"Starting {len(self._workers)} worker processes")
+        for worker in self._workers:
+            self._start(worker)
+
+        while not self._stopping:
+            for worker in self._workers:
+                self._check(worker)
+            time.sleep(1)
+
+        self._stop_event.set()
+        self._shutdown()
+
+    def stop(self):
+        self._stopping = True
+
+    def _install_signal_handlers(self):
+        def handler(signum, _frame):
+            logger.info(f"Received signal {signum}, stopping workers")
+            self.stop()
+
+        signal.signal(signal.SIGINT, handler)
+        signal.signal(signal.SIGTERM, handler)
+        if hasattr(signal, "SIGBREAK"):
+            # Ctrl+Break and closing the console window on Windows
+            signal.signal(signal.SIGBREAK, handler)
+
+    def _start(self, worker: _Worker):
+        worker.process = self._context.Process(target=self._target, args=(worker.index, self._stop_event),
+                                               name=f"worker-{worker.index}", daemon=False)
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        logger.info(f"Started worker {worker.index}, PID: {worker.process.pid}")
+
+    def _check(self, worker: _Worker):
+        process = worker.process
+        if process is not None and process.is_alive():
+            return
+
+        now = time.monotonic()
+        if process is not None:
+            logger.error(f"Worker {worker.index} (PID: {process.pid}) exited with code {process.exitcode}")
+            self._forget(process)
+            worker.process = None
+            if now - worker.started_at < _STABLE_RUNTIME:
+                worker.restart_delay = min(max(worker.restart_delay * 2, self._restart_delay),
+                                           self._max_restart_delay)
+            else:
+                worker.restart_delay = self._restart_delay
+            worker.restart_at = now + worker.restart_delay
+            logger.info(f"Restarting worker {worker.index} in {worker.restart_delay} seconds")
+
+        if now >= worker.restart_at:
+            self._start(worker)
+
+    def _shutdown(self):
+        logger.info(f"Waiting up to {self._shutdown_timeout} seconds for workers to finish")
+        deadline = time.monotonic() + self._shutdown_timeout
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.index} (PID: {worker.process.pid}) didn't stop, terminating")
+                worker.process.terminate()
+                worker.process.join(5)
+            self._forget(worker.process)
+        logger.info("All workers stopped")
+
+    def _forget(self, process: SpawnProcess):
+        """ Release the exited worker process and its registered applications """
+        pid = process.pid
+        try:
+            proc_sweeper.forget_worker(pid)
+        except Exception as e:
+            logger.warning(f"Failed to forget applications of worker PID {pid}: {e}")
+        try:
+            process.close()
+        except ValueError:
+            # still running after terminate
+            pass
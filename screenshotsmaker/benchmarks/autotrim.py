@@ -0,0 +1,65 @@
+"""
+Measure the whitespace auto-trim of spreadsheet screenshots
+
+A synthetic screenshot of a worksheet clip is drawn: gridlines everywhere, a filled header
+and a block of text in the upper left corner, the rest are empty cells.
+
+Usage: python -m benchmarks.autotrim --width 3840 --height 2160 --repeat 20
+"""
+
+import time
+import random
+import argparse
+
+from PIL import Image, ImageDraw
+
+from app.screenshots import autotrim
+
+CELL_WIDTH = 64
+CELL_HEIGHT = 20
+
+
+def make_screenshot(width: int, height: int, columns: int, rows: int, seed: int = 0) -> Image.Image:
+    rnd = random.Random(seed)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for x in range(0, width, CELL_WIDTH):
+        draw.line([(x, 0), (x, height)], fill=(212, 212, 212))
+    for y in range(0, height, CELL_HEIGHT):
+        draw.line([(0, y), (width, y)], fill=(212, 212, 212))
+
+    draw.rectangle([CELL_WIDTH, CELL_HEIGHT, CELL_WIDTH * (columns + 1), CELL_HEIGHT * 2], fill=(68, 114, 196))
+    for row in range(1, rows + 1):
+        for column in range(1, columns + 1):
+            draw.text((column * CELL_WIDTH + 4, row * CELL_HEIGHT + 4), str(rnd.randint(0, 99999)),
+                      fill="white" if row == 1 else "black")
+    return image
+
+
+def measure(name: str, func, repeat: int):
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f'{name:<12} {elapsed * 1000:8.2f} ms   {result}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    image = make_screenshot(args.width, args.height, args.columns, args.rows)
+    print(f'Screenshot {args.width}x{args.height}, content {args.columns}x{args.rows} cells')
+
+    measure('content_box', lambda: autotrim.content_box(image, padding=8), args.repeat)
+    measure('getbbox', lambda: image.convert("L").point(lambda v: 255 - v).getbbox(), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
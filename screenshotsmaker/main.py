@@ -1,17 +1,27 @@
-from app.config import configurer, queues
-from app.config.factories import new_redis_client
+import logging
+
+from app.config import configurer, settings
+from app.config.factories import new_blob_store, new_redis_client
 from app.services import screenshots_service_worker, proc_sweeper
+from app.services.blob_store import check_shared
+from app.services.screenshot_results import InFlightScreenshots
+from app.services.supervisor import Supervisor
+
+logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
     configurer.configure_all()
     rc = new_redis_client()
-    threads = []
+    # workbooks are blobs stored by the backend, usually on another host
+    check_shared(new_blob_store(), rc, "screenshotsmaker")
+    InFlightScreenshots(rc).publish_renderer_version(settings.SCREENSHOT_RENDERER_VERSION)
 
-    th = screenshots_service_worker.start_worker_thread()
-    threads.append(th)
+    if settings.SS_WORKERS > 1 and settings.SS_EXCEL_RENDERER == "com":
+        logger.warning("Excel COM renderer copies sheets through the clipboard shared by all workers, "
+                       "use one worker or the headless renderer")
 
-    th = proc_sweeper.start_worker_thread()
-    threads.append(th)
+    proc_sweeper.start_worker_thread()
 
-    for th in threads:
-        th.join()
+    supervisor = Supervisor(screenshots_service_worker.run_process, settings.SS_WORKERS,
+                            shutdown_timeout=settings.SS_WORKER_SHUTDOWN_TIMEOUT)
+    supervisor.run()
@@ -0,0 +1,4 @@
+import os
+
+# settings require the database password, the tests don't connect to the database
+os.environ.setdefault("DATABASE_PASSWORD", "test")
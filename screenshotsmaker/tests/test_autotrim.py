@@ -0,0 +1,97 @@
+"""
+Whitespace auto-trim of spreadsheet screenshots
+
+Run from the screenshotsmaker directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+from PIL import Image, ImageDraw
+
+from app.screenshots.autotrim import content_box, trim
+
+WIDTH, HEIGHT = 640, 400
+CELL_WIDTH, CELL_HEIGHT = 64, 20
+GRIDLINE = (212, 212, 212)
+
+
+def worksheet(*, gridlines: bool = True) -> Image.Image:
+    image = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    if gridlines:
+        draw = ImageDraw.Draw(image)
+        for x in range(0, WIDTH, CELL_WIDTH):
+            draw.line([(x, 0), (x, HEIGHT)], fill=GRIDLINE)
+        for y in range(0, HEIGHT, CELL_HEIGHT):
+            draw.line([(0, y), (WIDTH, y)], fill=GRIDLINE)
+    return image
+
+
+def write_cells(image: Image.Image, columns: range, rows: range):
+    """ Black strokes inside the cells, the way text is drawn """
+    draw = ImageDraw.Draw(image)
+    for column in columns:
+        for row in rows:
+            x, y = column * CELL_WIDTH, row * CELL_HEIGHT
+            draw.rectangle([x + 6, y + 6, x + 40, y + 13], fill="black")
+
+
+def test_gridline_only_margins_are_trimmed_to_the_enclosing_gridlines():
+    image = worksheet()
+    write_cells(image, range(1, 3), range(1, 3))
+
+    assert content_box(image) == (CELL_WIDTH, CELL_HEIGHT, 3 * CELL_WIDTH + 1, 3 * CELL_HEIGHT + 1)
+
+
+def test_padding_is_kept_within_the_image():
+    image = worksheet()
+    write_cells(image, range(0, 2), range(0, 2))
+
+    assert content_box(image, padding=8) == (0, 0, 2 * CELL_WIDTH + 1 + 8, 2 * CELL_HEIGHT + 1 + 8)
+
+
+def test_content_without_gridlines():
+    image = worksheet(gridlines=False)
+    write_cells(image, range(2, 4), range(3, 5))
+
+    assert content_box(image) == (2 * CELL_WIDTH + 6, 3 * CELL_HEIGHT + 6, 3 * CELL_WIDTH + 41, 4 * CELL_HEIGHT + 14)
+
+
+def test_thick_header_is_content():
+    image = worksheet()
+    draw = ImageDraw.Draw(image)
+    # filled header across the whole clip, far thicker than a gridline
+    draw.rectangle([0, CELL_HEIGHT, WIDTH, 2 * CELL_HEIGHT], fill=(68, 114, 196))
+
+    assert content_box(image) == (0, 0, WIDTH, 3 * CELL_HEIGHT + 1)
+
+
+def test_frame_of_the_clip_is_not_a_cell_border():
+    image = worksheet(gridlines=False)
+    ImageDraw.Draw(image).rectangle([0, 0, WIDTH - 1, HEIGHT - 1], outline="black")
+    write_cells(image, range(4, 5), range(8, 9))
+
+    assert content_box(image) == (4 * CELL_WIDTH + 6, 8 * CELL_HEIGHT + 6, 4 * CELL_WIDTH + 41, 8 * CELL_HEIGHT + 14)
+
+
+def test_blank_image_has_no_content():
+    assert content_box(worksheet(gridlines=False)) is None
+    assert content_box(worksheet()) is None
+
+    blank = worksheet()
+    assert trim(blank) is blank
+
+
+def test_grey_and_palette_images():
+    image = worksheet()
+    write_cells(image, range(1, 3), range(1, 3))
+    expected = content_box(image)
+
+    assert content_box(image.convert("L")) == expected
+    assert content_box(image.convert("P")) == expected
+    assert content_box(image.convert("RGBA")) == expected
+
+
+def test_trim_crops_to_the_content():
+    image = worksheet()
+    write_cells(image, range(1, 3), range(1, 3))
+
+    trimmed = trim(image, padding=4)
+    assert trimmed.size == (2 * CELL_WIDTH + 1 + 8, 2 * CELL_HEIGHT + 1 + 8)
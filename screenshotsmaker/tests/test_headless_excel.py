@@ -0,0 +1,193 @@
+"""
+Headless worksheet renderer against golden images
+
+Every case builds a workbook, renders it and compares the image with tests/golden/<case>.png
+within a pixel tolerance, so small differences of the font rasterizer pass.
+After an intended change of the rendering, review the new images written with
+UPDATE_GOLDEN=1 and commit them.
+
+Run from the screenshotsmaker directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import datetime
+import io
+import os
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageChops
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Border, Color, Font, PatternFill, Side
+
+from app.screenshots.headless_excel import RenderOptions, format_value, render_sheet
+
+GOLDEN_DIR = Path(__file__).parent / 'golden'
+UPDATE_GOLDEN = os.environ.get('UPDATE_GOLDEN') == '1'
+
+# channel difference still counted as the same pixel, and share of the pixels allowed to differ more
+PIXEL_TOLERANCE = 48
+MAX_DIFFERENT_PIXELS = 0.01
+
+
+def number_formats(sheet):
+    sheet.column_dimensions['A'].width = 24
+    sheet.column_dimensions['B'].width = 28
+    rows = [
+        ('General', 1234.5, 'General'),
+        ('Decimals', 3.14159, '0.00'),
+        ('Thousands', 1234567.891, '#,##0.00'),
+        ('Percent', 0.256, '0.0%'),
+        ('Scientific', 123456789, '0.00E+00'),
+        ('Currency negative', -1234.5, '"$"#,##0.00;[Red]-"$"#,##0.00'),
+        ('Zero section', 0, '0.00;-0.00;"-"'),
+        ('Date', datetime.datetime(2024, 3, 7), 'yyyy-mm-dd'),
+        ('Long date', datetime.datetime(2024, 3, 7), 'dddd, mmmm d, yyyy'),
+        ('Time', datetime.time(14, 5), 'h:mm AM/PM'),
+        ('Boolean', True, 'General'),
+    ]
+    for row, (label, value, number_format) in enumerate(rows, start=1):
+        sheet.cell(row=row, column=1, value=label)
+        sheet.cell(row=row, column=2, value=value).number_format = number_format
+
+
+def fonts(sheet):
+    sheet.column_dimensions['A'].width = 30
+    styles = [
+        Font(),
+        Font(b=True),
+        Font(i=True),
+        Font(u='single'),
+        Font(b=True, i=True, color='FF0070C0'),
+        Font(sz=16, color='FFC00000'),
+        Font(sz=8),
+    ]
+    for row, font in enumerate(styles, start=1):
+        cell = sheet.cell(row=row, column=1, value='The quick brown fox')
+        cell.font = font
+    sheet.row_dimensions[6].height = 24
+
+
+def fills_and_borders(sheet):
+    thin, thick = Side(style='thin', color='FF000000'), Side(style='thick', color='FF2F5597')
+    fills = ['FFFFFF00', 'FF92D050', 'FFF4B084', 'FFD9E1F2']
+    for column, color in enumerate(fills, start=2):
+        cell = sheet.cell(row=2, column=column, value=column)
+        cell.fill = PatternFill(fill_type='solid', fgColor=color)
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    # theme color with a tint
+    sheet.cell(row=4, column=2).fill = PatternFill(fill_type='solid', fgColor=Color(theme=4, tint=0.4))
+    sheet.cell(row=4, column=4).border = Border(bottom=thick, right=Side(style='medium', color='FFC00000'))
+    sheet.cell(row=6, column=2, value='dashed').border = Border(bottom=Side(style='dashed'))
+
+
+def widths_and_merges(sheet):
+    sheet.column_dimensions['A'].width = 4
+    sheet.column_dimensions['B'].width = 18
+    sheet.column_dimensions['C'].hidden = True
+    sheet.row_dimensions[2].height = 36
+    sheet.row_dimensions[3].hidden = True
+
+    sheet['A1'] = 'narrow'
+    sheet['B1'] = 'wide column'
+    sheet['C1'] = 'hidden'
+    sheet['D1'] = 'after hidden'
+
+    sheet.merge_cells('B2:E2')
+    sheet['B2'] = 'Merged and centered'
+    sheet['B2'].alignment = Alignment(horizontal='center', vertical='center')
+    sheet['B2'].font = Font(b=True, sz=14)
+    sheet['B2'].fill = PatternFill(fill_type='solid', fgColor='FFDDEBF7')
+
+    sheet['A3'] = 'hidden row'
+
+    sheet.merge_cells('B4:B6')
+    sheet['B4'] = 'Wrapped text in a merged column'
+    sheet['B4'].alignment = Alignment(wrap_text=True, vertical='top')
+    sheet['D5'] = 'right'
+    sheet['D5'].alignment = Alignment(horizontal='right', indent=1)
+
+
+def overflow(sheet):
+    for column in 'ABCD':
+        sheet.column_dimensions[column].width = 6
+    # numbers and dates that don't fit are shown as ####
+    sheet['A1'] = 1234.5
+    sheet['A1'].number_format = '#,##0.00'
+    sheet['A2'] = datetime.datetime(2024, 3, 7)
+    sheet['A2'].number_format = 'yyyy-mm-dd'
+    sheet['A3'] = datetime.time(14, 5, 30)
+    sheet['A3'].number_format = 'h:mm:ss AM/PM'
+    # numbers that fit are not
+    sheet['B1'] = 12.5
+    sheet['B1'].number_format = '0.0'
+    sheet['D1'] = 'end'
+    # text flows into the empty cells on the right and is cut by the next value
+    sheet['A5'] = 'Long text flowing over the empty cells'
+    sheet['A6'] = 'Long text cut by the next cell'
+    sheet['B6'] = 'next'
+
+
+CASES = {
+    'number_formats': number_formats,
+    'fonts': fonts,
+    'fills_and_borders': fills_and_borders,
+    'widths_and_merges': widths_and_merges,
+    'overflow': overflow,
+}
+
+
+def render(tmp_path: Path, name: str) -> Image.Image:
+    workbook = Workbook()
+    CASES[name](workbook.active)
+    path = tmp_path / f'{name}.xlsx'
+    workbook.save(path)
+    return Image.open(io.BytesIO(render_sheet(str(path), 0, RenderOptions(), 'used'))).convert('RGB')
+
+
+def different_pixels(image: Image.Image, golden: Image.Image) -> float:
+    """ :return: share of the pixels with a channel differing more than the tolerance """
+    difference = ImageChops.difference(image, golden).convert('L')
+    histogram = difference.histogram()
+    return sum(histogram[PIXEL_TOLERANCE + 1:]) / (image.width * image.height)
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_sheet_matches_golden_image(tmp_path, name):
+    image = render(tmp_path, name)
+    golden_path = GOLDEN_DIR / f'{name}.png'
+
+    if UPDATE_GOLDEN or not golden_path.exists():
+        GOLDEN_DIR.mkdir(exist_ok=True)
+        image.save(golden_path, optimize=True)
+        if not UPDATE_GOLDEN:
+            pytest.fail(f'{golden_path.name} was missing and has been written, review and commit it')
+
+    golden = Image.open(golden_path).convert('RGB')
+    assert image.size == golden.size
+    assert different_pixels(image, golden) <= MAX_DIFFERENT_PIXELS
+
+
+def test_overflowing_number_and_date_are_hashes(tmp_path):
+    image = render(tmp_path, 'overflow')
+
+    # A1, A2 and A3 hold the same number of hashes right aligned, so they are drawn alike
+    row_height = round(15 * 96 / 72)
+    rows = [image.crop((0, row * row_height, 47, (row + 1) * row_height - 1)) for row in range(3)]
+    assert ImageChops.invert(rows[0]).getbbox() is not None
+    assert ImageChops.difference(rows[0], rows[1]).getbbox() is None
+    assert ImageChops.difference(rows[0], rows[2]).getbbox() is None
+
+
+@pytest.mark.parametrize('value, number_format, text', [
+    (1234.5, 'General', '1234.5'),
+    (1234567.891, '#,##0.00', '1,234,567.89'),
+    (0.256, '0.0%', '25.6%'),
+    (-1234.5, '"$"#,##0.00;[Red]-"$"#,##0.00', '-$1,234.50'),
+    (0, '0.00;-0.00;"-"', '-'),
+    (123456789, '0.00E+00', '1.23E+08'),
+    (datetime.datetime(2024, 3, 7), 'd mmm yyyy', '7 Mar 2024'),
+    (datetime.time(14, 5), 'h:mm AM/PM', '2:05 PM'),
+    (True, 'General', 'TRUE'),
+])
+def test_format_value(value, number_format, text):
+    assert format_value(value, number_format) == text
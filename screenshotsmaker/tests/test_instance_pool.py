@@ -0,0 +1,181 @@
+"""
+Pool of warm renderer instances with fake instances
+
+Run from the screenshotsmaker directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import itertools
+import threading
+
+import pytest
+
+from app.config import factories, settings
+from app.screenshots.instance_pool import InstancePool, PoolExhausted, RendererInstance
+
+MB = 1024 * 1024
+
+
+class FakeInstance(RendererInstance):
+    numbers = itertools.count(1)
+
+    def __init__(self):
+        self.number = next(self.numbers)
+        self.running = False
+        self.stopped = False
+        self.healthy = True
+        self.memory = 100 * MB
+        self.jobs = 0
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        self.stopped = True
+
+    def is_healthy(self) -> bool:
+        return self.healthy
+
+    def memory_usage(self) -> int | None:
+        return self.memory
+
+    def leased(self):
+        assert self.running
+        self.jobs += 1
+
+    def __repr__(self):
+        return f"FakeInstance({self.number})"
+
+
+class Factory:
+
+    def __init__(self):
+        self.instances: list[FakeInstance] = []
+
+    def __call__(self) -> FakeInstance:
+        instance = FakeInstance()
+        self.instances.append(instance)
+        return instance
+
+
+@pytest.fixture
+def factory():
+    return Factory()
+
+
+def test_idle_instance_is_leased_again(factory):
+    pool = InstancePool(factory, size=2)
+
+    with pool.lease() as first:
+        pass
+    with pool.lease() as second:
+        pass
+
+    assert second is first
+    assert first.running and first.jobs == 2
+    assert pool.stats == {"started": 1, "recycled": 0, "jobs": 2}
+
+
+def test_concurrent_leases_start_up_to_size_instances(factory):
+    pool = InstancePool(factory, size=2, lease_timeout=0.2)
+
+    with pool.lease() as first, pool.lease() as second:
+        assert first is not second
+        with pytest.raises(PoolExhausted):
+            with pool.lease():
+                pass
+
+    assert len(factory.instances) == 2
+
+
+def test_lease_waits_for_returned_instance(factory):
+    pool = InstancePool(factory, size=1, lease_timeout=5)
+    leased = threading.Event()
+    received = []
+
+    def other_task():
+        leased.wait()
+        with pool.lease() as instance:
+            received.append(instance)
+
+    thread = threading.Thread(target=other_task)
+    thread.start()
+    with pool.lease() as instance:
+        leased.set()
+        thread.join(0.2)
+        assert thread.is_alive()
+    thread.join(5)
+
+    assert received == [instance]
+
+
+def test_instance_is_recycled_after_max_jobs(factory, monkeypatch):
+    monkeypatch.setattr(settings, "SS_RENDERER_POOL_MAX_JOBS", 3)
+    pool = factories.new_instance_pool(factory)
+
+    leased = []
+    for _ in range(4):
+        with pool.lease() as instance:
+            leased.append(instance)
+
+    first, second = factory.instances
+    assert leased == [first, first, first, second]
+    assert first.stopped and first.jobs == 3
+    assert second.running
+    assert pool.stats == {"started": 2, "recycled": 1, "jobs": 4}
+
+
+def test_instance_is_recycled_above_memory_high_water_mark(factory, monkeypatch):
+    monkeypatch.setattr(settings, "SS_RENDERER_POOL_MAX_MEMORY_MB", 500)
+    pool = factories.new_instance_pool(factory)
+
+    with pool.lease() as instance:
+        pass
+    with pool.lease() as again:
+        instance.memory = 600 * MB
+
+    assert again is instance and instance.stopped
+    with pool.lease() as fresh:
+        assert fresh is not instance
+    assert pool.stats["recycled"] == 1
+
+
+def test_unhealthy_idle_instance_is_replaced(factory):
+    pool = InstancePool(factory, size=1)
+    with pool.lease() as instance:
+        pass
+
+    instance.healthy = False
+    with pool.lease() as replacement:
+        assert replacement is not instance
+
+    assert instance.stopped and replacement.running
+    assert pool.stats == {"started": 2, "recycled": 1, "jobs": 2}
+
+
+def test_instance_failing_health_check_after_failed_job_is_recycled(factory):
+    pool = InstancePool(factory, size=1)
+
+    # a failed job of a healthy instance keeps it
+    with pytest.raises(ValueError):
+        with pool.lease() as instance:
+            raise ValueError("document failed")
+    assert not instance.stopped
+
+    with pytest.raises(ValueError):
+        with pool.lease() as again:
+            again.healthy = False
+            raise ValueError("application hangs")
+    assert again is instance and instance.stopped
+    assert pool.stats["recycled"] == 1
+
+
+def test_close_stops_idle_and_returned_instances(factory):
+    pool = InstancePool(factory, size=2)
+
+    with pool.lease() as leased:
+        with pool.lease() as idle:
+            pass
+        pool.close()
+        assert idle.stopped and not leased.stopped
+    assert leased.stopped
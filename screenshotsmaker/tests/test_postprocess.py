@@ -0,0 +1,122 @@
+"""
+Screenshot post-processing: formats, sizes, palettes and variants
+
+Run from the screenshotsmaker directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import io
+
+from PIL import Image, ImageDraw
+
+from app.screenshots.postprocess import ImagePostprocessor
+from app.services.screenshot_request import ScreenshotRequest
+
+
+def sheet_png(size=(400, 200), colors: int = 4) -> bytes:
+    """ Flat image: a white background and a few filled cells with a border """
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    palette = [(68, 114, 196), (237, 125, 49), (112, 173, 71), (255, 192, 0)]
+    for index in range(colors):
+        left = 20 + index * 60
+        draw.rectangle((left, 20, left + 50, 60), fill=palette[index % len(palette)], outline="black")
+    return to_png(image)
+
+
+def gradient_png(size=(400, 200)) -> bytes:
+    """ Image with thousands of colours """
+    image = Image.new("RGB", size)
+    image.putdata([(x % 256, y % 256, (x * y) % 256) for y in range(size[1]) for x in range(size[0])])
+    return to_png(image)
+
+
+def to_png(image: Image.Image) -> bytes:
+    bio = io.BytesIO()
+    image.save(bio, format="PNG")
+    return bio.getvalue()
+
+
+def open_image(content: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(content))
+    image.load()
+    return image
+
+
+def test_flat_image_with_few_colours_keeps_exact_palette():
+    original = open_image(sheet_png())
+    variants = ImagePostprocessor(trim=False).make_variants(sheet_png(), ScreenshotRequest(), flat=True)
+
+    full = open_image(variants.full)
+    assert full.mode == "P"
+    assert sorted(full.convert("RGB").getcolors()) == sorted(original.getcolors())
+
+
+def test_flat_image_with_many_colours_is_quantised():
+    variants = ImagePostprocessor(trim=False, quantize_colors=64).make_variants(
+        gradient_png(), ScreenshotRequest(), flat=True)
+
+    full = open_image(variants.full)
+    assert full.mode == "P"
+    assert len(full.convert("RGB").getcolors(256)) <= 64
+
+
+def test_flat_image_with_many_colours_stays_true_colour_without_quantisation():
+    variants = ImagePostprocessor(trim=False, quantize_colors=0).make_variants(
+        gradient_png(), ScreenshotRequest(), flat=True)
+
+    assert open_image(variants.full).mode == "RGB"
+
+
+def test_photo_is_not_quantised():
+    variants = ImagePostprocessor().make_variants(gradient_png(), ScreenshotRequest())
+
+    assert open_image(variants.full).mode == "RGB"
+
+
+def test_requested_format_and_size():
+    request = ScreenshotRequest(width=200, format="jpeg")
+    variants = ImagePostprocessor(trim=False).make_variants(sheet_png(), request, flat=True)
+
+    full = open_image(variants.full)
+    assert full.format == "JPEG"
+    assert full.size == (200, 100)
+
+
+def test_flat_webp_is_lossless():
+    variants = ImagePostprocessor(trim=False).make_variants(sheet_png(), ScreenshotRequest(format="webp"), flat=True)
+
+    full = open_image(variants.full)
+    assert full.format == "WEBP"
+    assert full.convert("RGB").tobytes() == open_image(sheet_png()).tobytes()
+
+
+def test_flat_image_is_trimmed():
+    variants = ImagePostprocessor(trim_padding=4).make_variants(sheet_png(), ScreenshotRequest(), flat=True)
+
+    assert open_image(variants.full).size == (50 + 3 * 60 + 1 + 8, 41 + 8)
+
+
+def test_gallery_variants_are_scaled_to_width():
+    postprocessor = ImagePostprocessor(preview_width=200, thumbnail_width=100)
+    variants = postprocessor.make_variants(gradient_png(), ScreenshotRequest())
+
+    preview, thumbnail = open_image(variants.preview), open_image(variants.thumbnail)
+    assert preview.format == thumbnail.format == "WEBP"
+    assert preview.size == (200, 100)
+    assert thumbnail.size == (100, 50)
+
+
+def test_gallery_variants_are_not_upscaled():
+    postprocessor = ImagePostprocessor(preview_width=800, thumbnail_width=240)
+    variants = postprocessor.make_variants(gradient_png(), ScreenshotRequest())
+
+    assert open_image(variants.preview).size == (400, 200)
+    assert open_image(variants.thumbnail).size == (240, 120)
+
+
+def test_gallery_variants_are_skipped():
+    variants = ImagePostprocessor().make_variants(sheet_png(), ScreenshotRequest(), flat=True, gallery=False)
+
+    assert variants.full
+    assert variants.preview is None
+    assert variants.thumbnail is None
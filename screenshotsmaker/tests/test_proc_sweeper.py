@@ -0,0 +1,133 @@
+"""
+Process sweeper against sleep children and fakeredis
+
+Run from the screenshotsmaker directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import time
+import uuid
+
+import fakeredis
+import pytest
+
+from app.services import proc_sweeper
+from app.services.proc_sweeper import REGISTRY_KEY, ProcessRegistry, Sweeper
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(proc_sweeper.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def redis_conn():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def sleep_command(tmp_path):
+    """ sleep under a name of its own, so the sweeper never sees other sleep processes of the machine """
+    name = f"sweep-{uuid.uuid4().hex[:8]}"
+    shutil.copy(shutil.which("sleep"), tmp_path / name)
+    return str(tmp_path / name)
+
+
+@pytest.fixture
+def spawn(sleep_command):
+    children = []
+
+    def spawn() -> subprocess.Popen:
+        child = subprocess.Popen([sleep_command, "60"])
+        children.append(child)
+        return child
+
+    yield spawn
+    for child in children:
+        child.kill()
+        child.wait()
+
+
+def new_sweeper(redis_conn, sleep_command: str, orphan_age: float) -> Sweeper:
+    return Sweeper(ProcessRegistry(redis_conn), redis_conn, process_names=(os.path.basename(sleep_command),),
+                   orphan_age=orphan_age)
+
+
+def exited_pid() -> int:
+    worker = subprocess.Popen(["true"])
+    worker.wait()
+    return worker.pid
+
+
+def test_only_overdue_and_orphaned_processes_are_killed(clock, redis_conn, sleep_command, spawn):
+    registry = ProcessRegistry(redis_conn)
+    idle, busy, overdue, orphaned, of_exited_worker = (spawn() for _ in range(5))
+    registry.register(idle.pid)
+    registry.register(busy.pid, task_id=1, deadline=clock.now + 120)
+    registry.register(overdue.pid, task_id=2, deadline=clock.now + 10)
+    redis_conn.hset(f"{REGISTRY_KEY}:{socket.gethostname()}", f"{of_exited_worker.pid}:{exited_pid()}", "{}")
+
+    clock.now += 60
+    killed = new_sweeper(redis_conn, sleep_command, orphan_age=30).sweep()
+
+    assert sorted(killed) == sorted([overdue.pid, orphaned.pid, of_exited_worker.pid])
+    for child in (overdue, orphaned, of_exited_worker):
+        assert child.wait(timeout=5) == -9
+    for child in (idle, busy):
+        assert child.poll() is None
+    # registration of the exited worker is forgotten
+    assert sorted(r.pid for r in registry.registrations()) == sorted([idle.pid, busy.pid, overdue.pid])
+
+
+def test_registrations_of_other_hosts_are_left_alone(clock, redis_conn, sleep_command, spawn):
+    local, remote = ProcessRegistry(redis_conn), ProcessRegistry(redis_conn, host="other-render-host")
+    busy, orphaned = spawn(), spawn()
+    local.register(busy.pid, task_id=1, deadline=clock.now + 120)
+    # the worker of the other host doesn't exist here, and its application pid may collide with a local one
+    remote_worker = exited_pid()
+    redis_conn.hset(f"{REGISTRY_KEY}:other-render-host", f"{orphaned.pid}:{remote_worker}",
+                    '{"task_id": 2, "busy_since": %f, "deadline": %f}' % (clock.now, clock.now + 120))
+
+    clock.now += 60
+    killed = new_sweeper(redis_conn, sleep_command, orphan_age=30).sweep()
+
+    assert killed == [orphaned.pid]
+    assert busy.poll() is None
+    assert [(r.pid, r.worker_pid) for r in remote.registrations()] == [(orphaned.pid, remote_worker)]
+
+
+def test_kills_and_wasted_seconds_are_counted(clock, redis_conn, sleep_command, spawn):
+    registry = ProcessRegistry(redis_conn)
+    overdue, orphaned = spawn(), spawn()
+    registry.register(overdue.pid, task_id=1, deadline=clock.now + 10)
+
+    clock.now += 45
+    sweeper = new_sweeper(redis_conn, sleep_command, orphan_age=30)
+    sweeper.sweep()
+
+    assert sweeper.stats() == {"kills": 2.0, "overdue": 1.0, "orphaned": 1.0, "wasted_seconds": 45.0}
+    overdue.wait(timeout=5)
+    orphaned.wait(timeout=5)
+    assert sweeper.sweep() == []
+    assert sweeper.stats()["kills"] == 2.0
+
+
+def test_unregistered_process_lives_within_orphan_age(clock, redis_conn, sleep_command, spawn):
+    starting = spawn()
+
+    assert new_sweeper(redis_conn, sleep_command, orphan_age=30).sweep() == []
+    assert starting.poll() is None
@@ -0,0 +1,104 @@
+"""
+Worker processes supervisor: restarts with backoff and graceful shutdown
+
+Run from the screenshotsmaker directory: pip install -r requirements-test.txt && python -m pytest tests
+"""
+
+import time
+from multiprocessing.synchronize import Event
+
+import pytest
+
+from app.services import proc_sweeper, supervisor
+from app.services.supervisor import Supervisor
+
+
+# spawned workers import their targets by name from this module
+
+def exit_at_once(index: int, stop_event: Event):
+    pass
+
+
+def wait_for_stop(index: int, stop_event: Event):
+    stop_event.wait(30)
+
+
+def ignore_stop(index: int, stop_event: Event):
+    time.sleep(30)
+
+
+@pytest.fixture
+def forgotten(monkeypatch) -> list[int]:
+    pids = []
+    monkeypatch.setattr(proc_sweeper, "forget_worker", pids.append)
+    return pids
+
+
+def exit_and_check(supervisor_: Supervisor, worker) -> int:
+    """ Wait for the worker process to exit and let the supervisor notice it, :return: its PID """
+    pid = worker.process.pid
+    worker.process.join()
+    supervisor_._check(worker)
+    return pid
+
+
+def test_crashed_worker_is_restarted_with_growing_delay(monkeypatch, forgotten):
+    now = [1000.0]
+    # time.monotonic is patched while no join has a timeout, they wait on the process
+    monkeypatch.setattr(supervisor.time, "monotonic", lambda: now[0])
+    supervisor_ = Supervisor(exit_at_once, 1, restart_delay=5, max_restart_delay=12)
+    worker = supervisor_._workers[0]
+
+    supervisor_._check(worker)
+    pids = []
+    for delay in (5, 10, 12, 12):
+        pids.append(exit_and_check(supervisor_, worker))
+        assert worker.process is None
+        assert worker.restart_delay == delay
+
+        now[0] += delay - 1
+        supervisor_._check(worker)
+        assert worker.process is None
+        now[0] += 1
+        supervisor_._check(worker)
+        assert worker.process is not None
+
+    # a worker which ran long enough is restarted with the initial delay
+    now[0] += 60
+    pids.append(exit_and_check(supervisor_, worker))
+    assert worker.restart_delay == 5
+    assert forgotten == pids
+    assert len(set(pids)) == 5
+
+
+def test_workers_finish_on_stop(forgotten):
+    supervisor_ = Supervisor(wait_for_stop, 2, shutdown_timeout=30)
+    for worker in supervisor_._workers:
+        supervisor_._start(worker)
+    pids = [worker.process.pid for worker in supervisor_._workers]
+    processes = [worker.process for worker in supervisor_._workers]
+
+    started = time.monotonic()
+    supervisor_._stop_event.set()
+    supervisor_._shutdown()
+
+    assert time.monotonic() - started < 30
+    assert forgotten == pids
+    # closed once they exited
+    for process in processes:
+        with pytest.raises(ValueError):
+            process.is_alive()
+
+
+def test_workers_which_dont_stop_are_terminated(forgotten):
+    supervisor_ = Supervisor(ignore_stop, 1, shutdown_timeout=0.5)
+    worker = supervisor_._workers[0]
+    supervisor_._start(worker)
+    pid = worker.process.pid
+
+    started = time.monotonic()
+    supervisor_._stop_event.set()
+    supervisor_._shutdown()
+
+    assert time.monotonic() - started < 10
+    assert forgotten == [pid]